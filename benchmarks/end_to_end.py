@@ -0,0 +1,157 @@
+"""End-to-end latency benchmarks for the chatbot and memory graphs, fully offline.
+
+Synthetic users are seeded with N memories (spread over the memory types) and N
+FAISS notes, then the compiled graphs are driven with fake chat models, hashing
+embeddings and an `InMemoryStore`. Reported per user size:
+
+- chat turn latency (p50/p95/p99) through `chatbot.graph.graph`
+- extraction throughput and latency through `memory_graph.graph.graph`
+- FAISS insert cost per note and search latency
+
+    python benchmarks/end_to_end.py --sizes 10,1000,100000 --turns 50
+"""
+
+import argparse
+import asyncio
+import time
+import warnings
+from typing import Callable, Dict, List
+
+from fakes import install_fakes
+
+MEMORY_TYPES = ["User", "Note", "Action", "Procedural"]
+TOPICS = ["cat", "garden", "marathon", "piano", "chemistry", "travel", "cooking", "chess"]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Return p50/p95/p99 of `samples` (seconds) in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def memory_text(i: int) -> str:
+    """Return the text of synthetic memory number `i`."""
+    return f"Fact {i}: the user talked about {TOPICS[i % len(TOPICS)]} on day {i % 365}"
+
+
+def seed_store(store, user_id: str, size: int, batch: int = 1000) -> None:
+    """Put `size` memories for `user_id` into `store`, spread over the memory types."""
+    from langgraph.store.base import PutOp
+
+    for start in range(0, size, batch):
+        store.batch([
+            PutOp(("memories", user_id, MEMORY_TYPES[i % len(MEMORY_TYPES)]), f"m{i}", {"kind": "Memory", "content": {"content": memory_text(i)}})
+            for i in range(start, min(start + batch, size))
+        ])
+
+
+def seed_faiss(user_id: str, size: int, batch: int = 1000) -> float:
+    """Insert `size` FAISS notes for `user_id`; return the mean insert cost per note in seconds."""
+    from memory_graph.faiss_store import store_note_embeddings
+
+    start = time.perf_counter()
+    for offset in range(0, size, batch):
+        store_note_embeddings(user_id, "Note", [
+            {"content": memory_text(i), "context": "seeded"} for i in range(offset, min(offset + batch, size))
+        ])
+    return (time.perf_counter() - start) / max(size, 1)
+
+
+async def time_calls(call: Callable, count: int) -> List[float]:
+    """Await `call(i)` `count` times; return each call's latency in seconds."""
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        await call(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def bench_size(
+    size: int, turns: int, extractions: int, extraction_mode: str, context_cache: bool
+) -> Dict[str, float]:
+    """Benchmark one synthetic user holding `size` memories; return the row of results."""
+    from langgraph.store.memory import InMemoryStore
+
+    from chatbot.graph import builder
+    from memory_graph.embeddings import HashingEmbeddings
+    from memory_graph.faiss_store import get_embeddings_model, search_faiss_with_scores
+    from memory_graph.graph import graph as memory_graph
+
+    dims = len(get_embeddings_model().embed_query("probe"))
+    store = InMemoryStore(index={"dims": dims, "embed": HashingEmbeddings(dimensions=dims)})
+    user_id = f"user{size}"
+    seed_store(store, user_id, size)
+    insert_cost = seed_faiss(user_id, size)
+
+    chatbot = builder.compile(store=store)
+    memory = memory_graph.copy(update={"store": store})
+
+    async def chat_turn(i: int) -> None:
+        await chatbot.ainvoke(
+            {"messages": [("user", f"What do you remember about my {TOPICS[i % len(TOPICS)]}?")], "user_id": user_id},
+            {"configurable": {"user_id": user_id, "thread_id": f"t{size}", "enable_memory_context_cache": context_cache}},
+        )
+
+    async def extraction(i: int) -> None:
+        await memory.ainvoke(
+            {"messages": [("user", f"I started learning {TOPICS[i % len(TOPICS)]} this week"), ("ai", "That's great!")]},
+            {"configurable": {"user_id": user_id, "extraction_mode": extraction_mode}},
+        )
+
+    async def search(i: int) -> None:
+        search_faiss_with_scores(user_id, "Note", f"tell me about {TOPICS[i % len(TOPICS)]}", 5)
+
+    turn_samples = await time_calls(chat_turn, turns)
+    start = time.perf_counter()
+    extraction_samples = await time_calls(extraction, extractions)
+    extraction_elapsed = time.perf_counter() - start
+    search_samples = await time_calls(search, turns)
+
+    return {
+        **{f"turn_{k}": v for k, v in percentiles(turn_samples).items()},
+        "extract_p50": percentiles(extraction_samples)["p50"],
+        "extract_per_s": extractions / extraction_elapsed,
+        "faiss_insert_us": insert_cost * 1e6,
+        **{f"search_{k}": v for k, v in percentiles(search_samples).items()},
+    }
+
+
+COLUMNS = [
+    ("memories", 9, "d"), ("turn_p50", 9, ".1f"), ("turn_p95", 9, ".1f"), ("turn_p99", 9, ".1f"),
+    ("extract_p50", 11, ".1f"), ("extract_per_s", 13, ".1f"), ("faiss_insert_us", 15, ".1f"),
+    ("search_p50", 10, ".2f"), ("search_p95", 10, ".2f"), ("search_p99", 10, ".2f"),
+]
+
+
+async def run(sizes: List[int], turns: int, extractions: int, extraction_mode: str, context_cache: bool) -> None:
+    """Print one row of results per memory count in `sizes`."""
+    print(f"extraction_mode={extraction_mode} context_cache={context_cache}; latencies in ms, faiss_insert_us per note")
+    print(" ".join(f"{name:>{width}}" for name, width, _ in COLUMNS))
+    for size in sizes:
+        row = {"memories": size, **await bench_size(size, turns, extractions, extraction_mode, context_cache)}
+        print(" ".join(f"{row[name]:>{width}{spec}}" for name, width, spec in COLUMNS))
+
+
+def main() -> None:
+    """Parse the command line and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="comma-separated memories per synthetic user")
+    parser.add_argument("--turns", type=int, default=50, help="chat turns and FAISS searches per size")
+    parser.add_argument("--extractions", type=int, default=20, help="memory extraction runs per size")
+    parser.add_argument("--extraction-mode", choices=["per_type", "combined"], default="per_type")
+    parser.add_argument("--context-cache", action="store_true", help="list store memories once and reuse the listing between turns")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    install_fakes()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    asyncio.run(run(sizes, args.turns, args.extractions, args.extraction_mode, args.context_cache))
+
+
+if __name__ == "__main__":
+    main()
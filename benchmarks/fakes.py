@@ -0,0 +1,85 @@
+"""Deterministic stand-ins for the chat models so benchmarks run offline.
+
+Embeddings use the built-in `hashing` backend and storage uses `InMemoryStore`;
+only the LLMs need faking. `install_fakes` must run before the graph modules are
+imported so the embedding backend and on-disk paths are picked up from the
+environment.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+from typing import Iterator
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+class FakeToolChatModel(GenericFakeChatModel):
+    """Fake chat model that answers every call with one memory-extraction tool call.
+
+    Per-type managers bind a single `Memory` tool; combined managers bind one tool per
+    memory type, in which case the calls are routed to the `Note` tool.
+    """
+
+    def bind_tools(self, tools, **kwargs):
+        """Route the canned tool calls to the tool that was bound."""
+        names = {getattr(tool, "__name__", getattr(tool, "name", None)) for tool in tools}
+        if "Memory" in names or "Note" not in names:
+            return self
+        return self.model_copy(update={"messages": (_renamed(message, "Note") for message in self.messages)})
+
+
+def _renamed(message: AIMessage, name: str) -> AIMessage:
+    return message.model_copy(update={"tool_calls": [{**call, "name": name} for call in message.tool_calls]})
+
+
+def memory_tool_calls() -> Iterator[AIMessage]:
+    """Yield an endless, deterministic stream of `Memory` tool calls."""
+    for i in itertools.count():
+        yield AIMessage(
+            content="",
+            tool_calls=[{"name": "Memory", "args": {"content": f"User mentioned fact number {i}"}, "id": f"call_{i}"}],
+        )
+
+
+def chat_replies() -> Iterator[AIMessage]:
+    """Yield an endless, deterministic stream of chatbot replies."""
+    for i in itertools.count():
+        yield AIMessage(content=f"Reply {i}: noted, thanks for telling me.")
+
+
+def install_fakes(dimensions: int = 256) -> str:
+    """Point the embedding backend and on-disk state at a scratch directory; return it."""
+    workdir = tempfile.mkdtemp(prefix="memory-bench-")
+    os.environ["EMBEDDING_PROVIDER"] = "hashing"
+    os.environ["EMBEDDING_DIMENSIONS"] = str(dimensions)
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite")
+    os.environ["MEMORY_SCHEDULER_PATH"] = os.path.join(workdir, "scheduler.sqlite")
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+
+    from memory_graph import faiss_store
+
+    faiss_store.FAISS_DIR = os.path.join(workdir, "vector_store")
+
+    # Every langmem store manager gets the fake tool-calling model instead of a provider client
+    import langmem
+
+    create = langmem.create_memory_store_manager
+
+    def create_with_fake_model(model, /, **kwargs):
+        return create(FakeToolChatModel(messages=memory_tool_calls()), **kwargs)
+
+    langmem.create_memory_store_manager = create_with_fake_model
+
+    from chatbot import graph as chatbot_graph
+    from chatbot.scheduler import DebouncedScheduler, InMemorySchedulerBackend
+
+    chatbot_graph._llm = GenericFakeChatModel(messages=chat_replies())
+    # Scheduled extractions would be sent to a LangGraph server; keep them local and inert
+    chatbot_graph.memory_scheduler = DebouncedScheduler(InMemorySchedulerBackend())
+    return workdir
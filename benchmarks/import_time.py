@@ -0,0 +1,59 @@
+"""Measure cold import time of the graph modules.
+
+Each module is imported in a fresh interpreter so nothing is shared between
+samples; the median and the slowest sample are reported per module.
+
+    python benchmarks/import_time.py --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "memory_graph.configuration",
+    "memory_graph.faiss_store",
+    "memory_graph.graph",
+    "chatbot.graph",
+]
+
+_SNIPPET = """
+import time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def time_import(module: str) -> float:
+    """Return the seconds it takes a fresh interpreter to import `module`."""
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run(
+        [sys.executable, "-c", _SNIPPET.format(module=module)],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    """Parse the command line and time each module import."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<32} {'median ms':>10} {'max ms':>10}")
+    for module in args.modules:
+        samples = [time_import(module) for _ in range(args.repeat)]
+        print(f"{module:<32} {statistics.median(samples) * 1000:>10.1f} {max(samples) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Recall vs. latency and memory of the FAISS index types and compressions used for notes.
+
+Builds each index type with `memory_graph.faiss_store.build_index` over clustered
+synthetic vectors (embeddings of related notes cluster the same way), once per
+vector compression, then sweeps its search-time knob. Recall@k is measured against
+exact flat search, both as returned by the index and after re-ranking the
+`--rerank` * k nearest candidates by exact distance, as compressed note indexes
+do. `saved` is the vector memory saved against float32 storage, counting vector
+codes only (not graph links or list ids). Latency is per single-query search,
+matching how notes are retrieved, and excludes re-ranking.
+
+    python benchmarks/index_recall.py --sizes 10000,100000 --dim 768 --compressions none,fp16,sq8,pq
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+SWEEPS = {
+    "flat": ("-", [None]),
+    "hnsw": ("efSearch", [16, 32, 64, 128, 256]),
+    "ivfpq": ("nprobe", [1, 4, 16, 64]),
+}
+
+
+def clustered_vectors(count: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Return `count` float32 vectors of dimension `dim` drawn around `clusters` random centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(0, clusters, count)] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+    return points.astype(np.float32)
+
+
+def set_knob(index, kind: str, value) -> None:
+    """Set the search-time accuracy knob of a `kind` index: efSearch for HNSW, nprobe for IVF-PQ."""
+    if kind == "hnsw":
+        index.hnsw.efSearch = value
+    elif kind == "ivfpq":
+        index.nprobe = min(value, index.nlist)
+
+
+def reranked(vectors: np.ndarray, queries: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    """Keep the `k` candidates per query nearest by exact distance."""
+    results = []
+    for query, ids in zip(queries, candidates):
+        ids = ids[ids >= 0]
+        distances = ((vectors[ids] - query) ** 2).sum(axis=1)
+        results.append(ids[np.argsort(distances, kind="stable")[:k]])
+    return results
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """Search `queries` one at a time; return the top-`k` ids and the sorted per-query latencies."""
+    latencies: List[float] = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return np.array(results), np.sort(latencies)
+
+
+def main() -> None:
+    """Parse the command line and print recall and latency for each index layout."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,50000", help="comma-separated vectors per index")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", default="flat,hnsw,ivfpq")
+    parser.add_argument("--compressions", default="none,fp16,sq8,pq", help="ignored by ivfpq, which is always PQ")
+    parser.add_argument("--rerank", type=int, default=4, help="candidates re-ranked per result")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    import faiss
+
+    from memory_graph.faiss_store import build_index
+
+    def recall(found, truth) -> float:
+        return float(np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)]))
+
+    print(f"{'vectors':>8} {'index':<6} {'compress':<8} {'knob':>14} {'build s':>8} {'bytes/vec':>10} {'saved':>6} "
+          f"{'recall@' + str(args.k):>10} {'reranked':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        vectors = clustered_vectors(size, args.dim, clusters=max(size // 100, 1))
+        queries = vectors[np.random.default_rng(1).choice(size, args.queries, replace=False)]
+        queries = queries + 0.05 * np.random.default_rng(2).standard_normal(queries.shape).astype(np.float32)
+        truth = timed_search(build_index("flat", vectors), queries, args.k)[0]
+        for kind in args.kinds.split(","):
+            for compression in (["pq"] if kind == "ivfpq" else args.compressions.split(",")):
+                start = time.perf_counter()
+                index = build_index(kind, vectors, compression)
+                build_seconds = time.perf_counter() - start
+                bytes_per_vector = faiss.serialize_index(index).nbytes / size
+                codes = faiss.downcast_index(index.storage) if kind == "hnsw" else index
+                saved = 1 - codes.sa_code_size() / (args.dim * 4)
+                knob_name, values = SWEEPS[kind]
+                for value in values:
+                    set_knob(index, kind, value)
+                    ids, latencies = timed_search(index, queries, args.k)
+                    _, candidates = index.search(queries, args.k * args.rerank)
+                    knob = "-" if value is None else f"{knob_name}={value}"
+                    print(f"{size:>8} {kind:<6} {compression:<8} {knob:>14} {build_seconds:>8.2f} "
+                          f"{bytes_per_vector:>10.0f} {saved:>6.0%} {recall(ids, truth):>10.3f} "
+                          f"{recall(reranked(vectors, queries, candidates, args.k), truth):>9.3f} "
+                          f"{latencies[len(latencies) // 2] * 1000:>8.3f} "
+                          f"{latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000:>8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """Define the configurable parameters for the chatbot."""
 
+import logging
 import os
 from dataclasses import dataclass, fields
 from typing import Any, Optional
@@ -7,6 +8,8 @@ from langgraph.config import get_config
 from langchain_core.runnables import RunnableConfig
 from chatbot.prompts import SYSTEM_PROMPT
 
+logger = logging.getLogger("memory.chatbot")
+
 @dataclass(kw_only=True)
 class ChatConfigurable:
     """The configurable fields for the chatbot."""
@@ -28,6 +31,10 @@ class ChatConfigurable:
     enable_memory_debouncing: bool = True  # Enable/disable debouncing
     force_memory_on_context_switch: bool = True  # Force memory save when user switches topics
     memory_batch_size: int = 10  # Number of messages to batch for memory extraction
+    memory_overlap_messages: int = 2  # Already-extracted messages resent as context with each batch
+    memory_retrieval_timeout_seconds: float = 5.0  # Per-namespace timeout when retrieving memories
+    enable_memory_context_cache: bool = True  # Reuse the listing of the user's store memories until they change
+    memory_token_budget: int = 2000  # Max estimated tokens of memory context in the system prompt (0 = unlimited)
 
     @classmethod
     def from_context(cls, config: Optional[RunnableConfig] = None) -> "ChatConfigurable":
@@ -46,7 +53,13 @@ class ChatConfigurable:
                         try:
                             value = int(value)
                         except ValueError:
-                            print(f"WARNING: Could not convert {f.name} value '{value}' to int, using default")
+                            logger.warning("Could not convert %s value '%s' to int, using default", f.name, value)
+                            continue
+                    elif f.type in [float, Optional[float]] and isinstance(value, str):
+                        try:
+                            value = float(value)
+                        except ValueError:
+                            logger.warning("Could not convert %s value '%s' to float, using default", f.name, value)
                             continue
                     elif f.type in [bool, Optional[bool]] and isinstance(value, str):
                         value = value.lower() in ['true', '1', 'yes', 'on']
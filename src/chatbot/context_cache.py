@@ -0,0 +1,57 @@
+"""Cache of the listing of each user's store memories."""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Tuple
+
+from chatbot.context_packing import MemoryCandidate
+
+
+class MemoryContextCache:
+    """LRU cache of the full listing of each user's store memories, tagged with a memory version.
+
+    An entry is only served while the user's memory version is unchanged, so a write
+    by the memory graph (which bumps the version) invalidates it on the next turn.
+    The listing does not depend on any query: every turn still ranks the memories
+    against its own query and packs them into its own token budget.
+    """
+
+    def __init__(self, max_users: int = 10000):
+        """Keep the memories of at most `max_users` users."""
+        self.max_users = max_users
+        self._entries: OrderedDict[str, Tuple[Hashable, List[MemoryCandidate]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, version: Hashable) -> List[MemoryCandidate] | None:
+        """Return the cached memories of `user_id` if they match `version`."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: str, version: Hashable, memories: List[MemoryCandidate]) -> None:
+        """Cache `memories` for `user_id` at `version`."""
+        with self._lock:
+            self._entries[user_id] = (version, list(memories))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop the cached memories of `user_id`."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+memory_context_cache = MemoryContextCache()
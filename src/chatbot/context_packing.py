@@ -0,0 +1,162 @@
+"""Rank retrieved memories and pack them into a token budget for the system prompt."""
+
+import dataclasses
+import datetime
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+FAISS_NOTES = "Recent Notes"
+"""Pseudo memory type for notes retrieved from the FAISS index."""
+
+TYPE_PRIORITY: Dict[str, float] = {
+    "User": 1.0,
+    "Procedural": 0.8,
+    "Action": 0.7,
+    FAISS_NOTES: 0.6,
+    "Note": 0.5,
+    "Episode": 0.4,
+}
+"""Relative importance of each memory type when the budget cannot fit everything."""
+
+SIMILARITY_WEIGHT = 0.5
+RECENCY_WEIGHT = 0.2
+TYPE_WEIGHT = 0.3
+RECENCY_HALF_LIFE_DAYS = 30.0
+
+
+@dataclass
+class MemoryCandidate:
+    """A single retrieved memory competing for space in the prompt."""
+
+    memory_type: str
+    content: str
+    similarity: float | None = None
+    """Similarity to the current query in [0, 1], if the memory came from a search."""
+    updated_at: datetime.datetime | None = None
+
+    def line(self) -> str:
+        """Render the memory as it appears in the prompt."""
+        return f"- {self.content}"
+
+
+@dataclass
+class PackingStats:
+    """Token accounting for one packed memory context."""
+
+    candidates: int
+    selected: int
+    candidate_tokens: int
+    selected_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        """Tokens of candidate memories left out of the prompt."""
+        return self.candidate_tokens - self.selected_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheaply estimate the token count of `text` (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def score_memory(candidate: MemoryCandidate, now: datetime.datetime | None = None) -> float:
+    """Blend query similarity, recency and memory type priority into a single rank score."""
+    similarity = candidate.similarity if candidate.similarity is not None else 0.5
+    recency = 0.5
+    if candidate.updated_at is not None:
+        now = now or datetime.datetime.now(datetime.UTC)
+        updated_at = candidate.updated_at
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=datetime.UTC)
+        age_days = max((now - updated_at).total_seconds(), 0.0) / 86400
+        recency = math.pow(0.5, age_days / RECENCY_HALF_LIFE_DAYS)
+    priority = TYPE_PRIORITY.get(candidate.memory_type, 0.5)
+    return SIMILARITY_WEIGHT * similarity + RECENCY_WEIGHT * recency + TYPE_WEIGHT * priority
+
+
+def rescore_memories(candidates: List[MemoryCandidate], query: str, embeddings: Embeddings) -> List[MemoryCandidate]:
+    """Return copies of `candidates` with their similarity recomputed against `query`.
+
+    Lets memories retrieved for an earlier query be ranked for a new one. With a
+    content-caching `embeddings` model, only the query is usually embedded.
+    """
+    if not candidates:
+        return []
+    if not query.strip():
+        return [dataclasses.replace(c, similarity=None) for c in candidates]
+    vectors = np.asarray(embeddings.embed_documents([c.content for c in candidates]), dtype=np.float32)
+    query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    similarities = vectors @ query_vector / np.where(norms == 0, 1, norms)
+    return [
+        dataclasses.replace(c, similarity=float(min(max(similarity, 0.0), 1.0)))
+        for c, similarity in zip(candidates, similarities)
+    ]
+
+
+def pack_memories(
+    candidates: List[MemoryCandidate], token_budget: int
+) -> Tuple[List[MemoryCandidate], PackingStats]:
+    """Greedily select the highest-scoring memories that fit in `token_budget` tokens.
+
+    Duplicate contents are dropped first. A budget of 0 or less keeps everything.
+    """
+    unique: Dict[str, MemoryCandidate] = {}
+    for candidate in candidates:
+        unique.setdefault(candidate.content, candidate)
+
+    now = datetime.datetime.now(datetime.UTC)
+    ranked = sorted(unique.values(), key=lambda c: score_memory(c, now), reverse=True)
+    candidate_tokens = sum(estimate_tokens(c.line()) for c in candidates)
+
+    selected: List[MemoryCandidate] = []
+    used = 0
+    for candidate in ranked:
+        cost = estimate_tokens(candidate.line())
+        if token_budget > 0 and used + cost > token_budget:
+            continue
+        selected.append(candidate)
+        used += cost
+
+    stats = PackingStats(
+        candidates=len(candidates),
+        selected=len(selected),
+        candidate_tokens=candidate_tokens,
+        selected_tokens=used,
+    )
+    _record(stats)
+    return selected, stats
+
+
+def render_memories(selected: List[MemoryCandidate], type_order: List[str]) -> List[str]:
+    """Group selected memories by type, in `type_order`, as markdown prompt lines."""
+    parts: List[str] = []
+    for memory_type in type_order:
+        memories = [c for c in selected if c.memory_type == memory_type]
+        if not memories:
+            continue
+        if memory_type == FAISS_NOTES:
+            parts.append("**Recent Notes from Past Conversations:**")
+        else:
+            parts.append(f"**{memory_type} Information:**")
+        parts.extend(c.line() for c in memories)
+        parts.append("")  # Add spacing
+    return parts
+
+
+packing_metrics: Dict[str, int] = {"turns": 0, "candidate_tokens": 0, "selected_tokens": 0, "tokens_saved": 0}
+"""Process-wide totals of memory context tokens considered, used and saved."""
+_packing_metrics_lock = threading.Lock()
+
+
+def _record(stats: PackingStats) -> None:
+    with _packing_metrics_lock:
+        packing_metrics["turns"] += 1
+        packing_metrics["candidate_tokens"] += stats.candidate_tokens
+        packing_metrics["selected_tokens"] += stats.selected_tokens
+        packing_metrics["tokens_saved"] += stats.tokens_saved
@@ -1,9 +1,10 @@
 import datetime
 import asyncio
+import logging
+import threading
 from dataclasses import dataclass
 from typing import Dict, List, Any, Optional
 
-from langchain.chat_models import init_chat_model
 from langchain_core.runnables import RunnableConfig
 from langgraph.config import get_store
 from langgraph.graph import StateGraph
@@ -12,11 +13,20 @@ from langgraph_sdk import get_client
 from typing_extensions import Annotated
 
 from chatbot.configuration import ChatConfigurable
+from chatbot.context_cache import memory_context_cache
+from chatbot.context_packing import FAISS_NOTES, MemoryCandidate, pack_memories, render_memories, rescore_memories
+from chatbot.identity import user_id_resolver
+from chatbot.scheduler import MEMORY_SCHEDULER_AUTOSTART, DebouncedScheduler, ExtractionJob, SQLiteSchedulerBackend
 from chatbot.utils import format_memories
-from memory_graph.faiss_store import search_faiss
+from memory_graph.faiss_store import get_embeddings_model, search_faiss_with_scores
+from memory_graph.instrumentation import configure_logging, increment, stage
+from memory_graph.versioning import aget_memory_version
 from langchain_core.documents import Document
+from langchain_core.messages import messages_from_dict, messages_to_dict
 from langchain_core.runnables import RunnableConfig
 
+logger = logging.getLogger("memory.chatbot")
+
 @dataclass
 class ChatState:
     """The state of the chatbot."""
@@ -25,12 +35,22 @@ class ChatState:
     last_activity_time: Optional[float] = None  # Track last activity timestamp
     pending_memory_extraction: bool = False  # Flag to track if memory extraction is needed
 
-# Global dictionary to track user activity and pending memory tasks
+# Global dictionary to track user activity
 user_activity_tracker = {}
-pending_memory_tasks = {}
 
-# Initialize the language model
-llm = init_chat_model()
+# The language model is initialized on first use to keep worker startup cheap
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """Return the shared chat model, initializing it on first use."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                from langchain.chat_models import init_chat_model
+                _llm = init_chat_model()
+    return _llm
 
 def deep_extract_content(data: Any) -> str:
     """Recursively extract content from nested data structures."""
@@ -79,56 +99,113 @@ def format_memory_item(item) -> tuple[str, str]:
        
         return memory_type, content.strip()
     except Exception as e:
-        print(f"DEBUG: Error formatting memory item: {e}")
+        logger.debug("Error formatting memory item: %s", e)
         return "Memory", str(item)
 
-async def get_all_user_memories(user_id: str, query: str = "") -> Dict[str, List[str]]:
+MEMORY_TYPES = ["User", "Note", "Action", "Procedural", "Episode"]
+MEMORY_LIST_PAGE_SIZE = 100
+
+async def get_memories_for_type(
+    store, user_id: str, memory_type: str, query: str = "", list_all: bool = False
+) -> List[MemoryCandidate]:
+    """Retrieve the memories stored under a single memory type namespace.
+
+    Each memory carries its search score and last update time so it can be ranked
+    against the others when packing the prompt. With `list_all`, every memory in the
+    namespace is returned regardless of `query`, and listing errors are raised.
+    """
+    namespace = ("memories", user_id, memory_type)
+    logger.debug("Searching namespace: %s", namespace)
+
+    # Try both query search and list all
+    items = []
+    if list_all:
+        while True:
+            page = await store.asearch(namespace, limit=MEMORY_LIST_PAGE_SIZE, offset=len(items))
+            items.extend(page)
+            if len(page) < MEMORY_LIST_PAGE_SIZE:
+                break
+        logger.debug("Listed %s items for %s", len(items), memory_type)
+    elif query.strip():
+        try:
+            items = await store.asearch(namespace, query=query, limit=20)
+            logger.debug("Query search returned %s items for %s", len(items) if items else 0, memory_type)
+        except Exception as e:
+            logger.debug("Query search failed for %s: %s", memory_type, e)
+
+    # If query search didn't return results, try listing all
+    if not items and not list_all:
+        try:
+            items = await store.asearch(namespace, limit=50)
+            logger.debug("List all returned %s items for %s", len(items) if items else 0, memory_type)
+        except Exception as e:
+            logger.debug("List all failed for %s: %s", memory_type, e)
+
+    # Process the items
+    type_memories = []
+    for item in items or []:
+        _, content = format_memory_item(item)
+        if content and content != "None":
+            score = getattr(item, "score", None)
+            type_memories.append(
+                MemoryCandidate(
+                    memory_type=memory_type,
+                    content=content,
+                    similarity=min(max(score, 0.0), 1.0) if score is not None else None,
+                    updated_at=getattr(item, "updated_at", None),
+                )
+            )
+            logger.debug("Extracted %s memory: %s...", memory_type, content[:100])
+    return type_memories
+
+async def get_all_user_memories(
+    user_id: str,
+    query: str = "",
+    timeout: float | None = None,
+    errors: List[str] | None = None,
+) -> Dict[str, List[str]]:
     """Retrieve all memories for a user, organized by type."""
+    candidates = await get_user_memory_candidates(user_id, query, timeout=timeout, errors=errors)
+    return {
+        memory_type: [candidate.content for candidate in memories]
+        for memory_type, memories in candidates.items()
+    }
+
+async def get_user_memory_candidates(
+    user_id: str,
+    query: str = "",
+    timeout: float | None = None,
+    errors: List[str] | None = None,
+    list_all: bool = False,
+) -> Dict[str, List[MemoryCandidate]]:
+    """Retrieve all memories for a user as ranking candidates, organized by type.
+
+    All namespaces are queried concurrently, so retrieval takes as long as the
+    slowest namespace. A namespace that fails or exceeds `timeout` seconds is
+    left out (and appended to `errors`, if given) and the remaining results are returned.
+    """
     store = get_store()
-    base_namespace = ("memories", user_id)
-   
+
+    results = await asyncio.gather(
+        *(
+            asyncio.wait_for(get_memories_for_type(store, user_id, memory_type, query, list_all), timeout)
+            for memory_type in MEMORY_TYPES
+        ),
+        return_exceptions=True,
+    )
+
     memories_by_type = {}
-    memory_types = ["User", "Note", "Action", "Procedural", "Episode"]
-   
-    for memory_type in memory_types:
-        try:
-            namespace = base_namespace + (memory_type,)
-            print(f"DEBUG: Searching namespace: {namespace}")
-           
-            # Try both query search and list all
-            items = []
-            if query.strip():
-                try:
-                    items = await store.asearch(namespace, query=query, limit=20)
-                    print(f"DEBUG: Query search returned {len(items) if items else 0} items for {memory_type}")
-                except Exception as e:
-                    print(f"DEBUG: Query search failed for {memory_type}: {e}")
-           
-            # If query search didn't return results, try listing all
-            if not items:
-                try:
-                    items = await store.list(namespace, limit=50)
-                    print(f"DEBUG: List all returned {len(items) if items else 0} items for {memory_type}")
-                except Exception as e:
-                    print(f"DEBUG: List all failed for {memory_type}: {e}")
-           
-            # Process and store the items
-            if items:
-                type_memories = []
-                for item in items:
-                    _, content = format_memory_item(item)
-                    if content and content != "None":
-                        type_memories.append(content)
-                        print(f"DEBUG: Extracted {memory_type} memory: {content[:100]}...")
-               
-                if type_memories:
-                    memories_by_type[memory_type] = type_memories
-           
-        except Exception as e:
-            print(f"DEBUG: Error processing {memory_type} memories: {e}")
-            import traceback
-            traceback.print_exc()
-   
+    for memory_type, result in zip(MEMORY_TYPES, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.debug("Retrieval for %s memories timed out after %ss", memory_type, timeout)
+            else:
+                logger.debug("Error processing %s memories: %s", memory_type, result)
+            if errors is not None:
+                errors.append(memory_type)
+        elif result:
+            memories_by_type[memory_type] = result
+
     return memories_by_type
 
 def determine_user_id(state: ChatState, config: RunnableConfig) -> str:
@@ -140,53 +217,23 @@ def determine_user_id(state: ChatState, config: RunnableConfig) -> str:
     # 4. Default fallback
    
     if state.user_id:
-        print(f"DEBUG: Using user_id from state: {state.user_id}")
+        logger.debug("Using user_id from state: %s", state.user_id)
         return state.user_id
    
     configurable = ChatConfigurable.from_context(config)
     if configurable.user_id != "default-user":
-        print(f"DEBUG: Using user_id from config: {configurable.user_id}")
+        logger.debug("Using user_id from config: %s", configurable.user_id)
         return configurable.user_id
    
-    # Try to extract user ID from any message in the conversation
-    if state.messages:
-        for message in state.messages:
-            content = str(message.content) if hasattr(message, 'content') else str(message)
-           
-            # Look for explicit user ID patterns first
-            import re
-            user_id_patterns = [
-                r"user[_\s]*id[:\s]*([A-Za-z0-9_]+)",
-                r"id[:\s]*([A-Za-z0-9_]+)",
-                r"User_(\d+)",  # Specific pattern for User_XXXX format
-                r"user_(\d+)",  # Alternative user_XXXX format
-            ]
-           
-            for pattern in user_id_patterns:
-                match = re.search(pattern, content, re.IGNORECASE)
-                if match:
-                    potential_user_id = match.group(1) if len(match.groups()) == 1 else match.group(0)
-                    print(f"DEBUG: Extracted user ID from message: {potential_user_id}")
-                    return potential_user_id
-           
-            # Fallback to name patterns if no explicit ID found
-            name_patterns = [
-                r"my name is (\w+)",
-                r"i'?m (\w+)",
-                r"this is (\w+)",
-                r"call me (\w+)",
-                r"it'?s (\w+)",  # Added pattern for "it's Mona"
-                r"hello,?\s+(\w+)",  # Added pattern for "Hello Mona"
-            ]
-           
-            for pattern in name_patterns:
-                match = re.search(pattern, content.lower())
-                if match:
-                    potential_user_id = match.group(1)
-                    print(f"DEBUG: Extracted potential user ID from name: {potential_user_id}")
-                    return potential_user_id
+    # Try to extract user ID from the conversation; memoized per thread, so
+    # only messages added since the last call are scanned
+    thread_id = (config or {}).get("configurable", {}).get("thread_id")
+    potential_user_id = user_id_resolver.resolve(thread_id, state.messages or [])
+    if potential_user_id:
+        logger.debug("Extracted user ID from messages: %s", potential_user_id)
+        return potential_user_id
    
-    print("DEBUG: Using default user ID")
+    logger.debug("Using default user ID")
     return "default-user"
 
 def update_user_activity(user_id: str) -> None:
@@ -194,79 +241,76 @@ def update_user_activity(user_id: str) -> None:
     import time
     current_time = time.time()
     user_activity_tracker[user_id] = current_time
-    print(f"DEBUG: Updated activity for user {user_id} at {current_time}")
+    logger.debug("Updated activity for user %s at %s", user_id, current_time)
 
-def should_extract_memories(user_id: str, inactivity_threshold: int = 30) -> bool:
-    """Check if enough time has passed since last activity to extract memories."""
-    import time
-    current_time = time.time()
-    last_activity = user_activity_tracker.get(user_id, 0)
-    
-    time_since_activity = current_time - last_activity
-    should_extract = time_since_activity >= inactivity_threshold
-    
-    print(f"DEBUG: User {user_id} - Time since activity: {time_since_activity:.1f}s, Threshold: {inactivity_threshold}s, Should extract: {should_extract}")
-    return should_extract
+def extraction_windows(messages: list, context_count: int, batch_size: int, overlap: int) -> list[list]:
+    """Split the unextracted tail of `messages` into batches for the memory assistant.
+
+    The first `context_count` messages were already extracted and are only included
+    as context. Each batch holds up to `batch_size` new messages (all of them if
+    `batch_size` is 0 or less), preceded by up to `overlap` earlier messages.
+    """
+    new_count = len(messages) - context_count
+    if new_count <= 0:
+        return []
+    step = batch_size if batch_size > 0 else new_count
+    return [
+        messages[max(start - overlap, 0):start + step]
+        for start in range(context_count, len(messages), step)
+    ]
+
+async def run_memory_extraction(job: ExtractionJob) -> None:
+    """Send the unextracted part of a due job's conversation to the memory assistant."""
+    payload = job.payload
+    windows = extraction_windows(
+        messages_from_dict(payload["messages"]),
+        payload["context_count"],
+        payload["batch_size"],
+        # Jobs persisted before the overlap was stored fall back to the resent context
+        payload.get("overlap", payload["context_count"]),
+    )
+    logger.debug("Proceeding with memory extraction for user %s - %s batch(es) of new messages", job.user_id, len(windows))
+    memory_client = get_client()
+    for window in windows:
+        await memory_client.runs.create(
+            thread_id=payload["thread_id"],
+            multitask_strategy="enqueue",
+            assistant_id=payload["mem_assistant_id"],
+            input={"messages": window},
+            config={
+                "configurable": {
+                    "user_id": job.user_id,
+                    "memory_types": payload["memory_types"],
+                }
+            },
+        )
+    # Later runs on this thread start after the messages sent here
+    await asyncio.to_thread(memory_scheduler.backend.set_watermark, payload["thread_id"], payload["message_count"])
+    logger.debug("Memory extraction completed for user %s", job.user_id)
+
+# Pending extractions are persisted and shared by every worker, so they survive
+# restarts and each one is run by exactly one process
+memory_scheduler = DebouncedScheduler(SQLiteSchedulerBackend(), handler=run_memory_extraction)
+if MEMORY_SCHEDULER_AUTOSTART:
+    # Run jobs left over from before a restart without waiting for a new schedule call
+    memory_scheduler.start()
 
 async def cancel_pending_memory_task(user_id: str) -> None:
-    """Cancel any pending memory extraction task for a user."""
-    if user_id in pending_memory_tasks:
-        task = pending_memory_tasks[user_id]
-        if not task.done():
-            task.cancel()
-            print(f"DEBUG: Cancelled pending memory task for user {user_id}")
-        del pending_memory_tasks[user_id]
-
-async def delayed_memory_extraction(user_id: str, messages: list, config: RunnableConfig, delay_seconds: int) -> None:
-    """Execute memory extraction after a delay, checking for new activity."""
-    try:
-        print(f"DEBUG: Starting delayed memory extraction for user {user_id} with {delay_seconds}s delay")
-        await asyncio.sleep(delay_seconds)
-        
-        # Check if there was new activity during the delay
-        if should_extract_memories(user_id, delay_seconds):
-            print(f"DEBUG: Proceeding with memory extraction for user {user_id} - no new activity detected")
-            
-            # Proceed with memory extraction
-            configurable = ChatConfigurable.from_context(config)
-            
-            memory_client = get_client()
-            await memory_client.runs.create(
-                thread_id=config["configurable"]["thread_id"],
-                multitask_strategy="enqueue",
-                assistant_id=configurable.mem_assistant_id,
-                input={"messages": messages},
-                config={
-                    "configurable": {
-                        "user_id": user_id,
-                        "memory_types": configurable.memory_types,
-                    }
-                },
-            )
-            print(f"DEBUG: Memory extraction completed for user {user_id}")
-        else:
-            print(f"DEBUG: Skipping memory extraction for user {user_id} - new activity detected")
-            
-    except asyncio.CancelledError:
-        print(f"DEBUG: Memory extraction task cancelled for user {user_id}")
-    except Exception as e:
-        print(f"ERROR: Failed to extract memories for user {user_id}: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        # Clean up the task reference
-        if user_id in pending_memory_tasks:
-            del pending_memory_tasks[user_id]
+    """Cancel any pending memory extraction for a user."""
+    await memory_scheduler.cancel(user_id)
+    logger.debug("Cancelled pending memory task for user %s", user_id)
 
 async def handle_user_identification(state: ChatState, config: RunnableConfig) -> dict[str, Any]:
     """Handle user identification and return updated state."""
-    user_id = determine_user_id(state, config)
+    configure_logging()
+    with stage("identify"):
+        user_id = determine_user_id(state, config)
     
     # Update activity timestamp
     update_user_activity(user_id)
    
     if user_id != "default-user":
-        print(f"DEBUG: User identified as: {user_id}")
+        logger.debug("User identified as: %s", user_id)
         # Update the state with the identified user
         new_state = {
             "user_id": user_id,
@@ -286,10 +330,124 @@ async def handle_user_identification(state: ChatState, config: RunnableConfig) -
    
     return {"last_activity_time": user_activity_tracker.get(user_id, 0)}
 
+async def rescore_cached_memories(candidates: List[MemoryCandidate], query: str) -> List[MemoryCandidate]:
+    """Re-rank memories cached for an earlier turn against this turn's query."""
+    try:
+        return await asyncio.to_thread(rescore_memories, candidates, query, get_embeddings_model())
+    except Exception as e:
+        logger.debug("Could not rescore cached memories against the query: %s", e)
+        return [MemoryCandidate(c.memory_type, c.content, updated_at=c.updated_at) for c in candidates]
+
+async def list_and_rescore_memories(
+    user_id: str,
+    query: str,
+    configurable: ChatConfigurable,
+    store_memories: List[MemoryCandidate] | None,
+    errors: List[str],
+) -> tuple[List[MemoryCandidate], List[MemoryCandidate]]:
+    """List every store memory of the user unless `store_memories` already holds them.
+
+    Returns the listing and the listing ranked for `query`.
+    """
+    if store_memories is None:
+        listing = await get_user_memory_candidates(
+            user_id, timeout=configurable.memory_retrieval_timeout_seconds, errors=errors, list_all=True
+        )
+        store_memories = [memory for memories in listing.values() for memory in memories]
+    return store_memories, await rescore_cached_memories(store_memories, query)
+
+async def build_memory_section(
+    user_id: str,
+    query: str,
+    configurable: ChatConfigurable,
+    store_memories: List[MemoryCandidate] | None = None,
+) -> tuple[str, bool, List[MemoryCandidate]]:
+    """Retrieve a user's memories and format them for the system prompt.
+
+    With `enable_memory_context_cache`, every store memory of the user is listed
+    (or `store_memories`, a listing cached for an earlier turn, is reused) and ranked
+    against `query`, so a cached listing yields the same context as a fresh one.
+    Otherwise the store is searched for `query`. FAISS notes are searched for every
+    query.
+
+    Returns the memory section, whether every retrieval succeeded, and the
+    listing of store memories (empty when the store was searched instead).
+    """
+    # Get all stored memories and search FAISS for episodic memories concurrently -
+    # ENSURE we're using the correct user_id. FAISS search does blocking disk I/O and
+    # vector math, so it runs in a worker thread instead of on the event loop.
+    failed_namespaces: list[str] = []
+    if configurable.enable_memory_context_cache:
+        retrieval = list_and_rescore_memories(user_id, query, configurable, store_memories, failed_namespaces)
+    else:
+        retrieval = get_user_memory_candidates(
+            user_id, query, timeout=configurable.memory_retrieval_timeout_seconds, errors=failed_namespaces
+        )
+    store_results, faiss_results = await asyncio.gather(
+        retrieval,
+        asyncio.to_thread(search_faiss_with_scores, user_id, "Note", query, 5),
+        return_exceptions=True,
+    )
+
+    complete = not failed_namespaces
+    listing: List[MemoryCandidate] = []
+    if isinstance(store_results, BaseException):
+        logger.debug("Memory retrieval failed for user %s: %s", user_id, store_results)
+        store_results = []
+        complete = False
+    elif isinstance(store_results, dict):
+        store_results = [memory for memories in store_results.values() for memory in memories]
+    else:
+        listing, store_results = store_results
+
+    if isinstance(faiss_results, BaseException):
+        logger.debug("FAISS search failed for user %s: %s", user_id, faiss_results)
+        faiss_results = []
+        complete = False
+    else:
+        logger.debug("FAISS search returned %s results for user %s", len(faiss_results), user_id)
+
+    candidates = list(store_results)
+    for doc, distance in faiss_results:
+        content = doc.page_content
+        context = doc.metadata.get('context', '')
+        candidates.append(
+            MemoryCandidate(
+                memory_type=FAISS_NOTES,
+                content=f"{content} (Context: {context})" if context else content,
+                similarity=1.0 / (1.0 + max(float(distance), 0.0)),
+            )
+        )
+
+    # Keep the most relevant memories that fit the token budget, grouped by type
+    selected, stats = pack_memories(candidates, configurable.memory_token_budget)
+    logger.debug(
+        "Packed %s/%s memories into ~%s tokens (~%s tokens saved) for user %s",
+        stats.selected, stats.candidates, stats.selected_tokens, stats.tokens_saved, user_id,
+    )
+    memory_parts = render_memories(selected, MEMORY_TYPES + [FAISS_NOTES])
+
+    # Create the final memory section - FIXED: Only include if memories exist
+    memory_section = ""
+    if memory_parts:
+        memory_content = "\n".join(memory_parts).strip()
+        memory_section = f"\n\n## Your Memory About {user_id}\n\n{memory_content}"
+        logger.debug("Created memory section with %s characters for user %s", len(memory_content), user_id)
+        logger.debug("Memory section preview:\n%s...", memory_section[:500])
+    else:
+        logger.debug("No memories found for user: %s", user_id)
+        # For new users, explicitly state no previous memories
+        if user_id != "default-user":
+            memory_section = f"\n\n## Your Memory About {user_id}\n\nThis appears to be your first conversation with {user_id}. You have no previous memories about them yet."
+
+    return memory_section, complete, listing
+
 async def bot(state: ChatState, config: RunnableConfig) -> dict[str, list[Messages]]:
     """The core chatbot logic: responds to user and incorporates memory."""
+    increment("chatbot.turns")
     # Determine the user ID for this conversation
-    user_id = determine_user_id(state, config)
+    with stage("identify"):
+        user_id = determine_user_id(state, config)
     
     # Update activity timestamp
     update_user_activity(user_id)
@@ -301,60 +459,35 @@ async def bot(state: ChatState, config: RunnableConfig) -> dict[str, list[Messag
    
     configurable = ChatConfigurable.from_context(updated_config)
    
-    print(f"DEBUG: Bot processing for user: {user_id}")
+    logger.debug("Bot processing for user: %s", user_id)
 
     # Get the latest user message for query context
     latest_message = state.messages[-1] if state.messages else ""
     query = str(latest_message.content) if hasattr(latest_message, 'content') else str(latest_message)
    
-    print(f"DEBUG: Processing query for user '{user_id}': {query[:100]}...")
+    logger.debug("Processing query for user '%s': %s...", user_id, query[:100])
 
-    # Get all stored memories - ENSURE we're using the correct user_id
-    all_memories = await get_all_user_memories(user_id, query)
-   
-    # Search FAISS for episodic memories - ENSURE we're using the correct user_id
-    faiss_results = []
-    try:
-        faiss_results = search_faiss(user_id, "Note", query, k=5)
-        print(f"DEBUG: FAISS search returned {len(faiss_results)} results for user {user_id}")
-    except Exception as e:
-        print(f"DEBUG: FAISS search failed for user {user_id}: {e}")
-
-    # Build comprehensive memory section
-    memory_parts = []
-   
-    # Add stored memories by type
-    for memory_type, memories in all_memories.items():
-        if memories:
-            memory_parts.append(f"**{memory_type} Information:**")
-            for memory in memories:
-                memory_parts.append(f"- {memory}")
-            memory_parts.append("")  # Add spacing
-   
-    # Add FAISS memories if available
-    if faiss_results:
-        memory_parts.append("**Recent Notes from Past Conversations:**")
-        for doc in faiss_results:
-            content = doc.page_content
-            context = doc.metadata.get('context', '')
-            if context:
-                memory_parts.append(f"- {content} (Context: {context})")
-            else:
-                memory_parts.append(f"- {content}")
-        memory_parts.append("")
+    # Reuse the listing of the user's store memories while they are unchanged; it is
+    # still ranked and packed for this turn's query and budget
+    store_memories = None
+    memory_version = None
+    if configurable.enable_memory_context_cache:
+        try:
+            memory_version = await aget_memory_version(get_store(), user_id)
+            store_memories = memory_context_cache.get(user_id, memory_version)
+        except Exception as e:
+            logger.debug("Could not read memory version for user %s: %s", user_id, e)
 
-    # Create the final memory section - FIXED: Only include if memories exist
-    memory_section = ""
-    if memory_parts:
-        memory_content = "\n".join(memory_parts).strip()
-        memory_section = f"\n\n## Your Memory About {user_id}\n\n{memory_content}"
-        print(f"DEBUG: Created memory section with {len(memory_content)} characters for user {user_id}")
-        print(f"DEBUG: Memory section preview:\n{memory_section[:500]}...")
-    else:
-        print(f"DEBUG: No memories found for user: {user_id}")
-        # For new users, explicitly state no previous memories
-        if user_id != "default-user":
-            memory_section = f"\n\n## Your Memory About {user_id}\n\nThis appears to be your first conversation with {user_id}. You have no previous memories about them yet."
+    if store_memories is not None:
+        logger.debug("Using cached memories for user %s", user_id)
+        increment("chatbot.memory_context_cache_hits")
+    with stage("retrieve"):
+        memory_section, complete, retrieved = await build_memory_section(
+            user_id, query, configurable, store_memories
+        )
+    # Never cache partial results
+    if store_memories is None and memory_version is not None and complete:
+        memory_context_cache.put(user_id, memory_version, retrieved)
    
     # Compose the system prompt
     prompt = configurable.system_prompt.format(
@@ -362,7 +495,7 @@ async def bot(state: ChatState, config: RunnableConfig) -> dict[str, list[Messag
         time=datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
     )
    
-    print(f"DEBUG: Final system prompt length: {len(prompt)}")
+    logger.debug("Final system prompt length: %s", len(prompt))
 
     # Prepare messages for LLM
     try:
@@ -377,15 +510,16 @@ async def bot(state: ChatState, config: RunnableConfig) -> dict[str, list[Messag
                 # Fallback for other message types
                 messages_for_llm.append({"role": "user", "content": str(msg)})
        
-        print(f"DEBUG: Prepared {len(messages_for_llm)} messages for LLM")
+        logger.debug("Prepared %s messages for LLM", len(messages_for_llm))
        
         # Invoke the LLM with updated config
-        response = await llm.ainvoke(
-            messages_for_llm,
-            config={"configurable": {"model": configurable.model}},
-        )
+        with stage("llm"):
+            response = await get_llm().ainvoke(
+                messages_for_llm,
+                config={"configurable": {"model": configurable.model}},
+            )
        
-        print(f"DEBUG: LLM response generated successfully for user {user_id}")
+        logger.debug("LLM response generated successfully for user %s", user_id)
        
         # Return response with updated user_id and activity time in state
         return {
@@ -396,9 +530,7 @@ async def bot(state: ChatState, config: RunnableConfig) -> dict[str, list[Messag
         }
        
     except Exception as e:
-        print(f"ERROR: Failed to get LLM response for user {user_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to get LLM response for user %s: %s", user_id, e)
        
         # Return a fallback response
         from langchain_core.messages import AIMessage
@@ -417,7 +549,7 @@ async def schedule_memories_with_debouncing(state: ChatState, config: RunnableCo
    
     # Skip memory scheduling for default users or if no real conversation
     if user_id == "default-user" or not state.messages or not state.pending_memory_extraction:
-        print(f"DEBUG: Skipping memory extraction for user: {user_id}")
+        logger.debug("Skipping memory extraction for user: %s", user_id)
         return {}
    
     # Update config with the correct user ID
@@ -426,27 +558,44 @@ async def schedule_memories_with_debouncing(state: ChatState, config: RunnableCo
     updated_config["configurable"]["user_id"] = user_id
    
     configurable = ChatConfigurable.from_context(updated_config)
+
+    # Extraction progress is tracked per thread; without one there is nothing to resume
+    thread_id = updated_config["configurable"].get("thread_id")
+    if not thread_id:
+        logger.debug("Skipping memory extraction for user %s: no thread_id in config", user_id)
+        return {}
    
-    print(f"DEBUG: Scheduling debounced memory extraction for user: {user_id}")
-    print(f"DEBUG: Processing {len(state.messages)} messages")
+    logger.debug("Scheduling debounced memory extraction for user: %s", user_id)
+    logger.debug("Processing %s messages", len(state.messages))
    
-    # Cancel any existing pending task for this user
-    await cancel_pending_memory_task(user_id)
-    
-    # Create a new delayed memory extraction task
-    task = asyncio.create_task(
-        delayed_memory_extraction(
-            user_id, 
-            state.messages, 
-            updated_config, 
-            configurable.delay_seconds
+    with stage("schedule"):
+        # Only messages past the thread's extraction watermark (plus a little overlap for
+        # context) are sent, so each run costs the new turns rather than the whole transcript
+        watermark = await asyncio.to_thread(memory_scheduler.backend.get_watermark, thread_id)
+        watermark = min(watermark, len(state.messages))
+        start = max(watermark - configurable.memory_overlap_messages, 0)
+        delay_seconds = configurable.get_effective_delay(len(state.messages))
+        # (Re)scheduling replaces the user's pending job, pushing it back while they stay
+        # active - but never past max_delay_seconds after their pending work began
+        job = await memory_scheduler.schedule(
+            user_id,
+            delay_seconds,
+            {
+                "thread_id": thread_id,
+                "messages": messages_to_dict(state.messages[start:]),
+                "context_count": watermark - start,
+                "message_count": len(state.messages),
+                "batch_size": configurable.memory_batch_size,
+                "overlap": configurable.memory_overlap_messages,
+                "mem_assistant_id": configurable.mem_assistant_id,
+                "memory_types": configurable.memory_types,
+            },
+            max_delay_seconds=configurable.max_delay_seconds,
         )
-    )
-    
-    # Store the task reference
-    pending_memory_tasks[user_id] = task
     
-    print(f"DEBUG: Scheduled memory extraction task for user {user_id} with {configurable.delay_seconds}s delay")
+    if configurable.should_force_memory_extraction(job.due_at - job.created_at):
+        logger.debug("Forcing memory extraction for user %s at the %ss deadline", user_id, configurable.max_delay_seconds)
+    logger.debug("Scheduled memory extraction task for user %s with %ss delay", user_id, delay_seconds)
     
     # Return updated state without pending flag
     return {"pending_memory_extraction": False}
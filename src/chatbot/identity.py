@@ -0,0 +1,112 @@
+"""Resolve a user ID from the conversation, memoized per thread."""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Sequence, Tuple
+
+# Explicit ID patterns are matched case-insensitively against the original text and
+# take priority over name patterns, which are matched against the lowercased text.
+# Within each group, earlier patterns win.
+USER_ID_PATTERNS = [
+    r"user[_\s]*id[:\s]*([A-Za-z0-9_]+)",
+    r"id[:\s]*([A-Za-z0-9_]+)",
+    r"User_(\d+)",  # Specific pattern for User_XXXX format
+    r"user_(\d+)",  # Alternative user_XXXX format
+]
+NAME_PATTERNS = [
+    r"my name is (\w+)",
+    r"i'?m (\w+)",
+    r"this is (\w+)",
+    r"call me (\w+)",
+    r"it'?s (\w+)",  # e.g. "it's Mona"
+    r"hello,?\s+(\w+)",  # e.g. "Hello Mona"
+]
+
+_USER_ID_RES = [re.compile(pattern, re.IGNORECASE) for pattern in USER_ID_PATTERNS]
+_NAME_RES = [re.compile(pattern) for pattern in NAME_PATTERNS]
+# One alternation per group screens a message in a single search; the individual
+# patterns only run, in priority order, for the rare message that matches
+_ANY_USER_ID = re.compile("|".join(f"(?:{pattern})" for pattern in USER_ID_PATTERNS), re.IGNORECASE)
+_ANY_NAME = re.compile("|".join(f"(?:{pattern})" for pattern in NAME_PATTERNS))
+
+
+def extract_user_id(content: str) -> str | None:
+    """Return the user ID or name a single message identifies, if any."""
+    if _ANY_USER_ID.search(content):
+        for pattern in _USER_ID_RES:
+            match = pattern.search(content)
+            if match:
+                return match.group(1)
+    lowered = content.lower()
+    if _ANY_NAME.search(lowered):
+        for pattern in _NAME_RES:
+            match = pattern.search(lowered)
+            if match:
+                return match.group(1)
+    return None
+
+
+def _message_text(message: Any) -> str:
+    return str(message.content) if hasattr(message, "content") else str(message)
+
+
+class UserIdResolver:
+    """Find the first message in a conversation that identifies the user.
+
+    Conversations only grow, so per thread it remembers how many messages were
+    already scanned and what they resolved to: once a thread is identified the
+    answer is returned without looking at the history again, and otherwise only
+    messages added since the last call are scanned.
+    """
+
+    def __init__(self, max_threads: int = 10000):
+        """Track at most `max_threads` threads."""
+        self.max_threads = max_threads
+        self._threads: OrderedDict[str, Tuple[int, str | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.scanned_messages = 0
+
+    def resolve(self, thread_id: str | None, messages: Sequence[Any]) -> str | None:
+        """Return the user ID identified by `messages`, or None if none of them does."""
+        scanned, user_id = 0, None
+        if thread_id is not None:
+            with self._lock:
+                scanned, user_id = self._threads.get(thread_id, (0, None))
+            if scanned > len(messages):
+                # The history was rewritten or trimmed; start over
+                scanned, user_id = 0, None
+            elif user_id is not None or scanned == len(messages):
+                with self._lock:
+                    self.hits += 1
+                return user_id
+
+        checked = 0
+        for message in messages[scanned:]:
+            checked += 1
+            user_id = extract_user_id(_message_text(message))
+            if user_id is not None:
+                break
+
+        if thread_id is not None:
+            with self._lock:
+                self.scanned_messages += checked
+                self._threads[thread_id] = (len(messages), user_id)
+                self._threads.move_to_end(thread_id)
+                while len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+        return user_id
+
+    def forget(self, thread_id: str) -> None:
+        """Drop the memoized result for `thread_id`."""
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the resolver counters."""
+        with self._lock:
+            return {"threads": len(self._threads), "hits": self.hits, "scanned_messages": self.scanned_messages}
+
+
+user_id_resolver = UserIdResolver()
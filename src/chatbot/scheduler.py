@@ -0,0 +1,444 @@
+"""Durable debounced scheduling of memory extraction runs.
+
+Each user has at most one pending extraction job. Scheduling again before the job
+is due pushes its due time back (debouncing). Jobs live in a backend ordered by
+due time, so a single dispatcher per process serves any number of idle users
+instead of one sleeping task each. With the SQLite backend, jobs survive restarts
+and every worker process pointed at the same file shares them; a job is claimed
+under a lease by exactly one worker.
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger("memory.scheduler")
+
+MEMORY_SCHEDULER_PATH = os.environ.get("MEMORY_SCHEDULER_PATH", "memory_scheduler.sqlite")
+MEMORY_SCHEDULER_POLL_SECONDS = float(os.environ.get("MEMORY_SCHEDULER_POLL_SECONDS", "1.0"))
+MEMORY_SCHEDULER_LEASE_SECONDS = float(os.environ.get("MEMORY_SCHEDULER_LEASE_SECONDS", "300"))
+# Opt in to starting the chatbot's dispatcher when its graph is loaded, so jobs persisted
+# before a restart run without waiting for new activity; otherwise it starts on the
+# first `schedule` call
+MEMORY_SCHEDULER_AUTOSTART = os.environ.get("MEMORY_SCHEDULER_AUTOSTART", "false").lower() in ["true", "1", "yes", "on"]
+
+
+@dataclass
+class ExtractionJob:
+    """A pending memory extraction for one user."""
+
+    user_id: str
+    due_at: float
+    payload: Dict[str, Any]
+    created_at: float
+    """When the user's current run of pending work was first scheduled."""
+    generation: int = 0
+    """Incremented on every reschedule, so a stale claim cannot complete a newer job."""
+
+
+class SchedulerBackend:
+    """Storage for pending jobs, ordered by due time."""
+
+    def schedule(
+        self, user_id: str, due_at: float, payload: Dict[str, Any], now: float, max_delay: float | None = None
+    ) -> ExtractionJob:
+        """Create the user's job, or replace its due time and payload if one is pending.
+
+        With `max_delay`, the job is never due later than `max_delay` seconds after
+        its `created_at`, however often it is pushed back.
+        """
+        raise NotImplementedError
+
+    def cancel(self, user_id: str) -> None:
+        """Drop the user's pending job, if any."""
+        raise NotImplementedError
+
+    def claim_due(self, now: float, worker_id: str, lease_seconds: float, limit: int = 100) -> List[ExtractionJob]:
+        """Atomically claim up to `limit` due jobs that no live lease holds."""
+        raise NotImplementedError
+
+    def complete(self, job: ExtractionJob) -> None:
+        """Remove a claimed job, unless it was rescheduled while it ran."""
+        raise NotImplementedError
+
+    def next_due(self) -> float | None:
+        """Return the earliest due time of any pending job."""
+        raise NotImplementedError
+
+    def get_watermark(self, thread_id: str) -> int:
+        """Return how many of the thread's messages have already been extracted."""
+        raise NotImplementedError
+
+    def set_watermark(self, thread_id: str, message_count: int) -> None:
+        """Record that the first `message_count` messages of the thread were extracted."""
+        raise NotImplementedError
+
+
+class InMemorySchedulerBackend(SchedulerBackend):
+    """Single-process backend keeping jobs in a priority heap."""
+
+    def __init__(self):
+        """Create an empty backend."""
+        self._jobs: Dict[str, ExtractionJob] = {}
+        self._leases: Dict[str, float] = {}
+        # Superseded heap entries are skipped lazily instead of being removed
+        self._heap: List[Tuple[float, int, str]] = []
+        self._watermarks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def schedule(
+        self, user_id: str, due_at: float, payload: Dict[str, Any], now: float, max_delay: float | None = None
+    ) -> ExtractionJob:
+        """Create or reschedule the user's job in memory."""
+        with self._lock:
+            existing = self._jobs.get(user_id)
+            # Work arriving while a job runs starts a new pending window
+            created_at = existing.created_at if existing and user_id not in self._leases else now
+            if max_delay is not None:
+                due_at = min(due_at, created_at + max_delay)
+            job = ExtractionJob(
+                user_id=user_id,
+                due_at=due_at,
+                payload=payload,
+                created_at=created_at,
+                generation=existing.generation + 1 if existing else 0,
+            )
+            self._jobs[user_id] = job
+            self._leases.pop(user_id, None)
+            heapq.heappush(self._heap, (due_at, job.generation, user_id))
+            return job
+
+    def cancel(self, user_id: str) -> None:
+        """Drop the user's pending job and any lease on it."""
+        with self._lock:
+            self._jobs.pop(user_id, None)
+            self._leases.pop(user_id, None)
+
+    def claim_due(self, now: float, worker_id: str, lease_seconds: float, limit: int = 100) -> List[ExtractionJob]:
+        """Lease up to `limit` due jobs, re-queueing each at its lease expiry."""
+        claimed = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(claimed) < limit:
+                _, generation, user_id = heapq.heappop(self._heap)
+                job = self._jobs.get(user_id)
+                if job is None or job.generation != generation or self._leases.get(user_id, 0) > now:
+                    continue
+                self._leases[user_id] = now + lease_seconds
+                # Keep an entry so the job is retried if the lease expires uncompleted
+                heapq.heappush(self._heap, (now + lease_seconds, generation, user_id))
+                claimed.append(job)
+        return claimed
+
+    def complete(self, job: ExtractionJob) -> None:
+        """Remove a claimed job unless a newer generation replaced it."""
+        with self._lock:
+            current = self._jobs.get(job.user_id)
+            if current is not None and current.generation == job.generation:
+                del self._jobs[job.user_id]
+                self._leases.pop(job.user_id, None)
+
+    def next_due(self) -> float | None:
+        """Return the earliest due time, discarding superseded heap entries."""
+        with self._lock:
+            while self._heap:
+                due_at, generation, user_id = self._heap[0]
+                job = self._jobs.get(user_id)
+                if job is not None and job.generation == generation:
+                    return due_at
+                heapq.heappop(self._heap)
+            return None
+
+    def get_watermark(self, thread_id: str) -> int:
+        """Return the thread's extraction watermark, 0 if unset."""
+        with self._lock:
+            return self._watermarks.get(thread_id, 0)
+
+    def set_watermark(self, thread_id: str, message_count: int) -> None:
+        """Raise the thread's extraction watermark to `message_count`."""
+        with self._lock:
+            self._watermarks[thread_id] = max(self._watermarks.get(thread_id, 0), message_count)
+
+
+class SQLiteSchedulerBackend(SchedulerBackend):
+    """Backend persisting jobs to a SQLite file shared by every worker process.
+
+    Jobs are indexed by due time; claims happen inside an immediate transaction so
+    two workers never claim the same job. A worker that dies mid-run leaves its
+    lease to expire, after which another worker picks the job up.
+    """
+
+    def __init__(self, path: str = MEMORY_SCHEDULER_PATH):
+        """Use the SQLite file at `path`, which is opened on first use."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_jobs ("
+                "user_id TEXT PRIMARY KEY, due_at REAL NOT NULL, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, generation INTEGER NOT NULL DEFAULT 0, "
+                "claimed_by TEXT, lease_until REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS extraction_jobs_due ON extraction_jobs (due_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_watermarks (thread_id TEXT PRIMARY KEY, message_count INTEGER NOT NULL)"
+            )
+        return self._conn
+
+    def schedule(
+        self, user_id: str, due_at: float, payload: Dict[str, Any], now: float, max_delay: float | None = None
+    ) -> ExtractionJob:
+        """Upsert the user's job row, keeping its `created_at` unless it is leased."""
+        if max_delay is not None:
+            due_at = min(due_at, now + max_delay)
+        with self._lock:
+            conn = self._connection()
+            # Work arriving while a job runs starts a new pending window; otherwise the
+            # original window's deadline still caps the due time
+            row = conn.execute(
+                "INSERT INTO extraction_jobs (user_id, due_at, payload, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET "
+                "created_at = CASE WHEN claimed_by IS NULL THEN created_at ELSE excluded.created_at END, "
+                "due_at = CASE WHEN ? IS NULL OR claimed_by IS NOT NULL THEN excluded.due_at "
+                "ELSE MIN(excluded.due_at, created_at + ?) END, "
+                "payload = excluded.payload, generation = generation + 1, claimed_by = NULL, lease_until = NULL "
+                "RETURNING due_at, created_at, generation",
+                (user_id, due_at, json.dumps(payload), now, max_delay, max_delay),
+            ).fetchone()
+        return ExtractionJob(user_id, row[0], payload, created_at=row[1], generation=row[2])
+
+    def cancel(self, user_id: str) -> None:
+        """Delete the user's job row."""
+        with self._lock:
+            self._connection().execute("DELETE FROM extraction_jobs WHERE user_id = ?", (user_id,))
+
+    def claim_due(self, now: float, worker_id: str, lease_seconds: float, limit: int = 100) -> List[ExtractionJob]:
+        """Lease up to `limit` due, unleased jobs in one immediate transaction."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT user_id, due_at, payload, created_at, generation FROM extraction_jobs "
+                    "WHERE due_at <= ? AND (lease_until IS NULL OR lease_until <= ?) ORDER BY due_at LIMIT ?",
+                    (now, now, limit),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE extraction_jobs SET claimed_by = ?, lease_until = ? WHERE user_id = ?",
+                    [(worker_id, now + lease_seconds, row[0]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return [
+            ExtractionJob(user_id, due_at, json.loads(payload), created_at=created_at, generation=generation)
+            for user_id, due_at, payload, created_at, generation in rows
+        ]
+
+    def complete(self, job: ExtractionJob) -> None:
+        """Delete the claimed job's row unless it was rescheduled."""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM extraction_jobs WHERE user_id = ? AND generation = ?", (job.user_id, job.generation)
+            )
+
+    def next_due(self) -> float | None:
+        """Return the smallest due time in the job table."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT MIN(CASE WHEN lease_until > due_at THEN lease_until ELSE due_at END) FROM extraction_jobs"
+            ).fetchone()
+        return row[0]
+
+    def get_watermark(self, thread_id: str) -> int:
+        """Return the thread's stored extraction watermark, 0 if unset."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT message_count FROM extraction_watermarks WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def set_watermark(self, thread_id: str, message_count: int) -> None:
+        """Store the thread's watermark if it is higher than the current one."""
+        with self._lock:
+            # Watermarks only move forward, even if an older job completes late
+            self._connection().execute(
+                "INSERT INTO extraction_watermarks (thread_id, message_count) VALUES (?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET message_count = MAX(message_count, excluded.message_count)",
+                (thread_id, message_count),
+            )
+
+
+JobHandler = Callable[[ExtractionJob], Awaitable[None]]
+
+
+class DebouncedScheduler:
+    """Run a handler for each user's job once it comes due, from one dispatcher task per process.
+
+    The dispatcher sleeps until the earliest due job (or the poll interval, to pick up
+    jobs scheduled by other workers) and is woken early when a sooner job is scheduled
+    locally. Each claimed job runs as its own task, so a slow handler never holds up
+    other due jobs. The dispatcher starts on `start` or the first `schedule` call.
+    """
+
+    def __init__(
+        self,
+        backend: SchedulerBackend,
+        handler: JobHandler | None = None,
+        poll_seconds: float = MEMORY_SCHEDULER_POLL_SECONDS,
+        lease_seconds: float = MEMORY_SCHEDULER_LEASE_SECONDS,
+    ):
+        """Dispatch `backend`'s due jobs to `handler`, polling at least every `poll_seconds`."""
+        self.backend = backend
+        self.handler = handler
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._dispatcher: asyncio.Future | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._running: set = set()
+
+    async def schedule(
+        self,
+        user_id: str,
+        delay_seconds: float,
+        payload: Dict[str, Any],
+        max_delay_seconds: float | None = None,
+    ) -> ExtractionJob:
+        """(Re)schedule `user_id`'s job to run `delay_seconds` from now with `payload`.
+
+        With `max_delay_seconds`, the job runs no later than that long after the user's
+        pending work was first scheduled, even if they never stop chatting.
+        """
+        now = time.time()
+        job = await asyncio.to_thread(
+            self.backend.schedule, user_id, now + delay_seconds, payload, now, max_delay_seconds
+        )
+        self.start()
+        self._wake()
+        return job
+
+    async def cancel(self, user_id: str) -> None:
+        """Drop `user_id`'s pending job."""
+        await asyncio.to_thread(self.backend.cancel, user_id)
+
+    async def run_due(self, wait: bool = True) -> int:
+        """Claim every job that is currently due and run each as its own task; return how many.
+
+        With `wait`, return once they have all finished.
+        """
+        jobs = await asyncio.to_thread(self.backend.claim_due, time.time(), self.worker_id, self.lease_seconds)
+        tasks = [asyncio.create_task(self._run(job)) for job in jobs]
+        for task in tasks:
+            # Keep a reference, or the task may be garbage collected mid-run
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        if wait and tasks:
+            await asyncio.wait(tasks)
+        return len(jobs)
+
+    def start(self) -> None:
+        """Start the dispatcher unless it is already running.
+
+        Called from a running event loop, the dispatcher becomes a task on it;
+        otherwise (e.g. when the graph module is loaded) it runs on a daemon thread
+        with its own loop.
+        """
+        with self._start_lock:
+            if self._dispatcher is not None and not self._dispatcher.done() and not self._loop.is_closed():
+                return
+            self._wakeup = asyncio.Event()
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._loop = asyncio.new_event_loop()
+                self._dispatcher = self._loop.create_task(self._dispatch())
+                self._thread = threading.Thread(target=self._serve, name="memory-scheduler", daemon=True)
+                self._thread.start()
+            else:
+                self._dispatcher = self._loop.create_task(self._dispatch())
+
+    async def stop(self) -> None:
+        """Stop the dispatcher; pending jobs stay in the backend and running ones finish."""
+        if self._dispatcher is None:
+            return
+        dispatcher, loop, thread = self._dispatcher, self._loop, self._thread
+        self._dispatcher = self._thread = None
+        if thread is not None:
+            loop.call_soon_threadsafe(dispatcher.cancel)
+            await asyncio.to_thread(thread.join)
+            return
+        dispatcher.cancel()
+        try:
+            await dispatcher
+        except asyncio.CancelledError:
+            pass
+
+    def _serve(self) -> None:
+        """Run the dispatcher on this thread's loop, then let claimed jobs finish."""
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.wait([self._dispatcher]))
+            while self._running:
+                loop.run_until_complete(asyncio.wait(list(self._running)))
+        finally:
+            loop.close()
+
+    def _wake(self) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self, job: ExtractionJob) -> None:
+        try:
+            if self.handler is not None:
+                await self.handler(job)
+        except Exception as e:
+            logger.error("Scheduled memory extraction failed for user %s: %s", job.user_id, e)
+        finally:
+            await asyncio.to_thread(self.backend.complete, job)
+
+    async def _dispatch(self) -> None:
+        # A dispatcher on its own thread ends with the interpreter, which stops handing
+        # out executor threads once the main thread has exited
+        while threading.main_thread().is_alive():
+            self._wakeup.clear()
+            try:
+                await self.run_due(wait=False)
+                next_due = await asyncio.to_thread(self.backend.next_due)
+            except Exception as e:
+                if not threading.main_thread().is_alive():
+                    return
+                logger.error("Memory scheduler dispatch failed: %s", e)
+                next_due = None
+            wait = self.poll_seconds
+            if next_due is not None:
+                wait = min(max(next_due - time.time(), 0.0), self.poll_seconds)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except TimeoutError:
+                pass
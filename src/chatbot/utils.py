@@ -1,9 +1,12 @@
 """Define utility functions for your graph."""
 
+import logging
 from typing import Optional
 
 from langgraph.store.base import Item
 
+logger = logging.getLogger("memory.chatbot")
+
 
 def extract_memory_content(item):
     """Extract the actual content from a memory item with better error handling."""
@@ -38,7 +41,7 @@ def extract_memory_content(item):
         return str(item) if item else ""
         
     except Exception as e:
-        print(f"DEBUG: Error extracting memory content from {item}: {e}")
+        logger.debug("Error extracting memory content from %s: %s", item, e)
         return str(item) if item else ""
 
 
@@ -66,7 +69,7 @@ def format_memories(memories: Optional[list[Item]]) -> str:
                 
                 formatted_parts.append(f"[{memory_type}] {content}{timestamp}")
         except Exception as e:
-            print(f"DEBUG: Error formatting memory {m}: {e}")
+            logger.debug("Error formatting memory %s: %s", m, e)
             continue
     
     if not formatted_parts:
@@ -55,6 +55,18 @@ class Configuration:
     max_extraction_steps: int = 1
     """The maximum number of steps to take when extracting memories."""
 
+    extraction_mode: Literal["per_type", "combined"] = "per_type"
+    """`per_type` runs one extraction per memory type; `combined` extracts every type in a single LLM run."""
+
+    embedding_provider: str = "google_vertexai"
+    """The embedding backend for FAISS notes and the store index (see `memory_graph.embeddings`)."""
+
+    embedding_model: str = "text-embedding-004"
+    """The model name passed to the embedding backend."""
+
+    embedding_dimensions: int = 768
+    """The dimensionality of the vectors produced by the embedding backend."""
+
     @classmethod
     def from_context(cls, config: Optional[RunnableConfig] = None) -> "Configuration":
         """Create a Configuration instance from a RunnableConfig or environment."""
@@ -67,6 +79,9 @@ class Configuration:
                 if value is None:
                     value = os.environ.get(f.name.upper())
                 if value is not None:
+                    # Environment variables are always strings
+                    if f.type is int and isinstance(value, str):
+                        value = int(value)
                     values[f.name] = value
 
         # Handle memory_types configuration
@@ -0,0 +1,319 @@
+"""SQLite storage for the text and metadata of FAISS notes, read by vector position on demand.
+
+Each index directory keeps its notes in `notes.sqlite`, one row per vector position,
+with an index on the owning user. Loading an index no longer deserializes every note:
+a search only reads the rows of its hits. Notes appended since the last compaction
+are held in memory (they are also in the append-only log) until `flush` writes them.
+When the index stores compressed vectors, the exact vectors are kept here as well,
+for re-ranking search candidates and rebuilding the index.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+NOTES_DB_FILE = "notes.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    user_id TEXT,
+    embedding BLOB
+);
+CREATE INDEX IF NOT EXISTS notes_user_id ON notes (user_id);
+"""
+
+
+def _row_document(row: Tuple[str, str, str]) -> Document:
+    doc_id, page_content, metadata = row
+    return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+
+class NoteTable:
+    """Notes of one index directory, addressable by id and by vector position.
+
+    `base_count` is the number of vectors in the base snapshot the table is opened
+    against; rows at or past it were flushed by a compaction that never replaced
+    the snapshot, and are dropped (their notes are still in the log). A read-only
+    table ignores such rows instead.
+    """
+
+    def __init__(self, path: str, base_count: int = 0, read_only: bool = False):
+        """Open (creating if needed) the notes table in index directory `path`."""
+        self.db_path = os.path.join(path, NOTES_DB_FILE)
+        self.base_count = base_count
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Document] = {}
+        self._pending_positions: Dict[int, str] = {}
+        self._pending_embeddings: Dict[str, np.ndarray] = {}
+        self._conn: sqlite3.Connection | None = None
+        if read_only:
+            if os.path.exists(self.db_path):
+                self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._has_embeddings = "embedding" in self._columns()
+            return
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        with self._conn:
+            if "embedding" not in self._columns():
+                # Tables created before exact vectors were kept
+                self._conn.execute("ALTER TABLE notes ADD COLUMN embedding BLOB")
+            self._conn.execute("DELETE FROM notes WHERE position >= ?", (base_count,))
+        self._has_embeddings = True
+
+    def _columns(self) -> List[str]:
+        return [row[1] for row in self._query("PRAGMA table_info(notes)")]
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        if self._conn is None:
+            return []
+        return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def __len__(self) -> int:
+        """Return the number of vector positions, flushed and pending."""
+        with self._lock:
+            return self.base_count + len(self._pending_positions)
+
+    def document(self, doc_id: str) -> Document | None:
+        """Return the note with id `doc_id`, if any."""
+        with self._lock:
+            doc = self._pending.get(doc_id)
+            if doc is not None:
+                return doc
+            rows = self._query(
+                "SELECT id, page_content, metadata FROM notes WHERE id = ? AND position < ?", (doc_id, self.base_count)
+            )
+        return _row_document(rows[0]) if rows else None
+
+    def doc_id_at(self, position: int) -> str | None:
+        """Return the id of the note stored at vector `position`, if any."""
+        with self._lock:
+            if position in self._pending_positions:
+                return self._pending_positions[position]
+            if position >= self.base_count:
+                return None
+            rows = self._query("SELECT id FROM notes WHERE position = ?", (position,))
+        return rows[0][0] if rows else None
+
+    def documents_at(self, positions: Iterable[int]) -> List[Document | None]:
+        """Return the notes at `positions`, in order, reading all base rows in one query."""
+        positions = [int(p) for p in positions]
+        with self._lock:
+            base = [p for p in positions if p < self.base_count and p not in self._pending_positions]
+            found: Dict[int, Document] = {}
+            if base:
+                placeholders = ",".join("?" * len(base))
+                for position, *row in self._query(
+                    f"SELECT position, id, page_content, metadata FROM notes WHERE position IN ({placeholders})", base
+                ):
+                    found[position] = _row_document(row)
+            for position in positions:
+                doc_id = self._pending_positions.get(position)
+                if doc_id is not None:
+                    found[position] = self._pending[doc_id]
+        return [found.get(position) for position in positions]
+
+    def embeddings_at(self, positions: Iterable[int]) -> List[np.ndarray | None]:
+        """Return the exact vectors recorded for the notes at `positions`, in order (None where none is)."""
+        positions = [int(p) for p in positions]
+        with self._lock:
+            base = [p for p in positions if p < self.base_count and p not in self._pending_positions]
+            found: Dict[int, np.ndarray] = {}
+            if base and self._has_embeddings:
+                placeholders = ",".join("?" * len(base))
+                for position, blob in self._query(
+                    f"SELECT position, embedding FROM notes WHERE position IN ({placeholders}) AND embedding IS NOT NULL",
+                    base,
+                ):
+                    found[position] = np.frombuffer(blob, dtype=np.float32)
+            for position in positions:
+                doc_id = self._pending_positions.get(position)
+                if doc_id is not None and doc_id in self._pending_embeddings:
+                    found[position] = self._pending_embeddings[doc_id]
+        return [found.get(position) for position in positions]
+
+    def contains(self, doc_id: str) -> bool:
+        """Return whether the note `doc_id` is part of the base snapshot."""
+        with self._lock:
+            return bool(self._query("SELECT 1 FROM notes WHERE id = ? AND position < ?", (doc_id, self.base_count)))
+
+    def positions_for_user(self, user_id: str) -> List[int]:
+        """Return the vector positions of every note owned by `user_id`."""
+        with self._lock:
+            positions = [row[0] for row in self._query(
+                "SELECT position FROM notes WHERE user_id = ? AND position < ?", (user_id, self.base_count)
+            )]
+            positions.extend(
+                position for position, doc_id in self._pending_positions.items()
+                if self._pending[doc_id].metadata.get("user_id") == user_id
+            )
+        return positions
+
+    def positions(self) -> List[int]:
+        """Return every vector position holding a note, in order."""
+        with self._lock:
+            return list(range(self.base_count)) + sorted(self._pending_positions)
+
+    def add(self, docs: Dict[str, Document]) -> None:
+        """Hold new notes in memory until `flush`; they are placed by `assign`."""
+        with self._lock:
+            self._pending.update(docs)
+
+    def assign(self, positions: Dict[int, str]) -> None:
+        """Place pending notes at vector positions, as `{position: doc_id}`."""
+        with self._lock:
+            self._pending_positions.update(positions)
+
+    def set_embeddings(self, embeddings: Dict[str, np.ndarray]) -> None:
+        """Record the exact vectors of notes held in memory, written along with them by `flush`."""
+        with self._lock:
+            self._pending_embeddings.update(
+                (doc_id, np.asarray(vector, dtype=np.float32)) for doc_id, vector in embeddings.items()
+            )
+
+    def fill_embeddings(self, vectors: np.ndarray) -> None:
+        """Record `vectors[p]` as the exact vector of the note at position `p` wherever none is yet."""
+        with self._lock:
+            for position, doc_id in self._pending_positions.items():
+                if position < len(vectors):
+                    self._pending_embeddings.setdefault(doc_id, np.asarray(vectors[position], dtype=np.float32))
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE notes SET embedding = ? WHERE position = ? AND embedding IS NULL",
+                    [(np.asarray(vectors[p], dtype=np.float32).tobytes(), p)
+                     for p in range(min(self.base_count, len(vectors)))],
+                )
+
+    def update_metadata(self, doc_id: str, metadata: dict) -> bool:
+        """Replace the metadata of note `doc_id`; return whether it exists."""
+        with self._lock:
+            doc = self._pending.get(doc_id)
+            if doc is not None:
+                self._pending[doc_id] = Document(id=doc_id, page_content=doc.page_content, metadata=metadata)
+                return True
+            with self._conn:
+                cursor = self._conn.execute(
+                    "UPDATE notes SET metadata = ? WHERE id = ? AND position < ?",
+                    (json.dumps(metadata), doc_id, self.base_count),
+                )
+            return cursor.rowcount > 0
+
+    def import_rows(self, rows: Iterable[Tuple[int, Document]]) -> None:
+        """Write `(position, document)` rows straight to the base table, e.g. from a legacy pickle."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO notes (position, id, page_content, metadata, user_id) VALUES (?, ?, ?, ?, ?)",
+                [(position, doc.id, doc.page_content, json.dumps(doc.metadata), doc.metadata.get("user_id"))
+                 for position, doc in rows],
+            )
+            (count,), = self._query("SELECT COALESCE(MAX(position) + 1, 0) FROM notes")
+            self.base_count = max(self.base_count, count)
+
+    def flush(self) -> None:
+        """Write the notes held in memory to SQLite, making them part of the base."""
+        with self._lock:
+            if not self._pending_positions:
+                return
+            rows = []
+            for position, doc_id in sorted(self._pending_positions.items()):
+                doc = self._pending[doc_id]
+                embedding = self._pending_embeddings.get(doc_id)
+                rows.append((
+                    position, doc_id, doc.page_content, json.dumps(doc.metadata), doc.metadata.get("user_id"),
+                    embedding.tobytes() if embedding is not None else None,
+                ))
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO notes (position, id, page_content, metadata, user_id, embedding) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            self.base_count = max(self.base_count, rows[-1][0] + 1)
+            self._pending.clear()
+            self._pending_positions.clear()
+            self._pending_embeddings.clear()
+
+    def delete(self, ids: List[str]) -> None:
+        """Remove the notes `ids`, whether pending or flushed."""
+        removed = set(ids)
+        with self._lock:
+            for doc_id in removed:
+                self._pending.pop(doc_id, None)
+                self._pending_embeddings.pop(doc_id, None)
+            self._pending_positions = {p: i for p, i in self._pending_positions.items() if i not in removed}
+            with self._conn:
+                self._conn.executemany("DELETE FROM notes WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def close(self) -> None:
+        """Close the SQLite connection; the table cannot be used afterwards."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """LangChain docstore view of a `NoteTable`."""
+
+    def __init__(self, table: NoteTable):
+        """Wrap `table`."""
+        self.table = table
+
+    def search(self, search: str) -> Union[str, Document]:
+        """Return the note with id `search`, or a not-found message as LangChain expects."""
+        doc = self.table.document(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Hold new notes in the table until they are placed and flushed."""
+        self.table.add(texts)
+
+    def delete(self, ids: List) -> None:
+        """Remove the notes `ids` from the table."""
+        self.table.delete(ids)
+
+
+class PositionMap(MutableMapping):
+    """LangChain `index_to_docstore_id` view of a `NoteTable`, resolved one position at a time."""
+
+    def __init__(self, table: NoteTable):
+        """Wrap `table`."""
+        self.table = table
+
+    def __getitem__(self, position: int) -> str:
+        """Return the id of the note at `position`."""
+        doc_id = self.table.doc_id_at(int(position))
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __setitem__(self, position: int, doc_id: str) -> None:
+        """Place note `doc_id` at `position`."""
+        self.table.assign({int(position): doc_id})
+
+    def update(self, other=(), **kwargs) -> None:
+        """Place several notes at once, as `{position: doc_id}`."""
+        self.table.assign({int(p): doc_id for p, doc_id in dict(other, **kwargs).items()})
+
+    def __delitem__(self, position: int) -> None:
+        """Remove the note at `position`."""
+        self.table.delete([self[position]])
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over the positions holding a note."""
+        return iter(self.table.positions())
+
+    def __len__(self) -> int:
+        """Return the number of positions."""
+        return len(self.table)
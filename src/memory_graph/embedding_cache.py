@@ -0,0 +1,134 @@
+"""Content-addressed cache in front of an embeddings model."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an `Embeddings` model so identical text is only ever embedded once.
+
+    Vectors are keyed by a hash of (model name, dimensions, query/document kind, text)
+    and kept in a bounded in-memory LRU backed by a SQLite file, so the cache
+    survives restarts and is shared by every worker pointed at the same path.
+    Cached vectors are held as float32 arrays (3 KB per 768-dimension vector rather
+    than ~25 KB as a list of Python floats); callers get fresh lists, so mutating a
+    returned vector never touches the cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        path: str | None = None,
+        dimensions: int | None = None,
+        max_memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES,
+    ):
+        """Cache `embeddings` under `model_name`, on disk at `path` if given."""
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, calling the wrapped model only for uncached text."""
+        return self._embed(list(texts), "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, calling the wrapped model only on a cache miss."""
+        return self._embed([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the overall hit ratio."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _key(self, kind: str, text: str) -> str:
+        payload = f"{self.model_name}\0{self.dimensions or 'auto'}\0{kind}\0{text}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+        return self._conn
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _embed(self, texts: List[str], kind: str, embed: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory and key not in vectors:
+                    vectors[key] = self._memory[key]
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+
+            pending = list(dict.fromkeys(k for k in keys if k not in vectors))
+            conn = self._connection()
+            if conn is not None:
+                # Stay under SQLite's bound-parameter limit for large batches
+                for start in range(0, len(pending), 500):
+                    chunk = pending[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vectors[key] = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vectors[key])
+                    self.disk_hits += len(rows)
+
+            missing = list(dict.fromkeys(k for k in keys if k not in vectors))
+            self.misses += len(missing)
+
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            # Repeated text within one batch is embedded once
+            computed = embed([text_by_key[key] for key in missing])
+            with self._lock:
+                for key, vector in zip(missing, computed):
+                    vectors[key] = np.asarray(vector, dtype=np.float32)
+                    self._remember(key, vectors[key])
+                conn = self._connection()
+                if conn is not None:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [(key, vectors[key].tobytes()) for key in missing],
+                    )
+                    conn.commit()
+
+        return [vectors[key].tolist() for key in keys]
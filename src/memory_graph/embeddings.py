@@ -0,0 +1,120 @@
+"""Pluggable embedding backends for FAISS notes and the LangGraph store index."""
+
+import re
+import zlib
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from memory_graph.configuration import Configuration
+from memory_graph.embedding_cache import CachedEmbeddings
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1 << 16)
+def _hash_token(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic, offline CPU embeddings built by signed feature hashing.
+
+    Each text is tokenized into lowercase words plus character n-grams of every
+    word; tokens are hashed into `dimensions` buckets with a hash-derived sign, and
+    the whole batch is accumulated and L2-normalized in a single NumPy pass.
+    """
+
+    def __init__(self, dimensions: int = 768, ngram_range: tuple[int, int] = (3, 5)):
+        """Hash into `dimensions` buckets using character n-grams in `ngram_range`."""
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def _tokens(self, text: str) -> List[str]:
+        tokens = []
+        low, high = self.ngram_range
+        for word in _WORD_RE.findall(text.lower()):
+            tokens.append(word)
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                tokens.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return tokens
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts into L2-normalized hashed feature vectors."""
+        rows: List[int] = []
+        hashes: List[int] = []
+        for row, text in enumerate(texts):
+            token_hashes = [_hash_token(t) for t in self._tokens(text)]
+            rows.extend([row] * len(token_hashes))
+            hashes.extend(token_hashes)
+
+        hashed = np.asarray(hashes, dtype=np.uint32)
+        signs = np.where(hashed & 0x80000000, -1.0, 1.0).astype(np.float32)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.int64), hashed % self.dimensions), signs)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text."""
+        return self.embed_documents([text])[0]
+
+
+def _vertexai_embeddings(model: str, dimensions: int) -> Embeddings:
+    # Imported lazily so offline backends never need Google credentials or the SDK
+    from langchain_google_vertexai import VertexAIEmbeddings
+
+    return VertexAIEmbeddings(model=model)
+
+
+def _hashing_embeddings(model: str, dimensions: int) -> Embeddings:
+    return HashingEmbeddings(dimensions=dimensions)
+
+
+EMBEDDING_PROVIDERS: Dict[str, Callable[[str, int], Embeddings]] = {
+    "google_vertexai": _vertexai_embeddings,
+    "hashing": _hashing_embeddings,
+}
+
+
+def register_embedding_provider(name: str, factory: Callable[[str, int], Embeddings]) -> None:
+    """Register a backend factory taking (model, dimensions) under `name`."""
+    EMBEDDING_PROVIDERS[name] = factory
+
+
+def create_embeddings(provider: str, model: str, dimensions: int) -> Embeddings:
+    """Instantiate the embedding backend registered as `provider`."""
+    try:
+        factory = EMBEDDING_PROVIDERS[provider]
+    except KeyError:
+        raise ValueError(
+            f"Unknown embedding provider '{provider}'. Available: {sorted(EMBEDDING_PROVIDERS)}"
+        ) from None
+    return factory(model, dimensions)
+
+
+def build_default_embeddings(cache_path: str | None = None) -> CachedEmbeddings:
+    """Create the process-wide embeddings selected by `Configuration`, behind the embedding cache."""
+    configurable = Configuration.from_context()
+    return CachedEmbeddings(
+        create_embeddings(
+            configurable.embedding_provider,
+            configurable.embedding_model,
+            configurable.embedding_dimensions,
+        ),
+        model_name=f"{configurable.embedding_provider}:{configurable.embedding_model}",
+        path=cache_path,
+        dimensions=configurable.embedding_dimensions,
+    )
+
+
+async def aembed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts for the LangGraph store index using the configured backend."""
+    from memory_graph.faiss_store import get_embeddings_model
+
+    return await get_embeddings_model().aembed_documents(texts)
@@ -1,71 +1,1180 @@
-import os
-import faiss
-import pickle
-from typing import List
-from langchain_google_vertexai import VertexAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain_core.documents import Document
-
-FAISS_DIR = "vector_store"
-
-# Global embeddings model to be reused
-embeddings_model = VertexAIEmbeddings(model="text-embedding-004")
-
-
-def get_faiss_path(user_id: str, function_name: str) -> str:
-    return os.path.join(FAISS_DIR, f"faiss_index_{user_id}_{function_name}")
-
-
-def store_note_embedding(user_id: str, function_name: str, memory: dict) -> None:
-    """Embed and store a single memory in FAISS."""
-    content = memory.get("content", "")
-    context = memory.get("context", "")
-    if not content:
-        print("WARNING: Attempted to store empty note content to FAISS.")
-        return
-
-    doc = Document(
-        page_content=content,
-        metadata={"context": context}
-    )
-
-    path = get_faiss_path(user_id, function_name)
-
-    # Ensure the FAISS_DIR exists
-    os.makedirs(FAISS_DIR, exist_ok=True)
-
-    if os.path.exists(path):
-        try:
-            faiss_store = FAISS.load_local(
-                path, embeddings_model, allow_dangerous_deserialization=True
-            )
-            faiss_store.add_documents([doc])
-            print(f"DEBUG: Added document to existing FAISS index at: {path}")
-        except Exception as e:
-            print(f"ERROR: Could not load or add to existing FAISS index at {path}. Error: {e}. Creating new one.")
-            faiss_store = FAISS.from_documents([doc], embeddings_model)
-    else:
-        faiss_store = FAISS.from_documents([doc], embeddings_model)
-        print(f"DEBUG: Created new FAISS index at: {path}")
-
-    faiss_store.save_local(path)
-    print(f"DEBUG: FAISS index saved/updated at: {path}")
-
-
-def search_faiss(user_id: str, function_name: str, query: str, k: int = 5) -> List[Document]:
-    """Search the FAISS index for similar documents."""
-    path = get_faiss_path(user_id, function_name)
-
-    if not os.path.exists(path):
-        print(f"DEBUG: FAISS index not found at {path}. Returning empty list.")
-        return []
-
-    try:
-        faiss_store = FAISS.load_local(
-            path, embeddings_model, allow_dangerous_deserialization=True
-        )
-        print(f"DEBUG: Searching FAISS index at: {path} with query: {query[:50]}")
-        return faiss_store.similarity_search(query, k=k)
-    except Exception as e:
-        print(f"ERROR: Failed to load or search FAISS index at {path}. Error: {e}")
-        return []
+from __future__ import annotations
+
+import os
+import json
+import logging
+import uuid
+import zlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+from langchain_core.documents import Document
+
+from memory_graph.embedding_cache import CachedEmbeddings
+from memory_graph.embeddings import build_default_embeddings
+from memory_graph.instrumentation import increment, stage
+from memory_graph.versioning import bump_local_memory_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking, one writer process per index
+    fcntl = None
+
+logger = logging.getLogger("memory.faiss")
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# faiss, the LangChain FAISS wrapper and the embeddings client are imported or built
+# on first use, so importing this module (and every graph that uses it) stays cheap.
+
+FAISS_DIR = "vector_store"
+
+# Incremental on-disk layout inside each index directory. The base snapshot is the
+# faiss index (index.faiss) plus its notes' text and metadata in SQLite (notes.sqlite,
+# see `memory_graph.docstore`); notes added since the last compaction live in an
+# append-only vector segment plus a JSON-lines docstore log. Directories still holding
+# a pickled `save_local` docstore (index.pkl) are migrated to SQLite on first load.
+SEGMENT_FILE = "segment.vec"
+DOCSTORE_LOG_FILE = "docstore.log"
+# Worker processes sharing an index directory take an flock on this file: shared to
+# read the index files, exclusive to append to the log or compact. It is never
+# removed, unlike the log, so every process always locks the same file.
+LOCK_FILE = "index.lock"
+
+# Number of logged notes after which the log is folded back into the base snapshot
+FAISS_COMPACT_THRESHOLD = int(os.environ.get("FAISS_COMPACT_THRESHOLD", "64"))
+
+# Serve searches from memory-mapped, read-only segments instead of private in-memory copies
+FAISS_MMAP_SEARCH = os.environ.get("FAISS_MMAP_SEARCH", "false").lower() in ["true", "1", "yes", "on"]
+
+# Bounds for the process-wide index cache; overridable through the environment
+FAISS_CACHE_MAX_INDEXES = int(os.environ.get("FAISS_CACHE_MAX_INDEXES", "256"))
+FAISS_CACHE_MAX_BYTES = int(os.environ.get("FAISS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Indexes start as exact flat L2 indexes. Once one holds FAISS_PROMOTE_THRESHOLD
+# vectors it is rebuilt in the background as FAISS_PROMOTED_INDEX: "hnsw" (graph
+# search over full vectors) or "ivfpq" (clustered, product-quantized codes); "flat"
+# or a threshold of 0 disables promotion
+FAISS_PROMOTE_THRESHOLD = int(os.environ.get("FAISS_PROMOTE_THRESHOLD", "10000"))
+FAISS_PROMOTED_INDEX = os.environ.get("FAISS_PROMOTED_INDEX", "hnsw").lower()
+FAISS_HNSW_M = int(os.environ.get("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_SEARCH = int(os.environ.get("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_IVF_NPROBE = int(os.environ.get("FAISS_IVF_NPROBE", "16"))
+
+# Vector compression applied when an index is next compacted or rebuilt: "none" keeps
+# float32 vectors (4 bytes per dimension); "fp16" (2 bytes), "sq8" (1 byte) and "pq"
+# (about 1 byte per 8 dimensions) quantize them. Compressed indexes keep the exact
+# vectors in notes.sqlite on disk only, and re-rank the FAISS_RERANK_FACTOR * k
+# nearest candidates of a search by exact distance (1 disables re-ranking).
+# Compression is never undone by setting "none" again.
+FAISS_COMPRESSION = os.environ.get("FAISS_COMPRESSION", "none").lower()
+FAISS_RERANK_FACTOR = int(os.environ.get("FAISS_RERANK_FACTOR", "4"))
+# SQ8 learns per-dimension ranges and PQ 256-centroid codebooks from the vectors an
+# index is built from, so they wait until there are enough to learn from
+_COMPRESSION_MIN_VECTORS = {"fp16": 1, "sq8": 256, "pq": 39 * 256}
+
+# Cosine similarity at or above which a new note is a near-duplicate of an existing
+# note (or of an earlier note in the same batch); 0 disables deduplication
+FAISS_DEDUP_THRESHOLD = float(os.environ.get("FAISS_DEDUP_THRESHOLD", "0.95"))
+# "skip" drops near-duplicates; "merge" instead records them on the note they repeat
+# (its latest context and a `mentions` count)
+FAISS_DEDUP_MODE = os.environ.get("FAISS_DEDUP_MODE", "skip").lower()
+# Promoted indexes are only deduplicated against this many nearest notes per new note
+FAISS_DEDUP_CANDIDATES = int(os.environ.get("FAISS_DEDUP_CANDIDATES", "16"))
+
+# With FAISS_SHARDS > 0, notes of all users are hashed into that many shared indexes
+# per memory type instead of one index directory per user. Each note is tagged with
+# its user and searches are filtered to that user's vectors; subsets of up to
+# FAISS_FILTER_EXACT_LIMIT vectors are scanned exactly. The shard count is part of the
+# directory name, so changing it starts a new layout rather than mixing the two.
+FAISS_SHARDS = int(os.environ.get("FAISS_SHARDS", "0"))
+FAISS_FILTER_EXACT_LIMIT = int(os.environ.get("FAISS_FILTER_EXACT_LIMIT", "4096"))
+
+# Persistent content-addressed embedding cache shared by every index
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH", os.path.join(FAISS_DIR, "embedding_cache.sqlite")
+)
+
+# Global embeddings model to be reused, built by `get_embeddings_model`; the backend is
+# selected by `Configuration` and identical text is never embedded twice
+_embeddings_model: CachedEmbeddings | None = None
+_embeddings_model_lock = threading.Lock()
+
+
+def get_embeddings_model() -> CachedEmbeddings:
+    """Return the shared embeddings model, constructing it on first use."""
+    global _embeddings_model
+    if _embeddings_model is None:
+        with _embeddings_model_lock:
+            if _embeddings_model is None:
+                _embeddings_model = build_default_embeddings(cache_path=EMBEDDING_CACHE_PATH)
+    return _embeddings_model
+
+
+def __getattr__(name: str):
+    # Keep `faiss_store.embeddings_model` working without building it at import time
+    if name == "embeddings_model":
+        return get_embeddings_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def estimate_index_bytes(faiss_store: FAISS) -> int:
+    """Approximate the resident size of a loaded FAISS store (vectors plus note text)."""
+    import faiss
+
+    index = faiss_store.index
+    hnsw = getattr(index, "hnsw", None)
+    try:
+        code_size = (faiss.downcast_index(index.storage) if hnsw is not None else index).sa_code_size()
+    except Exception:
+        code_size = index.d * 4
+    if hnsw is not None:
+        # Base-layer neighbour links dominate the graph's footprint
+        code_size += hnsw.nb_neighbors(0) * 4
+    size = index.ntotal * code_size
+    docs = getattr(faiss_store.docstore, "_dict", {})
+    for doc in docs.values():
+        size += len(doc.page_content) + len(str(doc.metadata))
+    return size
+
+
+class FAISSIndexCache:
+    """Process-wide LRU cache of loaded FAISS indexes keyed by (owner, function_name).
+
+    The owner is the user, or the shard when notes are sharded (see `index_key`).
+
+    The cache is bounded both by the number of resident indexes and by their
+    approximate size in bytes; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_indexes: int = FAISS_CACHE_MAX_INDEXES, max_bytes: int = FAISS_CACHE_MAX_BYTES):
+        """Hold at most `max_indexes` indexes totalling at most `max_bytes`."""
+        self.max_indexes = max_indexes
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Tuple[str, str], Tuple[FAISS, int]] = OrderedDict()
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        """Return whether `key` is cached, without counting a hit or miss."""
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Tuple[str, str]) -> FAISS | None:
+        """Return the cached store for `key` and mark it most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[str, str], faiss_store: FAISS, size: int | None = None) -> None:
+        """Insert or refresh `key`, then evict until the cache is within bounds."""
+        if size is None:
+            size = estimate_index_bytes(faiss_store)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self._entries[key] = (faiss_store, size)
+            self.total_bytes += size
+            self._evict()
+
+    def invalidate(self, key: Tuple[str, str]) -> None:
+        """Drop `key` from the cache if present."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def clear(self) -> None:
+        """Drop every cached index and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self) -> None:
+        # Always keep the most recently inserted entry, even if it alone exceeds max_bytes
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_indexes or self.total_bytes > self.max_bytes
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+
+index_cache = FAISSIndexCache()
+
+# Read-only memory-mapped readers used when FAISS_MMAP_SEARCH is enabled
+mmap_reader_cache = FAISSIndexCache()
+
+# Serializes load/mutate/save/search per index so cached stores are never read mid-update
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_guard = threading.Lock()
+
+
+def _get_path_lock(path: str) -> threading.Lock:
+    with _path_locks_guard:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def _index_file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """Hold the inter-process lock of index directory `path` (see `LOCK_FILE`).
+
+    Readers of a directory that does not exist yet, or cannot be written to, go
+    without a lock: there is nothing to read, or no process can write to it. A reader
+    that finds a legacy pickled snapshot first migrates it (see
+    `_migrate_pickled_docstore`) under the exclusive lock, since migrating writes the
+    directory.
+    """
+    if fcntl is None:
+        yield
+        return
+    try:
+        fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        if not shared:
+            raise
+        yield
+        return
+    try:
+        if shared and os.path.exists(os.path.join(path, "index.pkl")):
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Another reader may have migrated it while this one waited
+            if os.path.exists(os.path.join(path, "index.pkl")):
+                _migrate_pickled_docstore(path)
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+@dataclass
+class _LogState:
+    """Committed extent of an index's append-only log, tracked per index directory.
+
+    `base_version` identifies the base snapshot (index.faiss) the log applies to, so a
+    cached store can tell when another process compacted or appended to the index.
+    """
+
+    records: int = 0
+    log_bytes: int = 0
+    segment_bytes: int = 0
+    base_version: int | None = None
+
+
+_log_states: Dict[str, _LogState] = {}
+_compactions_in_flight: set = set()
+_compactions_guard = threading.Lock()
+
+
+def shard_for(user_id: str) -> int:
+    """Return the shard holding `user_id`'s notes; stable across processes and restarts."""
+    return zlib.crc32(user_id.encode("utf-8")) % FAISS_SHARDS
+
+
+def index_key(user_id: str, function_name: str) -> Tuple[str, str]:
+    """Return the cache key of the index holding `user_id`'s notes of type `function_name`."""
+    if FAISS_SHARDS > 0:
+        return f"shard_{shard_for(user_id)}_of_{FAISS_SHARDS}", function_name
+    return user_id, function_name
+
+
+def get_faiss_path(user_id: str, function_name: str) -> str:
+    if FAISS_SHARDS > 0:
+        owner, _ = index_key(user_id, function_name)
+        return os.path.join(FAISS_DIR, f"faiss_{owner}_{function_name}")
+    return os.path.join(FAISS_DIR, f"faiss_index_{user_id}_{function_name}")
+
+
+def _open_faiss_store(path: str, index) -> FAISS:
+    """Wrap `index` and the SQLite notes of directory `path` in a LangChain FAISS store."""
+    from langchain_community.vectorstores import FAISS
+
+    from memory_graph.docstore import NoteTable, PositionMap, SQLiteDocstore
+
+    notes = NoteTable(path, base_count=index.ntotal)
+    return FAISS(get_embeddings_model(), index, SQLiteDocstore(notes), PositionMap(notes))
+
+
+def _new_faiss_store(path: str, dim: int) -> FAISS:
+    """Create an empty flat L2 store, matching what `FAISS.from_embeddings` builds."""
+    import faiss
+
+    return _open_faiss_store(path, faiss.IndexFlatL2(dim))
+
+
+def _migrate_pickled_docstore(path: str) -> None:
+    """Move the notes of a legacy `save_local` snapshot (index.pkl) into SQLite."""
+    import pickle
+
+    from memory_graph.docstore import NoteTable
+
+    pickle_path = os.path.join(path, "index.pkl")
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    notes = NoteTable(path, base_count=len(index_to_docstore_id))
+    rows = []
+    for position, doc_id in index_to_docstore_id.items():
+        doc = docstore.search(doc_id)
+        rows.append((position, Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)))
+    notes.import_rows(rows)
+    notes.close()
+    os.remove(pickle_path)
+    logger.debug("Migrated %s pickled note(s) to SQLite at: %s", len(rows), path)
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # About 8 dimensions per sub-quantizer; PQ needs `dim` to split evenly
+    for m in range(max(dim // 8, 1), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def build_index(kind: str, vectors: np.ndarray, compression: str = "none"):
+    """Build a faiss index of type `kind` ("flat", "hnsw" or "ivfpq") holding `vectors`.
+
+    `compression` ("none", "fp16", "sq8" or "pq") selects how flat and HNSW indexes
+    store vectors; "ivfpq" always stores product-quantized codes.
+    """
+    import faiss
+
+    count, dim = vectors.shape
+    scalar_types = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+    if compression not in ("none", "pq", *scalar_types):
+        raise ValueError(f"Unknown FAISS compression: {compression!r}")
+    if kind == "flat":
+        if compression in scalar_types:
+            index = faiss.IndexScalarQuantizer(dim, scalar_types[compression], faiss.METRIC_L2)
+        elif compression == "pq":
+            index = faiss.IndexPQ(dim, _pq_subquantizers(dim), 8)
+        else:
+            index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        if compression in scalar_types:
+            index = faiss.IndexHNSWSQ(dim, scalar_types[compression], FAISS_HNSW_M)
+        elif compression == "pq":
+            index = faiss.IndexHNSWPQ(dim, _pq_subquantizers(dim), FAISS_HNSW_M)
+        else:
+            index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    elif kind == "ivfpq":
+        # k-means wants ~39 training points per centroid, for the coarse lists and the PQ codebooks alike
+        nlist = max(1, min(int(4 * np.sqrt(count)), count // 39))
+        nbits = int(max(1, min(8, np.log2(max(count // 39, 2)))))
+        index = faiss.index_factory(dim, f"IVF{nlist},PQ{_pq_subquantizers(dim)}x{nbits}")
+        index.train(vectors)
+        index.nprobe = min(FAISS_IVF_NPROBE, nlist)
+        # Lets deduplication reconstruct stored vectors by id
+        faiss.extract_index_ivf(index).make_direct_map()
+    else:
+        raise ValueError(f"Unknown FAISS index type: {kind!r}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def index_layout(index) -> Tuple[str, str]:
+    """Return the (kind, compression) of `index`, as passed to `build_index`."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIVF):
+        return "ivfpq", "pq"
+    kind = "hnsw" if isinstance(index, faiss.IndexHNSW) else "flat"
+    codes = faiss.downcast_index(index.storage) if kind == "hnsw" else index
+    if isinstance(codes, faiss.IndexScalarQuantizer):
+        return kind, "fp16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(codes, faiss.IndexPQ):
+        return kind, "pq"
+    return kind, "none"
+
+
+def _is_flat(index) -> bool:
+    # Exhaustive scans, whether over full vectors or compressed codes
+    return index_layout(index)[0] == "flat"
+
+
+def _is_compressed(index) -> bool:
+    return index_layout(index)[1] != "none"
+
+
+def _should_promote(index) -> bool:
+    return (
+        FAISS_PROMOTED_INDEX != "flat"
+        and 0 < FAISS_PROMOTE_THRESHOLD <= index.ntotal
+        and _is_flat(index)
+    )
+
+
+def _target_layout(index) -> Tuple[str, str] | None:
+    """Return the (kind, compression) `index` should be rebuilt as, or None if it is fine as is."""
+    kind, compression = current = index_layout(index)
+    if _should_promote(index):
+        kind = FAISS_PROMOTED_INDEX
+    if kind == "ivfpq":
+        compression = "pq"
+    elif FAISS_COMPRESSION != "none" and index.ntotal >= _COMPRESSION_MIN_VECTORS.get(FAISS_COMPRESSION, 0):
+        compression = FAISS_COMPRESSION
+    return None if (kind, compression) == current else (kind, compression)
+
+
+def _keeps_exact_vectors(index) -> bool:
+    # Exact vectors only need to be kept beside indexes that are, or will be, compressed
+    return FAISS_COMPRESSION != "none" or _is_compressed(index)
+
+
+def _exact_vectors(faiss_store: FAISS, start: int, count: int) -> np.ndarray:
+    """Return the full-precision vectors at positions `start` to `start + count`.
+
+    Compressed indexes read them from the notes table; positions without a recorded
+    vector fall back to the index's own approximation.
+    """
+    vectors = faiss_store.index.reconstruct_n(start, count)
+    if _is_compressed(faiss_store.index):
+        for i, vector in enumerate(faiss_store.docstore.table.embeddings_at(range(start, start + count))):
+            if vector is not None:
+                vectors[i] = vector
+    return vectors
+
+
+def _user_positions(faiss_store: FAISS, user_id: str) -> np.ndarray:
+    """Return the index positions of `user_id`'s notes: all of them unless notes are sharded."""
+    if FAISS_SHARDS <= 0:
+        return np.arange(faiss_store.index.ntotal)
+    return np.asarray(faiss_store.docstore.table.positions_for_user(user_id), dtype=np.int64)
+
+
+def search_subset(index, query: np.ndarray, k: int, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the distances and positions of the `k` nearest vectors to `query` among `positions`."""
+    k = min(k, len(positions))
+    if k == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    if len(positions) == index.ntotal:
+        distances, found = index.search(query[None, :], k)
+    elif len(positions) <= FAISS_FILTER_EXACT_LIMIT:
+        # Scanning a small subset exactly is cheap, and unlike a filtered graph search it
+        # cannot dead-end on neighbours that belong to other users
+        vectors = index.reconstruct_batch(positions)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:k]
+        return distances[order], positions[order]
+    else:
+        import faiss
+
+        selector = faiss.IDSelectorBatch(positions)
+        if hasattr(index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, k))
+        elif isinstance(index, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        distances, found = index.search(query[None, :], k, params=params)
+    keep = found[0] >= 0
+    return distances[0][keep], found[0][keep]
+
+
+def rerank(notes, query: np.ndarray, distances: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-order approximate search candidates by their exact distance to `query`; keep the best `k`.
+
+    Exact vectors are read from the `notes` table in one query; candidates without
+    one keep their approximate distance.
+    """
+    distances = np.array(distances, dtype=np.float32)
+    for i, vector in enumerate(notes.embeddings_at(positions)):
+        if vector is not None:
+            distances[i] = ((vector - query) ** 2).sum()
+    order = np.argsort(distances, kind="stable")[:k]
+    return distances[order], positions[order]
+
+
+def search_notes(index, notes, query: np.ndarray, k: int, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Like `search_subset`, re-ranking a compressed index's nearest candidates exactly."""
+    if FAISS_RERANK_FACTOR > 1 and _is_compressed(index):
+        distances, found = search_subset(index, query, k * FAISS_RERANK_FACTOR, positions)
+        return rerank(notes, query, distances, found, k)
+    return search_subset(index, query, k, positions)
+
+
+def _base_version(path: str) -> int | None:
+    try:
+        return os.stat(os.path.join(path, "index.faiss")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _log_size(path: str) -> int:
+    try:
+        return os.path.getsize(os.path.join(path, DOCSTORE_LOG_FILE))
+    except FileNotFoundError:
+        return 0
+
+
+def _read_log(
+    path: str, mmap: bool = False, since: _LogState | None = None
+) -> Tuple[List[dict], np.ndarray, _LogState]:
+    """Read committed log records and their vectors, ignoring any torn trailing write.
+
+    A record is committed once its log line is fully written; the vector row is
+    written first, so the segment may hold a partial row past the last record.
+    With `mmap`, vectors are a read-only `np.memmap` view instead of a private copy.
+    With `since`, only records committed after that extent are read; the returned
+    state is the extent of the whole log either way.
+    """
+    since = since or _LogState()
+    log_path = os.path.join(path, DOCSTORE_LOG_FILE)
+    segment_path = os.path.join(path, SEGMENT_FILE)
+    if not os.path.exists(log_path) or not os.path.exists(segment_path):
+        return [], np.empty((0, 0), dtype=np.float32), since
+
+    records: List[dict] = []
+    line_ends: List[int] = []
+    with open(log_path, "rb") as f:
+        f.seek(since.log_bytes)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            records.append(json.loads(line))
+            line_ends.append((line_ends[-1] if line_ends else 0) + len(line))
+    if not records:
+        return [], np.empty((0, 0), dtype=np.float32), since
+
+    dim = records[0]["dim"]
+    rows = min(len(records), max(os.path.getsize(segment_path) - since.segment_bytes, 0) // (dim * 4))
+    records = records[:rows]
+    if mmap and rows:
+        vectors = np.memmap(
+            segment_path, dtype=np.float32, mode="r", offset=since.segment_bytes, shape=(rows, dim)
+        )
+    else:
+        vectors = np.fromfile(
+            segment_path, dtype=np.float32, count=rows * dim, offset=since.segment_bytes
+        ).reshape(rows, dim)
+    state = _LogState(
+        records=since.records + rows,
+        log_bytes=since.log_bytes + (line_ends[rows - 1] if rows else 0),
+        segment_bytes=since.segment_bytes + rows * dim * 4,
+        base_version=since.base_version,
+    )
+    return records, vectors, state
+
+
+def _read_faiss_store(path: str) -> FAISS | None:
+    """Load the base snapshot (if any) and replay the append-only log on top of it."""
+    import faiss
+
+    # Readers have already migrated under the exclusive lock (see `_index_file_lock`);
+    # this covers writers and platforms without file locks
+    if os.path.exists(os.path.join(path, "index.pkl")):
+        _migrate_pickled_docstore(path)
+
+    faiss_store = None
+    base_version = _base_version(path)
+    if base_version is not None:
+        faiss_store = _open_faiss_store(path, faiss.read_index(os.path.join(path, "index.faiss")))
+
+    records, vectors, _log_states[path] = _read_log(path, since=_LogState(base_version=base_version))
+    return _replay_log(path, faiss_store, records, vectors)
+
+
+def _replay_log(path: str, faiss_store: FAISS | None, records: List[dict], vectors: np.ndarray) -> FAISS | None:
+    """Apply log `records` and their `vectors` to `faiss_store`, creating it if needed."""
+    if records:
+        if faiss_store is None:
+            faiss_store = _new_faiss_store(path, vectors.shape[1])
+        # A crash mid-compaction can leave records that already made it into the base
+        notes = faiss_store.docstore.table
+        keep = [i for i, r in enumerate(records) if not r.get("merge") and not notes.contains(r["id"])]
+        if keep:
+            faiss_store.add_embeddings(
+                [(records[i]["page_content"], vectors[i]) for i in keep],
+                metadatas=[records[i]["metadata"] for i in keep],
+                ids=[records[i]["id"] for i in keep],
+            )
+            if _keeps_exact_vectors(faiss_store.index):
+                notes.set_embeddings({records[i]["id"]: vectors[i] for i in keep})
+        for record in records:
+            if record.get("merge"):
+                _apply_merge(faiss_store, record["id"], record["metadata"])
+    return faiss_store
+
+
+def _apply_merge(faiss_store: FAISS, doc_id: str, metadata: dict) -> None:
+    faiss_store.docstore.table.update_metadata(doc_id, metadata)
+
+
+def _refresh_cached_store(path: str, faiss_store: FAISS) -> bool:
+    """Catch a cached store up with notes other processes appended to its log.
+
+    Returns False if the store can no longer be caught up, because the base snapshot
+    was replaced (another process compacted it) or the log was rewritten.
+    """
+    state = _log_states.get(path)
+    if state is None or _base_version(path) != state.base_version:
+        return False
+    log_size = _log_size(path)
+    if log_size < state.log_bytes:
+        return False
+    if log_size > state.log_bytes:
+        records, vectors, _log_states[path] = _read_log(path, since=state)
+        _replay_log(path, faiss_store, records, vectors)
+        logger.debug("Replayed %s note(s) appended by other processes at: %s", len(records), path)
+    return True
+
+
+def _load_faiss_store(user_id: str, function_name: str) -> FAISS | None:
+    """Return the index for a user from the cache, loading it from disk on a miss.
+
+    A cached index is first checked against its files, so notes written by other
+    worker processes are picked up: appended notes are replayed, and an index
+    another process compacted is reloaded.
+    """
+    key = index_key(user_id, function_name)
+    path = get_faiss_path(user_id, function_name)
+    faiss_store = index_cache.get(key)
+    if faiss_store is not None:
+        if _refresh_cached_store(path, faiss_store):
+            return faiss_store
+        index_cache.invalidate(key)
+
+    if not os.path.exists(path):
+        return None
+
+    faiss_store = _read_faiss_store(path)
+    if faiss_store is not None:
+        index_cache.put(key, faiss_store)
+        if _target_layout(faiss_store.index) is not None:
+            _schedule_maintenance(user_id, function_name)
+    return faiss_store
+
+
+@dataclass(frozen=True)
+class _MmapLog:
+    """Snapshot of an index's append-only log as seen by a `MmapIndexReader`.
+
+    A refresh replaces the whole snapshot at once, so a search running concurrently
+    never mixes records, vectors and masks from different reads of the log.
+    """
+
+    size: int
+    records: List[dict]
+    vectors: np.ndarray
+    live: np.ndarray
+    merged_metadata: Dict[str, dict]
+    users: np.ndarray
+
+
+class MmapIndexReader:
+    """Read-only view of an index directory whose vectors stay in the page cache.
+
+    The sealed base snapshot is opened with faiss memory mapping and the append-only
+    segment as an `np.memmap`, so worker processes share the same physical pages and
+    a cold search only faults in the pages it touches.
+    """
+
+    def __init__(self, path: str):
+        """Map the index directory at `path`."""
+        self.path = path
+        from memory_graph.docstore import NoteTable
+
+        self.index = None
+        self.base_version = _base_version(path)
+        if self.base_version is not None:
+            import faiss
+
+            # Only left for platforms without file locks (see `_index_file_lock`)
+            if os.path.exists(os.path.join(path, "index.pkl")):
+                _migrate_pickled_docstore(path)
+            # IO_FLAG_MMAP_IFC maps flat index codes directly; older faiss builds only know IO_FLAG_MMAP
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            self.index = faiss.read_index(os.path.join(path, "index.faiss"), flags)
+        self.notes = NoteTable(path, base_count=self.index.ntotal if self.index is not None else 0, read_only=True)
+        self._load_log()
+
+    def _load_log(self) -> None:
+        records, vectors, _ = _read_log(self.path, mmap=True)
+        # Records already folded into the base by an interrupted compaction are masked
+        # out, as are merge records, which only carry updated metadata for an earlier note
+        self.log = _MmapLog(
+            size=_log_size(self.path),
+            records=records,
+            vectors=vectors,
+            live=np.array([not r.get("merge") and not self.notes.contains(r["id"]) for r in records], dtype=bool),
+            merged_metadata={r["id"]: r["metadata"] for r in records if r.get("merge")},
+            users=np.array([r["metadata"].get("user_id") for r in records], dtype=object),
+        )
+
+    def refresh(self) -> bool:
+        """Pick up log appends; return False if the base was compacted and a reopen is needed."""
+        if _base_version(self.path) != self.base_version:
+            return False
+        if _log_size(self.path) != self.log.size:
+            self._load_log()
+        return True
+
+    def resident_bytes(self) -> int:
+        """Approximate private memory held by this reader; mapped vectors and SQLite rows are not counted."""
+        return sum(len(r["page_content"]) for r in self.log.records)
+
+    def search(self, embedding: List[float], k: int, user_id: str | None = None) -> List[Tuple[Document, float]]:
+        """Return the `k` nearest documents and their L2 distances across base and log segments.
+
+        With `user_id`, only that user's notes in a shared (sharded) index are searched.
+        """
+        query = np.asarray([embedding], dtype=np.float32)
+        candidates: List[Tuple[float, Document]] = []
+        # A concurrent refresh swaps in a new log snapshot; keep searching this one
+        log = self.log
+
+        if self.index is not None and self.index.ntotal:
+            if user_id is None:
+                positions = np.arange(self.index.ntotal)
+            else:
+                positions = np.asarray(self.notes.positions_for_user(user_id), dtype=np.int64)
+            distances, positions = search_notes(self.index, self.notes, query[0], k, positions)
+            for distance, doc in zip(distances, self.notes.documents_at(positions)):
+                if doc is None:
+                    continue
+                if doc.id in log.merged_metadata:
+                    doc = Document(id=doc.id, page_content=doc.page_content, metadata=log.merged_metadata[doc.id])
+                candidates.append((float(distance), doc))
+
+        if log.records:
+            distances = ((log.vectors - query) ** 2).sum(axis=1)
+            distances[~log.live] = np.inf
+            if user_id is not None:
+                distances[log.users != user_id] = np.inf
+            for row in np.argsort(distances)[:k]:
+                if np.isinf(distances[row]):
+                    break
+                record = log.records[row]
+                metadata = log.merged_metadata.get(record["id"], record["metadata"])
+                candidates.append((
+                    float(distances[row]),
+                    Document(id=record["id"], page_content=record["page_content"], metadata=metadata),
+                ))
+
+        candidates.sort(key=lambda c: c[0])
+        return [(doc, distance) for distance, doc in candidates[:k]]
+
+
+def _get_mmap_reader(user_id: str, function_name: str) -> MmapIndexReader | None:
+    """Return a fresh read-only reader for the index, reopening it after compaction."""
+    key = index_key(user_id, function_name)
+    path = get_faiss_path(user_id, function_name)
+    reader = mmap_reader_cache.get(key)
+    if reader is not None:
+        with _index_file_lock(path, shared=True):
+            if reader.refresh():
+                return reader
+
+    if not os.path.exists(path):
+        return None
+    # Hold the writer locks so the reader never sees a compaction between its index and notes
+    with _get_path_lock(path), _index_file_lock(path, shared=True):
+        reader = MmapIndexReader(path)
+    mmap_reader_cache.put(key, reader, size=reader.resident_bytes())
+    return reader
+
+
+def _append_to_log(
+    path: str,
+    entries: List[Tuple[str, dict]],
+    embeddings: List[List[float]],
+    ids: List[str],
+    merges: List[bool] | None = None,
+) -> None:
+    """Append vectors and their docstore records; O(1) I/O in the size of the index.
+
+    Records flagged in `merges` replace the metadata of the existing note `id`; their
+    vector row only keeps the segment aligned with the log and is never indexed.
+
+    The caller holds the exclusive index file lock and has caught its store up with
+    the log (see `_load_faiss_store`). The committed extent is re-read from disk, and
+    writes start there, so only a torn write left behind by a crashed writer is
+    ever overwritten.
+    """
+    state = _log_states.setdefault(path, _LogState(base_version=_base_version(path)))
+    _, _, committed = _read_log(path, since=state)
+    if committed.log_bytes != state.log_bytes:
+        raise RuntimeError(f"FAISS log at {path} holds notes this process has not loaded")
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vector_bytes = vectors.tobytes()
+    records = []
+    for i, (id_, (text, metadata)) in enumerate(zip(ids, entries)):
+        record = {"id": id_, "dim": vectors.shape[1], "page_content": text, "metadata": metadata}
+        if merges is not None and merges[i]:
+            record["merge"] = True
+        records.append(json.dumps(record) + "\n")
+    log_bytes = "".join(records).encode("utf-8")
+
+    for name, offset, data in (
+        (SEGMENT_FILE, state.segment_bytes, vector_bytes),
+        (DOCSTORE_LOG_FILE, state.log_bytes, log_bytes),
+    ):
+        file_path = os.path.join(path, name)
+        with open(file_path, "r+b" if os.path.exists(file_path) else "wb") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    state.records += len(ids)
+    state.segment_bytes += len(vector_bytes)
+    state.log_bytes += len(log_bytes)
+
+
+def compact_faiss_index(user_id: str, function_name: str) -> None:
+    """Fold the append-only log into a fresh base snapshot and truncate the log."""
+    import faiss
+
+    path = get_faiss_path(user_id, function_name)
+    with _get_path_lock(path), _index_file_lock(path):
+        faiss_store = _load_faiss_store(user_id, function_name)
+        if faiss_store is None:
+            return
+
+        # Notes go first: should the index below never be replaced, rows past its
+        # size are dropped on the next load and replayed from the log instead
+        faiss_store.docstore.table.flush()
+        tmp_file = os.path.join(path, "index.faiss.tmp")
+        faiss.write_index(faiss_store.index, tmp_file)
+        os.replace(tmp_file, os.path.join(path, "index.faiss"))
+
+        for name in (DOCSTORE_LOG_FILE, SEGMENT_FILE):
+            log_file = os.path.join(path, name)
+            if os.path.exists(log_file):
+                os.truncate(log_file, 0)
+        _log_states[path] = _LogState(base_version=_base_version(path))
+    logger.debug("Compacted FAISS index at: %s", path)
+
+
+def rebuild_faiss_index(user_id: str, function_name: str, layout: Tuple[str, str] | None = None) -> bool:
+    """Rebuild an index as `layout`, a (kind, compression) pair, and persist it.
+
+    By default the index is promoted once it is large enough (see `_should_promote`)
+    and compressed as `FAISS_COMPRESSION`. The new index is built from a snapshot of
+    the exact vectors without holding the index lock, so searches and inserts carry
+    on meanwhile; vectors appended during the build are added before the new index
+    is swapped in. Returns whether the index was rebuilt.
+    """
+    path = get_faiss_path(user_id, function_name)
+    with _get_path_lock(path), _index_file_lock(path, shared=True):
+        faiss_store = _load_faiss_store(user_id, function_name)
+        if faiss_store is None:
+            return False
+        current = index_layout(faiss_store.index)
+        layout = layout or _target_layout(faiss_store.index)
+        if layout is None or layout == current:
+            return False
+        count = faiss_store.index.ntotal
+        vectors = _exact_vectors(faiss_store, 0, count)
+
+    kind, compression = layout
+    index = build_index(kind, vectors, compression)
+
+    with _get_path_lock(path), _index_file_lock(path):
+        faiss_store = _load_faiss_store(user_id, function_name)
+        if faiss_store is None or index_layout(faiss_store.index) != current or faiss_store.index.ntotal < count:
+            return False
+        if faiss_store.index.ntotal > count:
+            appended = _exact_vectors(faiss_store, count, faiss_store.index.ntotal - count)
+            index.add(appended)
+            vectors = np.vstack([vectors, appended])
+        if _is_compressed(index) and not _is_compressed(faiss_store.index):
+            # The index only holds approximations from here on
+            faiss_store.docstore.table.fill_embeddings(vectors)
+        faiss_store.index = index
+        index_cache.put(index_key(user_id, function_name), faiss_store)
+    # Make the rebuilt index the new base snapshot
+    compact_faiss_index(user_id, function_name)
+    logger.debug("Rebuilt FAISS index at %s as %s (%s vectors)", path, layout, index.ntotal)
+    return True
+
+
+def _schedule_maintenance(user_id: str, function_name: str) -> None:
+    """Rebuild (see `rebuild_faiss_index`) or else compact an index on a background thread.
+
+    At most one maintenance run per index is in flight; requests made meanwhile are
+    dropped, and the next insert or load that needs one asks again.
+    """
+    key = index_key(user_id, function_name)
+    with _compactions_guard:
+        if key in _compactions_in_flight:
+            return
+        _compactions_in_flight.add(key)
+
+    def run() -> None:
+        try:
+            if not rebuild_faiss_index(user_id, function_name):
+                compact_faiss_index(user_id, function_name)
+        except Exception as e:
+            logger.error("Failed to maintain FAISS index for %s. Error: %s", key, e)
+        finally:
+            with _compactions_guard:
+                _compactions_in_flight.discard(key)
+
+    threading.Thread(target=run, name=f"faiss-maintain-{user_id}-{function_name}", daemon=True).start()
+
+
+def find_near_duplicates(existing: np.ndarray, new: np.ndarray, threshold: float) -> np.ndarray:
+    """Match each row of `new` to the vector it nearly duplicates, by cosine similarity.
+
+    Rows of `new` are compared against every row of `existing` and every earlier row
+    of `new` in one matrix product. Returns, per new row, the index of its most
+    similar match in `existing` followed by `new` (at or above `threshold`), or -1.
+    A row matching an earlier duplicate in the batch is pointed at that duplicate's
+    own match, so every index refers to a vector that is actually kept.
+    """
+    existing = existing.reshape(-1, new.shape[1])
+    vectors = np.vstack([existing, new])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    n, m = len(existing), len(new)
+
+    similarities = unit[n:] @ unit.T
+    # Only earlier notes in the batch count; a note never matches itself or later ones
+    similarities[:, n:][~np.tri(m, k=-1, dtype=bool)] = -np.inf
+    best = similarities.argmax(axis=1)
+    matches = np.where(similarities[np.arange(m), best] >= threshold, best, -1)
+    for i, match in enumerate(matches):
+        if match >= n and matches[match - n] != -1:
+            matches[i] = matches[match - n]
+    return matches
+
+
+class DedupStats:
+    """Counts of notes checked for near-duplicates at insert and what happened to them."""
+
+    def __init__(self):
+        """Start every counter at zero."""
+        self._lock = threading.Lock()
+        self.checked = self.skipped = self.merged = 0
+
+    def add(self, checked: int, skipped: int, merged: int) -> None:
+        """Add the outcome of one deduplicated insert."""
+        with self._lock:
+            self.checked += checked
+            self.skipped += skipped
+            self.merged += merged
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters and the fraction of checked notes that were duplicates."""
+        with self._lock:
+            duplicates = self.skipped + self.merged
+            return {
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "merged": self.merged,
+                "dedup_rate": duplicates / self.checked if self.checked else 0.0,
+            }
+
+
+dedup_stats = DedupStats()
+
+
+def _merged_metadata(existing: dict, duplicate: dict) -> dict:
+    merged = {**existing, "mentions": existing.get("mentions", 1) + duplicate.get("mentions", 1)}
+    if duplicate.get("context"):
+        merged["context"] = duplicate["context"]
+    return merged
+
+
+def _deduplicate(
+    faiss_store: FAISS, user_id: str, entries: List[Tuple[str, dict]], embeddings: List[List[float]]
+) -> Tuple[List[int], List[Tuple[str, dict, List[float]]]]:
+    """Drop or merge `user_id`'s near-duplicate notes before they are added to `faiss_store`.
+
+    Returns the indexes of the entries to insert and, in merge mode, the
+    (existing id, merged metadata, embedding) updates to apply to existing notes.
+    Metadata of kept entries that absorb later duplicates in the batch is updated in place.
+    """
+    index = faiss_store.index
+    new = np.asarray(embeddings, dtype=np.float32)
+    positions = _user_positions(faiss_store, user_id)
+    if not _is_flat(index) and len(positions) > FAISS_DEDUP_CANDIDATES:
+        # Too large to compare against in full; the nearest neighbours of each new note are the candidates
+        positions = np.unique(np.concatenate([
+            search_subset(index, vector, FAISS_DEDUP_CANDIDATES, positions)[1] for vector in new
+        ]))
+    if len(positions) == index.ntotal and _is_flat(index):
+        existing = index.reconstruct_n(0, index.ntotal)
+    elif len(positions):
+        existing = index.reconstruct_batch(positions)
+    else:
+        existing = np.empty((0, index.d), dtype=np.float32)
+    matches = find_near_duplicates(existing, new, FAISS_DEDUP_THRESHOLD)
+
+    keep: List[int] = []
+    updates: Dict[str, Tuple[dict, List[float]]] = {}
+    merge = FAISS_DEDUP_MODE == "merge"
+    for i, match in enumerate(matches):
+        if match == -1:
+            keep.append(i)
+        elif merge and match >= len(existing):
+            target = entries[match - len(existing)][1]
+            target.update(_merged_metadata(target, entries[i][1]))
+        elif merge:
+            doc_id = faiss_store.index_to_docstore_id[int(positions[match])]
+            current = updates.get(doc_id, (faiss_store.docstore.search(doc_id).metadata, None))[0]
+            updates[doc_id] = (_merged_metadata(current, entries[i][1]), embeddings[i])
+
+    duplicates = len(entries) - len(keep)
+    dedup_stats.add(len(entries), 0 if merge else duplicates, duplicates if merge else 0)
+    if duplicates:
+        increment("faiss.notes_deduplicated", duplicates)
+        logger.debug("Dropped %s near-duplicate note(s) of %s (mode=%s)", duplicates, len(entries), FAISS_DEDUP_MODE)
+    return keep, [(doc_id, metadata, embedding) for doc_id, (metadata, embedding) in updates.items()]
+
+
+def store_note_embedding(user_id: str, function_name: str, memory: dict) -> None:
+    """Embed and store a single memory in FAISS."""
+    store_note_embeddings(user_id, function_name, [memory])
+
+
+def store_note_embeddings(user_id: str, function_name: str, memories: List[dict]) -> None:
+    """Embed and store a batch of memories in FAISS with one embedding call and one index write."""
+    entries = []
+    for memory in memories:
+        content = memory.get("content", "")
+        if not content:
+            logger.warning("Attempted to store empty note content to FAISS.")
+            continue
+        metadata = {"context": memory.get("context", "")}
+        if FAISS_SHARDS > 0:
+            # Shared indexes hold many users' notes; searches filter on this tag
+            metadata["user_id"] = user_id
+        entries.append((content, metadata))
+    if not entries:
+        return
+
+    # Embed before taking the index lock so slow embedding calls never block searches
+    with stage("faiss_embed"):
+        embeddings = get_embeddings_model().embed_documents([text for text, _ in entries])
+    ids = [str(uuid.uuid4()) for _ in entries]
+
+    path = get_faiss_path(user_id, function_name)
+    os.makedirs(path, exist_ok=True)
+
+    with stage("faiss_insert"), _get_path_lock(path), _index_file_lock(path):
+        try:
+            faiss_store = _load_faiss_store(user_id, function_name)
+        except Exception as e:
+            from memory_graph.docstore import NOTES_DB_FILE
+
+            logger.error("Could not load existing FAISS index at %s. Error: %s. Creating new one.", path, e)
+            faiss_store = None
+            index_cache.invalidate(index_key(user_id, function_name))
+            for name in (DOCSTORE_LOG_FILE, SEGMENT_FILE, "index.faiss", "index.pkl", NOTES_DB_FILE):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+            _log_states[path] = _LogState()
+
+        if faiss_store is None:
+            faiss_store = _new_faiss_store(path, len(embeddings[0]))
+            logger.debug("Created new FAISS index at: %s", path)
+
+        merges: List[bool] = []
+        if FAISS_DEDUP_THRESHOLD > 0:
+            keep, updates = _deduplicate(faiss_store, user_id, entries, embeddings)
+            entries = [entries[i] for i in keep]
+            embeddings = [embeddings[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            merges = [False] * len(ids)
+            for doc_id, metadata, embedding in updates:
+                _apply_merge(faiss_store, doc_id, metadata)
+                entries.append((faiss_store.docstore.search(doc_id).page_content, metadata))
+                embeddings.append(embedding)
+                ids.append(doc_id)
+                merges.append(True)
+            if not ids:
+                return
+
+        new_count = len(ids) - sum(merges)
+        if new_count:
+            faiss_store.add_embeddings(
+                [(text, embedding) for (text, _), embedding in zip(entries[:new_count], embeddings[:new_count])],
+                metadatas=[metadata for _, metadata in entries[:new_count]],
+                ids=ids[:new_count],
+            )
+            if _keeps_exact_vectors(faiss_store.index):
+                faiss_store.docstore.table.set_embeddings(dict(zip(ids[:new_count], embeddings[:new_count])))
+        _append_to_log(path, entries, embeddings, ids, merges or None)
+        index_cache.put(index_key(user_id, function_name), faiss_store)
+        needs_compaction = _log_states[path].records >= FAISS_COMPACT_THRESHOLD
+        # Small indexes are only compressed once their log is compacted anyway
+        needs_rebuild = _should_promote(faiss_store.index)
+    logger.debug("Appended %s document(s) to FAISS index at: %s", len(ids), path)
+    bump_local_memory_version(user_id)
+
+    if needs_compaction or needs_rebuild:
+        _schedule_maintenance(user_id, function_name)
+
+
+def search_faiss(user_id: str, function_name: str, query: str, k: int = 5) -> List[Document]:
+    """Search the FAISS index for similar documents."""
+    return [doc for doc, _ in search_faiss_with_scores(user_id, function_name, query, k)]
+
+
+def search_faiss_with_scores(user_id: str, function_name: str, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+    """Search the FAISS index for similar documents, returning (document, L2 distance) pairs."""
+    path = get_faiss_path(user_id, function_name)
+
+    if index_key(user_id, function_name) not in index_cache and not os.path.exists(path):
+        logger.debug("FAISS index not found at %s. Returning empty list.", path)
+        return []
+
+    try:
+        with stage("faiss_embed"):
+            embedding = get_embeddings_model().embed_query(query)
+        if FAISS_MMAP_SEARCH:
+            with stage("faiss_search"):
+                reader = _get_mmap_reader(user_id, function_name)
+                logger.debug("Searching memory-mapped FAISS index at: %s with query: %s", path, query[:50])
+                if reader is None:
+                    return []
+                return reader.search(embedding, k, user_id=user_id if FAISS_SHARDS > 0 else None)
+
+        with stage("faiss_search"), _get_path_lock(path), _index_file_lock(path, shared=True):
+            faiss_store = _load_faiss_store(user_id, function_name)
+            if faiss_store is None:
+                logger.debug("FAISS index not found at %s. Returning empty list.", path)
+                return []
+            logger.debug("Searching FAISS index at: %s with query: %s", path, query[:50])
+            if FAISS_SHARDS <= 0 and not _is_compressed(faiss_store.index):
+                return faiss_store.similarity_search_with_score_by_vector(embedding, k=k)
+            distances, positions = search_notes(
+                faiss_store.index, faiss_store.docstore.table, np.asarray(embedding, dtype=np.float32), k,
+                _user_positions(faiss_store, user_id),
+            )
+            docs = faiss_store.docstore.table.documents_at(positions)
+            return [(doc, float(distance)) for distance, doc in zip(distances, docs) if doc is not None]
+    except Exception as e:
+        logger.error("Failed to load or search FAISS index at %s. Error: %s", path, e)
+        return []
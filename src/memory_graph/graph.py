@@ -4,17 +4,22 @@ import asyncio
 import functools
 import logging
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Tuple
 
 from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
+from pydantic import BaseModel, Field, create_model
+from langgraph.config import get_store
 from langgraph.func import entrypoint, task
 from langgraph.graph import add_messages
-from langmem import create_memory_store_manager
 from typing_extensions import Annotated, TypedDict
 from langchain_core.runnables import RunnableConfig 
 
 from memory_graph import configuration
-from memory_graph.faiss_store import store_note_embedding, embeddings_model, FAISS_DIR
+from memory_graph.faiss_store import store_note_embedding, store_note_embeddings
+from memory_graph.instrumentation import configure_logging, increment, stage
+from memory_graph.limiter import extraction_limiter
+from memory_graph.manager_cache import memory_config_fingerprint, store_manager_cache
+from memory_graph.versioning import abump_memory_version
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
@@ -27,12 +32,30 @@ logger = logging.getLogger("memory")
 def manual_save_note_to_faiss(user_id: str, content: str, context: str = "") -> None:
     """Manually saves a notable memory into a FAISS vector store."""
     memory_to_store = {"content": content, "context": context}
-    print(f"DEBUG: Manually calling store_note_embedding for user '{user_id}': {content[:50]}...")
+    logger.debug("Manually calling store_note_embedding for user '%s': %s...", user_id, content[:50])
     store_note_embedding(user_id, "Note", memory_to_store)
 
-def get_store_manager(function_name: str, model: str, user_id: str, memory_types: list[configuration.MemoryConfig]):
-    """Create store manager without caching to avoid unhashable type errors."""
-    
+def manual_save_notes_to_faiss(user_id: str, notes: list[dict]) -> None:
+    """Save all notes from one extraction run into FAISS with a single batched write."""
+    if not notes:
+        return
+    logger.debug("Storing %s note(s) to FAISS for user '%s' in one batch", len(notes), user_id)
+    increment("memory.notes_saved", len(notes))
+    store_note_embeddings(user_id, "Note", notes)
+
+def get_store_manager(function_name: str, model: str, memory_types: list[configuration.MemoryConfig]):
+    """Return the store manager for one memory type, creating it on first use.
+
+    Managers are cached by (function name, model, canonical-JSON hash of the memory
+    configs). Their namespace is templated on `user_id`, which langmem fills in from
+    the invocation config, so one manager serves every user.
+    """
+    key = (function_name, model, memory_config_fingerprint(memory_types))
+    return store_manager_cache.get_or_create(
+        key, functools.partial(_create_store_manager, function_name, model, memory_types)
+    )
+
+def _create_store_manager(function_name: str, model: str, memory_types: list[configuration.MemoryConfig]):
     memory_config = next(conf for conf in memory_types if conf.name == function_name)
 
     kwargs: dict[str, Any] = {
@@ -42,31 +65,85 @@ def get_store_manager(function_name: str, model: str, user_id: str, memory_types
     if memory_config.system_prompt:
         kwargs["instructions"] = memory_config.system_prompt
 
-    print(f"DEBUG: Creating store manager for {function_name} with kwargs: {kwargs}")
-    print(f"DEBUG: Memory config for {function_name}: update_mode={memory_config.update_mode}, parameters={memory_config.parameters}")
+    logger.debug("Creating store manager for %s with kwargs: %s", function_name, kwargs)
+    logger.debug("Memory config for %s: update_mode=%s, parameters=%s", function_name, memory_config.update_mode, memory_config.parameters)
+
+    # langmem is heavy to import; defer it until the first extraction
+    from langmem import create_memory_store_manager
 
     return create_memory_store_manager(
         model,
-        namespace=("memories", user_id, function_name),  # Use actual user_id instead of template
+        namespace=("memories", "{user_id}", function_name),
         **kwargs,
     )
 
-@task()
-async def process_memory_type(state: ProcessorState, config: RunnableConfig) -> None:
-    """Processes messages to extract and store memories."""
-    configurable = configuration.Configuration.from_context(config)
-    user_id = configurable.user_id
-    
-    if not user_id or user_id == "default":
-        print(f"DEBUG: Skipping memory processing for invalid user_id: {user_id}")
-        return
-    
-    if not state["messages"] or len(state["messages"]) < 2:
-        print(f"DEBUG: Not enough messages to extract memories for user {user_id}")
-        return
-    
+_JSON_SCHEMA_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool, "object": dict}
+
+def _json_schema_annotation(spec: dict) -> Any:
+    if spec.get("type") == "array":
+        return List[_json_schema_annotation(spec.get("items", {}))]
+    return _JSON_SCHEMA_TYPES.get(spec.get("type"), Any)
+
+def build_memory_schema(memory_config: configuration.MemoryConfig) -> type[BaseModel]:
+    """Build the extraction tool model for a memory type from its JSON Schema `parameters`."""
+    required = set(memory_config.parameters.get("required", []))
+    model_fields: dict[str, Any] = {}
+    for name, spec in memory_config.parameters.get("properties", {}).items():
+        annotation = _json_schema_annotation(spec)
+        if name in required:
+            model_fields[name] = (annotation, Field(description=spec.get("description")))
+        else:
+            model_fields[name] = (annotation | None, Field(None, description=spec.get("description")))
+    return create_model(memory_config.name, __doc__=memory_config.description, **model_fields)
+
+def get_combined_store_manager(model: str, memory_types: list[configuration.MemoryConfig]):
+    """Return one store manager that extracts every memory type in a single LLM run.
+
+    Each memory type is a separate tool schema. Existing memories are searched across
+    all of the user's memory namespaces; updates are written back in place, while new
+    memories land in ("memories", user_id) and are moved to their type's namespace by
+    the caller, replacing the existing memory of patch-mode types. Cached like
+    `get_store_manager`.
+    """
+    key = ("*", model, memory_config_fingerprint(memory_types))
+    return store_manager_cache.get_or_create(
+        key, functools.partial(_create_combined_store_manager, model, memory_types)
+    )
+
+def _create_combined_store_manager(model: str, memory_types: list[configuration.MemoryConfig]):
+    instructions = "\n\n".join(
+        f"## {conf.name} memories\n{conf.system_prompt}" for conf in memory_types if conf.system_prompt
+    )
+    kwargs: dict[str, Any] = {"query_limit": 5 * len(memory_types)}
+    if instructions:
+        kwargs["instructions"] = instructions
+
+    logger.debug("Creating combined store manager for %s", [conf.name for conf in memory_types])
+
+    from langmem import create_memory_store_manager
+
+    return create_memory_store_manager(
+        model,
+        schemas=[build_memory_schema(conf) for conf in memory_types],
+        namespace=("memories", "{user_id}"),
+        **kwargs,
+    )
+
+async def get_patch_memory_keys(store, user_id: str, memory_types: list[configuration.MemoryConfig]) -> dict[str, str | None]:
+    """Return the key of the existing memory for each patch-mode type, or None if it has none.
+
+    The combined manager can only insert into the shared staging namespace, so
+    patch-mode types (which hold one memory that is updated in place) need their
+    inserts redirected to this key.
+    """
+    kinds = [conf.name for conf in memory_types if conf.update_mode == "patch"]
+    results = await asyncio.gather(*(store.asearch(("memories", user_id, kind), limit=1) for kind in kinds))
+    return {kind: items[0].key if items else None for kind, items in zip(kinds, results)}
+
+def filter_meaningful_messages(messages: list) -> list:
+    """Drop empty messages and coerce bare values into human messages."""
     meaningful_messages = []
-    for msg in state["messages"]:
+    for msg in messages:
         if hasattr(msg, 'content') and str(msg.content).strip():
             meaningful_messages.append(msg)
         elif hasattr(msg, 'type') and hasattr(msg, 'content'):
@@ -81,30 +158,48 @@ async def process_memory_type(state: ProcessorState, config: RunnableConfig) ->
                 else:
                     meaningful_messages.append(HumanMessage(content=content_str))
     
-    print(f"DEBUG: Filtered messages - Original: {len(state['messages'])}, Meaningful: {len(meaningful_messages)}")
+    logger.debug("Filtered messages - Original: %s, Meaningful: %s", len(messages), len(meaningful_messages))
     
-    for i, msg in enumerate(state["messages"]):
-        msg_type = getattr(msg, 'type', type(msg).__name__)
-        msg_content = getattr(msg, 'content', str(msg))
-        print(f"DEBUG: Original Message {i}: Type={msg_type}, Content='{str(msg_content)[:100]}'")
+    # Per-message dumps are only built when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, msg in enumerate(messages):
+            msg_type = getattr(msg, 'type', type(msg).__name__)
+            msg_content = getattr(msg, 'content', str(msg))
+            logger.debug("Original Message %s: Type=%s, Content='%s'", i, msg_type, str(msg_content)[:100])
+        
+        for i, msg in enumerate(meaningful_messages):
+            msg_type = getattr(msg, 'type', type(msg).__name__)
+            msg_content = getattr(msg, 'content', str(msg))
+            logger.debug("Meaningful Message %s: Type=%s, Content='%s'", i, msg_type, str(msg_content)[:100])
+
+    return meaningful_messages
+
+@task()
+async def process_memory_type(state: ProcessorState, config: RunnableConfig) -> None:
+    """Processes messages to extract and store memories."""
+    configurable = configuration.Configuration.from_context(config)
+    user_id = configurable.user_id
     
-    for i, msg in enumerate(meaningful_messages):
-        msg_type = getattr(msg, 'type', type(msg).__name__)
-        msg_content = getattr(msg, 'content', str(msg))
-        print(f"DEBUG: Meaningful Message {i}: Type={msg_type}, Content='{str(msg_content)[:100]}'")
+    if not user_id or user_id == "default":
+        logger.debug("Skipping memory processing for invalid user_id: %s", user_id)
+        return
     
+    if not state["messages"] or len(state["messages"]) < 2:
+        logger.debug("Not enough messages to extract memories for user %s", user_id)
+        return
+    
+    meaningful_messages = filter_meaningful_messages(state["messages"])
     if len(meaningful_messages) < 1:
-        print(f"DEBUG: No meaningful messages for memory extraction for user {user_id}")
+        logger.debug("No meaningful messages for memory extraction for user %s", user_id)
         return
 
-    print(f"DEBUG: Processing memory type: {state['function_name']} for user: {user_id}")
-    print(f"DEBUG: Meaningful messages to process: {len(meaningful_messages)}")
+    logger.debug("Processing memory type: %s for user: %s", state['function_name'], user_id)
+    logger.debug("Meaningful messages to process: %s", len(meaningful_messages))
     
     try:
         store_manager = get_store_manager(
             state["function_name"], 
             configurable.model, 
-            user_id,
             configurable.memory_types
         )
         
@@ -120,26 +215,30 @@ async def process_memory_type(state: ProcessorState, config: RunnableConfig) ->
             }
         }
         
-        print(f"DEBUG: Invoking store manager with input keys: {list(manager_input.keys())}")
-        print(f"DEBUG: Internal LLM Config: {internal_llm_config}")
+        logger.debug("Invoking store manager with input keys: %s", list(manager_input.keys()))
+        logger.debug("Internal LLM Config: %s", internal_llm_config)
         
         try:
-            manager_output = await store_manager.ainvoke(manager_input, config=internal_llm_config)
+            # Bounded and fair across users; rate-limited calls back off and retry
+            with stage("extract"):
+                manager_output = await extraction_limiter.run(
+                    user_id, lambda: store_manager.ainvoke(manager_input, config=internal_llm_config)
+                )
         except StopIteration as e:
-            print(f"DEBUG: StopIteration caught for {state['function_name']} - likely no memories to extract")
+            logger.debug("StopIteration caught for %s - likely no memories to extract", state['function_name'])
             return
         except Exception as e:
-            print(f"ERROR: Store manager invocation failed for {state['function_name']}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Store manager invocation failed for %s: %s", state['function_name'], e)
             return
         
-        print(f"DEBUG: Manager output type: {type(manager_output)}")
-        print(f"DEBUG: Manager output content: {manager_output}")
+        logger.debug("Manager output type: %s", type(manager_output))
+        logger.debug("Manager output content: %s", manager_output)
         
         # --- NEW LOGIC ADDED HERE ---
+        notes_to_store: list[dict] = []
+
         if state["function_name"] == "Note" and isinstance(manager_output, list):
-            print(f"DEBUG: Processing direct list output for Note memory type.")
+            logger.debug("Processing direct list output for Note memory type.")
             for item in manager_output:
                 if isinstance(item, dict) and item.get('namespace') == ('memories', user_id, 'Note'):
                     extracted_content = item.get('value', {}).get('content', {})
@@ -147,28 +246,29 @@ async def process_memory_type(state: ProcessorState, config: RunnableConfig) ->
                         note_content = extracted_content.get('content', '')
                         note_context = extracted_content.get('context', '') # Assuming context might be here too
                         if note_content:
-                            print(f"DEBUG: Extracting direct note for FAISS: '{note_content[:100]}' with context '{note_context[:50]}'")
-                            manual_save_note_to_faiss(user_id, note_content, note_context)
+                            logger.debug("Extracting direct note for FAISS: '%s' with context '%s'", note_content[:100], note_context[:50])
+                            notes_to_store.append({"content": note_content, "context": note_context})
                         else:
-                            print(f"WARNING: Extracted Note content is empty for user {user_id}.")
+                            logger.warning("Extracted Note content is empty for user %s.", user_id)
                     elif isinstance(extracted_content, str): # Handle cases where content is just a string
                         note_content = extracted_content
-                        print(f"DEBUG: Extracting direct string note for FAISS: '{note_content[:100]}'")
-                        manual_save_note_to_faiss(user_id, note_content, "") # No context for simple string
+                        logger.debug("Extracting direct string note for FAISS: '%s'", note_content[:100])
+                        notes_to_store.append({"content": note_content, "context": ""}) # No context for simple string
                     else:
-                        print(f"WARNING: Unexpected content format for Note: {type(extracted_content)}")
+                        logger.warning("Unexpected content format for Note: %s", type(extracted_content))
+            manual_save_notes_to_faiss(user_id, notes_to_store)
             return # Processed list, no need to go to AIMessage section for Notes
 
         # --- EXISTING LOGIC FOR AIMessage (TOOL CALLS) ---
         if isinstance(manager_output, AIMessage):
-            print(f"DEBUG: Processing AIMessage output for user {user_id}")
-            print(f"DEBUG: Has tool_calls: {hasattr(manager_output, 'tool_calls') and bool(manager_output.tool_calls)}")
+            logger.debug("Processing AIMessage output for user %s", user_id)
+            logger.debug("Has tool_calls: %s", hasattr(manager_output, 'tool_calls') and bool(manager_output.tool_calls))
             
             if hasattr(manager_output, 'tool_calls') and manager_output.tool_calls:
-                print(f"DEBUG: Found {len(manager_output.tool_calls)} tool calls")
+                logger.debug("Found %s tool calls", len(manager_output.tool_calls))
                 
                 for i, tool_call in enumerate(manager_output.tool_calls):
-                    print(f"DEBUG: Tool call {i}: {tool_call}")
+                    logger.debug("Tool call %s: %s", i, tool_call)
                     
                     if state["function_name"] == "Note" and tool_call.get('name') in ['insert_document', 'update_document']:
                         args = tool_call.get('args', {})
@@ -186,69 +286,138 @@ async def process_memory_type(state: ProcessorState, config: RunnableConfig) ->
                                     note_context = content_data.get("context", "")
                                     
                                     if note_content:
-                                        print(f"DEBUG: Storing note to FAISS (from tool call) for user {user_id}: {note_content[:100]}...")
-                                        manual_save_note_to_faiss(user_id, note_content, note_context)
+                                        logger.debug("Storing note to FAISS (from tool call) for user %s: %s...", user_id, note_content[:100])
+                                        notes_to_store.append({"content": note_content, "context": note_context})
                                 elif isinstance(content_data, str):
-                                    print(f"DEBUG: Storing simple note to FAISS (from tool call) for user {user_id}: {content_data[:100]}...")
-                                    manual_save_note_to_faiss(user_id, content_data, "")
+                                    logger.debug("Storing simple note to FAISS (from tool call) for user %s: %s...", user_id, content_data[:100])
+                                    notes_to_store.append({"content": content_data, "context": ""})
                             else:
-                                print(f"WARNING: Namespace user_id mismatch. Expected: {user_id}, Got: {namespace_user_id}")
+                                logger.warning("Namespace user_id mismatch. Expected: %s, Got: %s", user_id, namespace_user_id)
+
+                manual_save_notes_to_faiss(user_id, notes_to_store)
             else:
-                print(f"DEBUG: AIMessage has no tool calls or empty tool calls")
-                print(f"DEBUG: AIMessage content: {getattr(manager_output, 'content', 'No content')}")
+                logger.debug("AIMessage has no tool calls or empty tool calls")
+                logger.debug("AIMessage content: %s", getattr(manager_output, 'content', 'No content'))
         else:
-            print(f"DEBUG: Unexpected manager output type: {type(manager_output)}")
+            logger.debug("Unexpected manager output type: %s", type(manager_output))
             
     except Exception as e:
-        print(f"ERROR: Failed to process memory type {state['function_name']} for user {user_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to process memory type %s for user %s: %s", state['function_name'], user_id, e)
+
+@task()
+async def process_all_memory_types(state: State, config: RunnableConfig) -> None:
+    """Extract and store every memory type with a single store manager run."""
+    configurable = configuration.Configuration.from_context(config)
+    user_id = configurable.user_id
+
+    if not user_id or user_id == "default":
+        logger.debug("Skipping memory processing for invalid user_id: %s", user_id)
+        return
+
+    if not state["messages"] or len(state["messages"]) < 2:
+        logger.debug("Not enough messages to extract memories for user %s", user_id)
+        return
+
+    meaningful_messages = filter_meaningful_messages(state["messages"])
+    if len(meaningful_messages) < 1:
+        logger.debug("No meaningful messages for memory extraction for user %s", user_id)
+        return
+
+    logger.debug("Processing all memory types in one pass for user: %s", user_id)
+
+    try:
+        store_manager = get_combined_store_manager(configurable.model, configurable.memory_types)
+        with stage("extract"):
+            manager_output = await extraction_limiter.run(
+                user_id,
+                lambda: store_manager.ainvoke(
+                    {"messages": meaningful_messages, "max_steps": configurable.max_extraction_steps},
+                    config={"configurable": {"model": configurable.model, "user_id": user_id}},
+                ),
+            )
+    except Exception as e:
+        logger.exception("Combined store manager invocation failed for user %s: %s", user_id, e)
+        return
+
+    logger.debug("Combined manager wrote %s memories for user %s", len(manager_output), user_id)
+
+    # New memories are written under the user's root namespace; move each one into
+    # its memory type's namespace, where the chatbot and per-type managers read it
+    store = get_store()
+    type_names = {conf.name for conf in configurable.memory_types}
+    staging_namespace = ("memories", user_id)
+    patch_keys = await get_patch_memory_keys(store, user_id, configurable.memory_types)
+    moves = []
+    notes_to_store: list[dict] = []
+    for put in manager_output:
+        kind = put["value"].get("kind")
+        if tuple(put["namespace"]) == staging_namespace and kind in type_names:
+            key = put["key"]
+            if kind in patch_keys:
+                # A patch-mode type keeps a single memory: fold the insert into it
+                key = patch_keys[kind] = patch_keys[kind] or key
+            moves.append(store.aput((*staging_namespace, kind), key, put["value"]))
+            moves.append(store.adelete(staging_namespace, put["key"]))
+        content = put["value"].get("content")
+        if kind == "Note" and isinstance(content, dict) and content.get("content"):
+            notes_to_store.append({"content": content["content"], "context": content.get("context") or ""})
+    await asyncio.gather(*moves)
+
+    manual_save_notes_to_faiss(user_id, notes_to_store)
 
 @entrypoint(config_schema=configuration.Configuration)
 async def graph(state: State, config: RunnableConfig) -> None:
+    configure_logging()
     if not state["messages"]:
-        print("DEBUG: No messages provided to memory graph")
+        logger.debug("No messages provided to memory graph")
         return
 
-    print(f"DEBUG: Memory graph received {len(state['messages'])} messages")
+    logger.debug("Memory graph received %s messages", len(state['messages']))
+    increment("memory.extraction_runs")
     
     configurable = configuration.Configuration.from_context(config)
-    print(f"DEBUG: Memory Configuration created for user_id: {configurable.user_id}")
-    print(f"DEBUG: Processing {len(configurable.memory_types)} memory types")
-    print(f"DEBUG: Model: {configurable.model}")
-    print(f"DEBUG: User ID: {configurable.user_id}")
+    logger.debug("Memory Configuration created for user_id: %s", configurable.user_id)
+    logger.debug("Processing %s memory types", len(configurable.memory_types))
+    logger.debug("Model: %s", configurable.model)
+    logger.debug("User ID: %s", configurable.user_id)
 
     if not configurable.user_id or configurable.user_id == "default":
-        print(f"WARNING: Invalid or default user_id detected: {configurable.user_id}")
+        logger.warning("Invalid or default user_id detected: %s", configurable.user_id)
         return
 
-    print(f"DEBUG: Processing {len(state['messages'])} total messages for memory extraction")
+    logger.debug("Processing %s total messages for memory extraction", len(state['messages']))
     
-    for i, msg in enumerate(state["messages"]):
-        msg_type = getattr(msg, 'type', type(msg).__name__)
-        msg_content = getattr(msg, 'content', str(msg))
-        print(f"DEBUG: Input Message {i}: Type={msg_type}, Content='{str(msg_content)[:100]}'")
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, msg in enumerate(state["messages"]):
+            msg_type = getattr(msg, 'type', type(msg).__name__)
+            msg_content = getattr(msg, 'content', str(msg))
+            logger.debug("Input Message %s: Type=%s, Content='%s'", i, msg_type, str(msg_content)[:100])
 
     tasks = []
-    for mem_type in configurable.memory_types:
-        print(f"DEBUG: Creating task for memory type: {mem_type.name} for user {configurable.user_id}")
-        task = process_memory_type(
-            ProcessorState(messages=state["messages"], function_name=mem_type.name),
-            config=config
-        )
-        tasks.append(task)
+    if configurable.extraction_mode == "combined":
+        logger.debug("Creating one combined task for all memory types for user %s", configurable.user_id)
+        tasks.append(process_all_memory_types(State(messages=state["messages"]), config=config))
+    else:
+        for mem_type in configurable.memory_types:
+            logger.debug("Creating task for memory type: %s for user %s", mem_type.name, configurable.user_id)
+            task = process_memory_type(
+                ProcessorState(messages=state["messages"], function_name=mem_type.name),
+                config=config
+            )
+            tasks.append(task)
     
     try:
         results = await asyncio.gather(*tasks, return_exceptions=True)
-        print(f"DEBUG: All memory processing tasks completed for user {configurable.user_id}")
+        logger.debug("All memory processing tasks completed for user %s", configurable.user_id)
         
         for i, result in enumerate(results):
             if isinstance(result, Exception):
-                print(f"ERROR: Task {i} failed for user {configurable.user_id} with: {result}")
+                logger.error("Task %s failed for user %s with: %s", i, configurable.user_id, result)
+
+        # Memories may have changed; invalidate cached memory context in every worker
+        await abump_memory_version(get_store(), configurable.user_id)
                 
     except Exception as e:
-        print(f"ERROR: Failed to process memories for user {configurable.user_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to process memories for user %s: %s", configurable.user_id, e)
 
 __all__ = ["graph"]
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Logging setup and sampled per-stage metrics for the chatbot and memory graphs.
+
+Debug tracing goes through the `memory` logger hierarchy with lazy %-style
+arguments, so a disabled level costs one level check. Stage timers and counters
+are sampled at `INSTRUMENTATION_SAMPLE_RATE` (0 disables them entirely) and
+aggregated in-process, with sampled counter updates scaled up by the inverse rate so
+counters estimate true totals; with `METRICS_SINK_PATH` set, each sampled event is also
+appended to a local JSON-lines file.
+
+    with stage("faiss_search"):
+        results = search(...)
+    increment("chatbot.turns")
+"""
+
+import atexit
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+MEMORY_LOG_LEVEL = os.environ.get("MEMORY_LOG_LEVEL", "WARNING").upper()
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get("INSTRUMENTATION_SAMPLE_RATE", "0"))
+METRICS_SINK_PATH = os.environ.get("METRICS_SINK_PATH")
+METRICS_RESERVOIR_SIZE = 1024
+
+
+def configure_logging(level: str = MEMORY_LOG_LEVEL) -> None:
+    """Show `memory.*` log records at `level` and above, as `LEVEL: message` on stdout.
+
+    Called when a graph runs, so importing these modules leaves logging untouched.
+    The level is only set if the `memory` logger has none, and the stdout handler is
+    only added if no handler is configured for it or any ancestor; otherwise records
+    propagate to the host application's handlers.
+    """
+    logger = logging.getLogger("memory")
+    if logger.level == logging.NOTSET:
+        logger.setLevel(level)
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+        logger.addHandler(handler)
+
+
+class Metrics:
+    """Thread-safe counters and stage latency aggregates, with an optional JSON-lines sink."""
+
+    def __init__(self, sink_path: str | None = None, reservoir_size: int = METRICS_RESERVOIR_SIZE):
+        """Aggregate in memory, also appending events to `sink_path` if given."""
+        self.sink_path = sink_path
+        self.reservoir_size = reservoir_size
+        self._counters: Dict[str, float] = {}
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._sink = None
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Add `value` to counter `name`."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            self._emit({"type": "counter", "name": name, "value": value})
+
+    def record(self, name: str, seconds: float, error: bool = False) -> None:
+        """Record one `seconds`-long run of stage `name`, and whether it raised."""
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                entry = self._stages[name] = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                                              "recent": deque(maxlen=self.reservoir_size)}
+            entry["count"] += 1
+            entry["errors"] += int(error)
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            recent: Deque[float] = entry["recent"]
+            recent.append(seconds)
+            self._emit({"type": "stage", "name": name, "ms": round(seconds * 1000, 3), "error": error})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return counters and per-stage count/mean/p50/p95/max latencies in milliseconds."""
+        with self._lock:
+            stages = {}
+            for name, entry in self._stages.items():
+                recent = sorted(entry["recent"])
+                stages[name] = {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "mean_ms": entry["total"] / entry["count"] * 1000,
+                    "p50_ms": recent[len(recent) // 2] * 1000,
+                    "p95_ms": recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000,
+                    "max_ms": entry["max"] * 1000,
+                }
+            return {"counters": dict(self._counters), "stages": stages}
+
+    def reset(self) -> None:
+        """Drop all counters and stage aggregates."""
+        with self._lock:
+            self._counters.clear()
+            self._stages.clear()
+
+    def flush(self) -> None:
+        """Flush buffered sink writes to disk."""
+        with self._lock:
+            if self._sink is not None:
+                self._sink.flush()
+
+    def _emit(self, event: Dict[str, Any]) -> None:
+        if self.sink_path is None:
+            return
+        if self._sink is None:
+            os.makedirs(os.path.dirname(self.sink_path) or ".", exist_ok=True)
+            self._sink = open(self.sink_path, "a", encoding="utf-8")
+        event["ts"] = time.time()
+        self._sink.write(json.dumps(event) + "\n")
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        metrics.record(self.name, time.perf_counter() - self.start, error=exc_type is not None)
+
+
+_NOOP_STAGE = contextlib.nullcontext()
+_sample_rate = INSTRUMENTATION_SAMPLE_RATE
+
+
+def set_sample_rate(rate: float) -> None:
+    """Change the fraction of stages and counter updates that are recorded (0 disables them)."""
+    global _sample_rate
+    _sample_rate = rate
+
+
+def _sampled() -> bool:
+    return _sample_rate >= 1 or (_sample_rate > 0 and random.random() < _sample_rate)
+
+
+def stage(name: str):
+    """Time the enclosed block as stage `name`, if this call is sampled."""
+    return _Stage(name) if _sampled() else _NOOP_STAGE
+
+
+def increment(name: str, value: float = 1) -> None:
+    """Add `value` to counter `name`, if this call is sampled, scaled by the inverse sample rate."""
+    if _sampled():
+        metrics.increment(name, value / min(_sample_rate, 1))
+
+
+metrics = Metrics(sink_path=METRICS_SINK_PATH)
+atexit.register(metrics.flush)
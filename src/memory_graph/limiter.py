@@ -0,0 +1,166 @@
+"""Process-wide limit on concurrent memory extraction LLM calls."""
+
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, TypeVar
+
+logger = logging.getLogger("memory.limiter")
+
+EXTRACTION_MAX_CONCURRENCY = int(os.environ.get("EXTRACTION_MAX_CONCURRENCY", "8"))
+EXTRACTION_RATE_LIMIT_RETRIES = int(os.environ.get("EXTRACTION_RATE_LIMIT_RETRIES", "2"))
+EXTRACTION_RATE_LIMIT_BACKOFF_SECONDS = float(os.environ.get("EXTRACTION_RATE_LIMIT_BACKOFF_SECONDS", "1.0"))
+
+T = TypeVar("T")
+
+_RATE_LIMIT_MARKERS = ("429", "rate limit", "resource exhausted", "resource has been exhausted", "quota exceeded")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Return whether `error` looks like a provider rate limit (HTTP 429 / quota exhausted)."""
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(error, "code", None), getattr(response, "status_code", None)):
+        if status == 429 or str(status) == "429":
+            return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RATE_LIMIT_MARKERS)
+
+
+class ExtractionLimiter:
+    """Async limiter that hands out extraction slots fairly across users.
+
+    Waiters are queued per user and slots are granted round-robin between users, so
+    one user's burst cannot starve everyone else. The limit adapts AIMD-style: it is
+    halved whenever the provider rate limits a call and grows back by one slot after
+    `increase_after` consecutive successes.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = EXTRACTION_MAX_CONCURRENCY,
+        min_concurrency: int = 1,
+        increase_after: int = 20,
+        retries: int = EXTRACTION_RATE_LIMIT_RETRIES,
+        backoff_seconds: float = EXTRACTION_RATE_LIMIT_BACKOFF_SECONDS,
+    ):
+        """Allow between `min_concurrency` and `max_concurrency` calls at once, retrying rate limited ones."""
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = max(min(min_concurrency, self.max_concurrency), 1)
+        self.increase_after = increase_after
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._turns: Deque[str] = deque()
+        self._successes = 0
+        self.granted = 0
+        self.rate_limited = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a slot."""
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, user_id: str) -> None:
+        """Wait for an extraction slot on behalf of `user_id`."""
+        if self.in_flight < self.limit and not self._turns:
+            self.in_flight += 1
+            self.granted += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiters.get(user_id)
+        if queue is None:
+            queue = self._waiters[user_id] = deque()
+            self._turns.append(user_id)
+        queue.append(future)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        logger.debug("Extraction for user %s queued (depth=%s, in_flight=%s, limit=%s)", user_id, self.queue_depth, self.in_flight, self.limit)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we were cancelled; hand it on
+                self.release()
+            elif future in queue:
+                queue.remove(future)
+                if not queue and self._waiters.get(user_id) is queue:
+                    del self._waiters[user_id]
+                    self._turns.remove(user_id)
+            raise
+
+    def release(self) -> None:
+        """Return a slot and grant it to the next waiting user."""
+        self.in_flight -= 1
+        self._grant()
+
+    def _grant(self) -> None:
+        while self._turns and self.in_flight < self.limit:
+            user_id = self._turns.popleft()
+            queue = self._waiters[user_id]
+            future = queue.popleft()
+            if queue:
+                self._turns.append(user_id)
+            else:
+                del self._waiters[user_id]
+            if future.cancelled():
+                continue
+            future.set_result(None)
+            self.in_flight += 1
+            self.granted += 1
+
+    def record_success(self) -> None:
+        """Count a successful call, growing the limit back after a run of successes."""
+        self._successes += 1
+        if self.limit < self.max_concurrency and self._successes >= self.increase_after:
+            self.limit += 1
+            self._successes = 0
+            self._grant()
+
+    def record_rate_limit(self) -> None:
+        """Halve the limit after the provider rejected a call for exceeding its rate limit."""
+        self.rate_limited += 1
+        self._successes = 0
+        self.limit = max(self.min_concurrency, self.limit // 2)
+
+    async def run(self, user_id: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Run `call()` in a slot, backing off and retrying when it is rate limited."""
+        attempt = 0
+        while True:
+            await self.acquire(user_id)
+            try:
+                result = await call()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self.record_rate_limit()
+                logger.warning("Extraction for user %s was rate limited; limit lowered to %s: %s", user_id, self.limit, e)
+                if attempt >= self.retries:
+                    raise
+            else:
+                self.record_success()
+                return result
+            finally:
+                self.release()
+            await asyncio.sleep(self.backoff_seconds * (2 ** attempt) * (1 + random.random()))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the limiter's queue and throttling counters."""
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queued_users": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "granted": self.granted,
+            "rate_limited": self.rate_limited,
+        }
+
+
+extraction_limiter = ExtractionLimiter()
@@ -0,0 +1,68 @@
+"""Bounded cache of langmem store managers shared across extraction runs."""
+
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+from memory_graph.configuration import MemoryConfig
+
+STORE_MANAGER_CACHE_SIZE = int(os.environ.get("STORE_MANAGER_CACHE_SIZE", "128"))
+
+
+def memory_config_fingerprint(memory_configs: Iterable[MemoryConfig]) -> str:
+    """Hash memory configs by their canonical JSON, so equal configs share a key."""
+    canonical = json.dumps(
+        [dataclasses.asdict(conf) for conf in memory_configs], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class StoreManagerCache:
+    """LRU cache of store managers keyed by (function name, model, config fingerprint).
+
+    Managers use user-templated namespaces, so one instance serves every user.
+    """
+
+    def __init__(self, max_entries: int = STORE_MANAGER_CACHE_SIZE):
+        """Keep at most `max_entries` managers."""
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the manager cached under `key`, building it with `factory` on a miss."""
+        with self._lock:
+            manager = self._entries.get(key)
+            if manager is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return manager
+            self.misses += 1
+
+        # Build outside the lock; a concurrent builder for the same key simply loses the race
+        manager = factory()
+        with self._lock:
+            manager = self._entries.setdefault(key, manager)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return manager
+
+    def clear(self) -> None:
+        """Drop every cached manager."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+store_manager_cache = StoreManagerCache()
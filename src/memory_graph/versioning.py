@@ -0,0 +1,31 @@
+"""Version stamps that tell readers when a user's memories have changed."""
+
+import threading
+import uuid
+from typing import Any, Dict, Tuple
+
+VERSION_NAMESPACE = ("memory_versions",)
+"""Store namespace holding one version stamp per user, shared by every worker."""
+
+_local_versions: Dict[str, int] = {}
+_local_versions_lock = threading.Lock()
+
+
+def bump_local_memory_version(user_id: str) -> None:
+    """Record an in-process memory write (e.g. a FAISS note) for `user_id`."""
+    with _local_versions_lock:
+        _local_versions[user_id] = _local_versions.get(user_id, 0) + 1
+
+
+async def abump_memory_version(store: Any, user_id: str) -> None:
+    """Publish a new version stamp for `user_id` so every worker drops cached context."""
+    bump_local_memory_version(user_id)
+    await store.aput(VERSION_NAMESPACE, user_id, {"version": uuid.uuid4().hex}, index=False)
+
+
+async def aget_memory_version(store: Any, user_id: str) -> Tuple[str | None, int]:
+    """Return the current (shared stamp, in-process counter) version for `user_id`."""
+    item = await store.aget(VERSION_NAMESPACE, user_id)
+    with _local_versions_lock:
+        local_version = _local_versions.get(user_id, 0)
+    return (item.value.get("version") if item else None, local_version)
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+from langgraph.store.memory import InMemoryStore
+
+from chatbot import graph as chatbot_graph
+from chatbot.context_cache import MemoryContextCache
+from memory_graph.embeddings import HashingEmbeddings
+from memory_graph.versioning import abump_memory_version
+
+
+class SlowNamespaceStore(InMemoryStore):
+    async def asearch(self, namespace_prefix, /, **kwargs):
+        if namespace_prefix[-1] == "Action":
+            await asyncio.sleep(10)
+        await asyncio.sleep(0.05)
+        return await super().asearch(namespace_prefix, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_memory_namespaces_are_fetched_concurrently_with_partial_results(monkeypatch) -> None:
+    store = SlowNamespaceStore()
+    store.put(("memories", "mona", "User"), "profile", {"content": {"user_name": "Mona"}})
+    store.put(("memories", "mona", "Note"), "n1", {"content": {"content": "Has a cat named Lila"}})
+    store.put(("memories", "mona", "Action"), "a1", {"content": {"description": "Buy cat food"}})
+    monkeypatch.setattr(chatbot_graph, "get_store", lambda: store)
+
+    start = time.perf_counter()
+    memories = await chatbot_graph.get_all_user_memories("mona", timeout=0.5)
+    elapsed = time.perf_counter() - start
+
+    assert memories["Note"] == ["Has a cat named Lila"]
+    assert "User" in memories
+    assert "Action" not in memories
+    # Bounded by the timeout, not by the sum of the per-namespace latencies
+    assert elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_bot_overlaps_faiss_search_with_store_retrieval(monkeypatch) -> None:
+    store = SlowNamespaceStore()
+    monkeypatch.setattr(chatbot_graph, "get_store", lambda: store)
+    monkeypatch.setattr(chatbot_graph, "_llm", FakeListChatModel(responses=["Hi Mona"]))
+    monkeypatch.setattr(chatbot_graph, "get_embeddings_model", lambda: HashingEmbeddings(dimensions=256))
+    loop_thread = threading.get_ident()
+    search_threads = []
+
+    def blocking_search(user_id, function_name, query, k):
+        search_threads.append(threading.get_ident())
+        time.sleep(0.3)
+        return [(Document(page_content="Has a cat named Lila"), 0.2)]
+
+    monkeypatch.setattr(chatbot_graph, "search_faiss_with_scores", blocking_search)
+    state = chatbot_graph.ChatState(messages=[HumanMessage(content="what is my cat's name?")], user_id="mona")
+
+    start = time.perf_counter()
+    result = await chatbot_graph.bot(state, {"configurable": {"memory_retrieval_timeout_seconds": 0.5}})
+    elapsed = time.perf_counter() - start
+
+    assert result["messages"][0].content == "Hi Mona"
+    assert search_threads and search_threads[0] != loop_thread
+    # The 0.3s blocking search overlaps the 0.5s store timeout instead of adding to it
+    assert elapsed < 0.75
+
+
+class CountingStore(InMemoryStore):
+    searches = 0
+
+    async def asearch(self, namespace_prefix, /, **kwargs):
+        self.searches += 1
+        return await super().asearch(namespace_prefix, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_memory_context_is_reused_until_memories_change(monkeypatch) -> None:
+    store = CountingStore()
+    store.put(("memories", "lena", "Note"), "n1", {"content": {"content": "Has a dog named Rex"}})
+    monkeypatch.setattr(chatbot_graph, "get_store", lambda: store)
+    monkeypatch.setattr(chatbot_graph, "_llm", FakeListChatModel(responses=["ok"]))
+    monkeypatch.setattr(chatbot_graph, "search_faiss_with_scores", lambda *args: [])
+    monkeypatch.setattr(chatbot_graph, "get_embeddings_model", lambda: HashingEmbeddings(dimensions=256))
+    monkeypatch.setattr(chatbot_graph, "memory_context_cache", MemoryContextCache())
+    state = chatbot_graph.ChatState(messages=[HumanMessage(content="hi")], user_id="lena")
+
+    await chatbot_graph.bot(state, {})
+    searches_after_first_turn = store.searches
+    await chatbot_graph.bot(state, {})
+    assert store.searches == searches_after_first_turn
+
+    await abump_memory_version(store, "lena")
+    await chatbot_graph.bot(state, {})
+    assert store.searches > searches_after_first_turn
+
+
+class RecordingChatModel(FakeListChatModel):
+    prompts: list = []
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        self.prompts.append(messages[0]["content"])
+        return await super().ainvoke(messages, config, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_cached_memories_are_ranked_and_packed_per_turn(monkeypatch) -> None:
+    store = CountingStore()
+    store.put(("memories", "lena", "Note"), "n1", {"content": {"content": "Has a dog named Rex"}})
+    store.put(("memories", "lena", "Note"), "n2", {"content": {"content": "Plays the cello"}})
+    llm = RecordingChatModel(responses=["ok"] * 4, prompts=[])
+    faiss_queries = []
+    monkeypatch.setattr(chatbot_graph, "get_store", lambda: store)
+    monkeypatch.setattr(chatbot_graph, "_llm", llm)
+    monkeypatch.setattr(chatbot_graph, "get_embeddings_model", lambda: HashingEmbeddings(dimensions=256))
+    monkeypatch.setattr(chatbot_graph, "search_faiss_with_scores", lambda user_id, fn, query, k: faiss_queries.append(query) or [])
+    monkeypatch.setattr(chatbot_graph, "memory_context_cache", MemoryContextCache())
+
+    async def turn(query: str, budget: int) -> str:
+        state = chatbot_graph.ChatState(messages=[HumanMessage(content=query)], user_id="lena")
+        await chatbot_graph.bot(state, {"configurable": {"memory_token_budget": budget}})
+        return llm.prompts[-1]
+
+    await turn("hello", 7)
+    searches_after_first_turn = store.searches
+    dog_prompt = await turn("what is my dog called?", 7)
+    cello_prompt = await turn("which instrument, the cello?", 7)
+    unlimited_prompt = await turn("which instrument, the cello?", 0)
+
+    assert store.searches == searches_after_first_turn
+    assert faiss_queries == ["hello", "what is my dog called?", "which instrument, the cello?", "which instrument, the cello?"]
+    assert "Rex" in dog_prompt and "cello" not in dog_prompt
+    assert "cello" in cello_prompt and "Rex" not in cello_prompt
+    assert "Rex" in unlimited_prompt and "cello" in unlimited_prompt
+
+
+@pytest.mark.asyncio
+async def test_cached_memories_do_not_depend_on_the_first_turns_query(monkeypatch) -> None:
+    store = CountingStore()
+    for i in range(30):
+        store.put(("memories", "lena", "Note"), f"n{i}", {"content": {"content": f"Likes cat breed number {i}"}})
+    store.put(("memories", "lena", "Note"), "n30", {"content": {"content": "Plays the cello"}})
+    llm = RecordingChatModel(responses=["ok"] * 2, prompts=[])
+    monkeypatch.setattr(chatbot_graph, "get_store", lambda: store)
+    monkeypatch.setattr(chatbot_graph, "_llm", llm)
+    monkeypatch.setattr(chatbot_graph, "get_embeddings_model", lambda: HashingEmbeddings(dimensions=256))
+    monkeypatch.setattr(chatbot_graph, "search_faiss_with_scores", lambda *args: [])
+    monkeypatch.setattr(chatbot_graph, "memory_context_cache", MemoryContextCache())
+    config = {"configurable": {"memory_token_budget": 0}}
+
+    await chatbot_graph.bot(chatbot_graph.ChatState(messages=[HumanMessage(content="cats")], user_id="lena"), config)
+    searches_after_first_turn = store.searches
+    await chatbot_graph.bot(chatbot_graph.ChatState(messages=[HumanMessage(content="cello?")], user_id="lena"), config)
+
+    assert store.searches == searches_after_first_turn
+    assert "Plays the cello" in llm.prompts[-1]
@@ -0,0 +1,83 @@
+import importlib
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.store.memory import InMemoryStore
+
+from memory_graph.configuration import DEFAULT_MEMORY_CONFIGS
+
+# The package re-exports the compiled `graph`, which shadows the module attribute
+memory_graph = importlib.import_module("memory_graph.graph")
+
+
+def test_memory_schema_follows_the_json_schema() -> None:
+    action = next(conf for conf in DEFAULT_MEMORY_CONFIGS if conf.name == "Action")
+
+    schema = memory_graph.build_memory_schema(action)
+
+    assert schema.__name__ == "Action"
+    assert schema(description="Buy cat food").priority is None
+    assert schema.model_json_schema()["required"] == ["description"]
+
+
+class StagingStoreManager:
+    """Writes new memories under the user's root namespace, like a combined langmem manager."""
+
+    def __init__(self, user_id):
+        self.namespace = ("memories", user_id)
+        self.calls = 0
+
+    async def ainvoke(self, input, config=None):
+        self.calls += 1
+        store = memory_graph.get_store()
+        puts = [
+            {"namespace": self.namespace, "key": "k1", "value": {"kind": "User", "content": {"user_name": "Mona"}}},
+            {"namespace": self.namespace, "key": "k2", "value": {"kind": "Note", "content": {"content": "Has a cat"}}},
+        ]
+        for put in puts:
+            await store.aput(put["namespace"], put["key"], put["value"])
+        return puts
+
+
+@pytest.mark.asyncio
+async def test_combined_mode_extracts_all_types_in_one_run(monkeypatch) -> None:
+    manager = StagingStoreManager("mona")
+    saved_notes = []
+    monkeypatch.setattr(memory_graph, "get_combined_store_manager", lambda *args: manager)
+    monkeypatch.setattr(memory_graph, "manual_save_notes_to_faiss", lambda user_id, notes: saved_notes.extend(notes))
+    store = InMemoryStore()
+    app = memory_graph.graph.copy(update={"store": store})
+
+    await app.ainvoke(
+        {"messages": [HumanMessage(content="I'm Mona, I have a cat"), AIMessage(content="Nice!")]},
+        {"configurable": {"user_id": "mona", "extraction_mode": "combined"}},
+    )
+
+    assert manager.calls == 1
+    assert store.get(("memories", "mona", "User"), "k1").value["content"] == {"user_name": "Mona"}
+    assert store.get(("memories", "mona", "Note"), "k2") is not None
+    assert store.get(("memories", "mona"), "k1") is None
+    assert saved_notes == [{"content": "Has a cat", "context": ""}]
+
+
+@pytest.mark.asyncio
+async def test_combined_mode_updates_the_single_memory_of_patch_mode_types(monkeypatch) -> None:
+    manager = StagingStoreManager("mona")
+    monkeypatch.setattr(memory_graph, "get_combined_store_manager", lambda *args: manager)
+    monkeypatch.setattr(memory_graph, "manual_save_notes_to_faiss", lambda user_id, notes: None)
+    store = InMemoryStore()
+    store.put(("memories", "mona", "User"), "profile", {"kind": "User", "content": {"user_name": "M."}})
+    store.put(("memories", "mona", "Note"), "n0", {"kind": "Note", "content": {"content": "Likes tea"}})
+    app = memory_graph.graph.copy(update={"store": store})
+
+    await app.ainvoke(
+        {"messages": [HumanMessage(content="I'm Mona, I have a cat"), AIMessage(content="Nice!")]},
+        {"configurable": {"user_id": "mona", "extraction_mode": "combined"}},
+    )
+
+    # User is patch-mode: the insert replaces its existing memory instead of adding one
+    users = store.search(("memories", "mona", "User"))
+    assert [(item.key, item.value["content"]) for item in users] == [("profile", {"user_name": "Mona"})]
+    # Note is append-mode: the insert is a new memory
+    assert {item.key for item in store.search(("memories", "mona", "Note"))} == {"n0", "k2"}
+    assert store.get(("memories", "mona"), "k1") is None
@@ -0,0 +1,32 @@
+from chatbot.context_packing import (
+    FAISS_NOTES,
+    MemoryCandidate,
+    estimate_tokens,
+    pack_memories,
+    render_memories,
+)
+
+
+def test_pack_memories_respects_budget_and_prefers_relevant_memories() -> None:
+    candidates = [
+        MemoryCandidate("User", "Name is Mona, lives in Lisbon", similarity=0.9),
+        MemoryCandidate("Episode", "Talked about the weather at length " * 5, similarity=0.1),
+        MemoryCandidate(FAISS_NOTES, "Has a cat named Lila", similarity=0.8),
+        MemoryCandidate("Note", "Has a cat named Lila", similarity=0.8),
+    ]
+
+    selected, stats = pack_memories(candidates, token_budget=20)
+
+    assert [c.content for c in selected] == ["Name is Mona, lives in Lisbon", "Has a cat named Lila"]
+    assert stats.selected_tokens <= 20
+    assert stats.tokens_saved > 0
+    assert render_memories(selected, ["User", "Note", FAISS_NOTES])[0] == "**User Information:**"
+
+
+def test_pack_memories_without_budget_keeps_everything() -> None:
+    candidates = [MemoryCandidate("Note", f"note {i}") for i in range(10)]
+
+    selected, stats = pack_memories(candidates, token_budget=0)
+
+    assert len(selected) == 10
+    assert stats.selected_tokens == sum(estimate_tokens(c.line()) for c in candidates)
@@ -0,0 +1,58 @@
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from memory_graph.embedding_cache import CachedEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return super().embed_query(text)
+
+
+def test_repeated_text_is_embedded_once(tmp_path) -> None:
+    inner = CountingEmbedding(size=8, calls=[])
+    cached = CachedEmbeddings(inner, "fake", path=str(tmp_path / "cache.sqlite"))
+
+    first = cached.embed_documents(["a", "b", "a"])
+    second = cached.embed_documents(["b", "c"])
+
+    assert inner.calls == [["a", "b"], ["c"]]
+    assert first[0] == first[2]
+    assert second[0] == first[1]
+    assert cached.stats()["misses"] == 3
+
+
+def test_cache_persists_across_instances_and_separates_queries(tmp_path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    inner = CountingEmbedding(size=8, calls=[])
+    CachedEmbeddings(inner, "fake", path=path).embed_documents(["remember me"])
+
+    reopened = CachedEmbeddings(inner, "fake", path=path)
+    reopened.embed_documents(["remember me"])
+    reopened.embed_query("remember me")
+
+    # Query embeddings are keyed separately from document embeddings
+    assert inner.calls == [["remember me"], "remember me"]
+    assert reopened.stats()["disk_hits"] == 1
+
+    other_model = CachedEmbeddings(inner, "other", path=path)
+    other_model.embed_documents(["remember me"])
+    assert len(inner.calls) == 3
+
+
+def test_cached_vectors_are_compact_and_not_shared_with_callers() -> None:
+    cached = CachedEmbeddings(CountingEmbedding(size=8, calls=[]), "fake")
+
+    first = cached.embed_query("tea")
+    first[0] = 123.0
+
+    assert cached.embed_query("tea")[0] != 123.0
+    [vector] = cached._memory.values()
+    assert vector.dtype == np.float32
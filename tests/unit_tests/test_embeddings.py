@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from memory_graph.embeddings import HashingEmbeddings, create_embeddings
+
+
+def test_hashing_embeddings_are_deterministic_and_normalized() -> None:
+    embeddings = create_embeddings("hashing", "", 64)
+    vectors = np.array(embeddings.embed_documents(["I have a cat named Lila", "", "cats"]))
+
+    assert vectors.shape == (3, 64)
+    assert np.allclose(np.linalg.norm(vectors[[0, 2]], axis=1), 1.0)
+    assert not vectors[1].any()
+    assert embeddings.embed_query("I have a cat named Lila") == vectors[0].tolist()
+
+
+def test_hashing_embeddings_rank_related_text_higher() -> None:
+    embeddings = HashingEmbeddings(dimensions=256)
+    query = np.array(embeddings.embed_query("what is my cat's name"))
+    related, unrelated = np.array(
+        embeddings.embed_documents(["The user's cat is named Lila", "Quarterly tax filing deadline"])
+    )
+
+    assert query @ related > query @ unrelated
+
+
+def test_unknown_provider_raises() -> None:
+    with pytest.raises(ValueError, match="Unknown embedding provider"):
+        create_embeddings("nope", "model", 8)
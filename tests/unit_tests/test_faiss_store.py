@@ -0,0 +1,313 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from memory_graph import faiss_store
+
+
+@pytest.fixture
+def note_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_store, "FAISS_DIR", str(tmp_path))
+    monkeypatch.setattr(faiss_store, "_embeddings_model", DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(faiss_store, "index_cache", faiss_store.FAISSIndexCache())
+    return faiss_store
+
+
+def test_search_is_served_from_cache(note_store) -> None:
+    note_store.store_note_embedding("alice", "Note", {"content": "Has a cat named Lila"})
+    note_store.index_cache.clear()
+
+    first = note_store.search_faiss("alice", "Note", "cat", k=1)
+    second = note_store.search_faiss("alice", "Note", "cat", k=1)
+
+    assert [d.page_content for d in first] == ["Has a cat named Lila"]
+    assert second == first
+    stats = note_store.index_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+def test_cache_evicts_least_recently_used(note_store) -> None:
+    note_store.index_cache.max_indexes = 2
+    for user in ["a", "b", "c"]:
+        note_store.store_note_embedding(user, "Note", {"content": f"note for {user}"})
+
+    assert ("a", "Note") not in note_store.index_cache
+    assert ("c", "Note") in note_store.index_cache
+    assert note_store.index_cache.stats()["evictions"] == 1
+    # Evicted indexes are transparently reloaded from disk
+    assert note_store.search_faiss("a", "Note", "note", k=1)[0].page_content == "note for a"
+
+
+def test_append_only_log_loads_on_top_of_legacy_index(note_store) -> None:
+    path = note_store.get_faiss_path("bob", "Note")
+    legacy = FAISS.from_texts(["Lives in Lisbon"], note_store.get_embeddings_model())
+    legacy.save_local(path)
+    base_snapshot = open(os.path.join(path, "index.faiss"), "rb").read()
+
+    note_store.store_note_embedding("bob", "Note", {"content": "Plays the cello"})
+    note_store.index_cache.clear()
+
+    reloaded = note_store._load_faiss_store("bob", "Note")
+    assert reloaded.index.ntotal == 2
+    # Appending must not rewrite the base snapshot
+    assert open(os.path.join(path, "index.faiss"), "rb").read() == base_snapshot
+
+
+def in_other_process(target, *args) -> None:
+    # A forked worker starts from this process's cache, then diverges from it
+    process = multiprocessing.get_context("fork").Process(target=target, args=args)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def _search_finds(note_store, user_id: str, content: str) -> None:
+    assert [d.page_content for d in note_store.search_faiss(user_id, "Note", content, k=1)] == [content]
+
+
+@pytest.mark.parametrize("mmap_search", [False, True])
+def test_concurrent_readers_migrate_a_legacy_index_once(note_store, monkeypatch, mmap_search) -> None:
+    path = note_store.get_faiss_path("dan", "Note")
+    FAISS.from_texts(["Lives in Lisbon"], note_store.get_embeddings_model()).save_local(path)
+    monkeypatch.setattr(note_store, "FAISS_MMAP_SEARCH", mmap_search)
+    monkeypatch.setattr(note_store, "mmap_reader_cache", note_store.FAISSIndexCache())
+    migrate = note_store._migrate_pickled_docstore
+
+    def slow_migrate(path):
+        time.sleep(0.2)
+        migrate(path)
+
+    monkeypatch.setattr(note_store, "_migrate_pickled_docstore", slow_migrate)
+    context = multiprocessing.get_context("fork")
+    readers = [context.Process(target=_search_finds, args=(note_store, "dan", "Lives in Lisbon")) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+
+    assert [reader.exitcode for reader in readers] == [0, 0]
+    assert not os.path.exists(os.path.join(path, "index.pkl"))
+
+
+def test_cached_index_sees_notes_written_by_other_processes(note_store) -> None:
+    note_store.store_note_embedding("ann", "Note", {"content": "Likes tea"})
+    assert len(note_store.search_faiss("ann", "Note", "tea", k=5)) == 1
+
+    in_other_process(note_store.store_note_embedding, "ann", "Note", {"content": "Owns a red bicycle"})
+    assert note_store.search_faiss("ann", "Note", "Owns a red bicycle", k=1)[0].page_content == "Owns a red bicycle"
+
+    in_other_process(note_store.compact_faiss_index, "ann", "Note")
+    assert sorted(d.page_content for d in note_store.search_faiss("ann", "Note", "tea", k=5)) == [
+        "Likes tea", "Owns a red bicycle"
+    ]
+    assert note_store._load_faiss_store("ann", "Note").index.ntotal == 2
+
+
+def test_appends_from_other_processes_are_never_overwritten(note_store) -> None:
+    note_store.store_note_embedding("ben", "Note", {"content": "Likes tea"})
+    path = note_store.get_faiss_path("ben", "Note")
+
+    in_other_process(note_store.store_note_embedding, "ben", "Note", {"content": "Owns a red bicycle"})
+    # Appending at this process's stale offsets would clobber the other worker's note
+    with pytest.raises(RuntimeError):
+        note_store._append_to_log(path, [("Plays chess", {})], [[0.0] * 16], ["stale"])
+    note_store.store_note_embedding("ben", "Note", {"content": "Plays chess"})
+    note_store.index_cache.clear()
+
+    assert sorted(d.page_content for d in note_store.search_faiss("ben", "Note", "tea", k=5)) == [
+        "Likes tea", "Owns a red bicycle", "Plays chess"
+    ]
+
+
+def test_compaction_folds_log_into_base(note_store) -> None:
+    for i in range(3):
+        note_store.store_note_embedding("carol", "Note", {"content": f"fact {i}"})
+    note_store.compact_faiss_index("carol", "Note")
+    path = note_store.get_faiss_path("carol", "Note")
+    note_store.index_cache.clear()
+
+    assert os.path.getsize(os.path.join(path, note_store.DOCSTORE_LOG_FILE)) == 0
+    assert note_store._load_faiss_store("carol", "Note").index.ntotal == 3
+
+
+def test_mmap_search_matches_in_memory_search(note_store, monkeypatch) -> None:
+    for i in range(4):
+        note_store.store_note_embedding("dave", "Note", {"content": f"sealed {i}"})
+    note_store.compact_faiss_index("dave", "Note")
+    note_store.store_note_embedding("dave", "Note", {"content": "fresh note"})
+    expected = note_store.search_faiss("dave", "Note", "sealed 2", k=3)
+
+    monkeypatch.setattr(note_store, "FAISS_MMAP_SEARCH", True)
+    monkeypatch.setattr(note_store, "mmap_reader_cache", note_store.FAISSIndexCache())
+    results = note_store.search_faiss("dave", "Note", "sealed 2", k=3)
+
+    assert [d.page_content for d in results] == [d.page_content for d in expected]
+    reader = note_store.mmap_reader_cache.get(("dave", "Note"))
+    assert isinstance(reader.log.vectors, np.memmap)
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(texts)
+        return super().embed_documents(texts)
+
+
+def test_bulk_insert_embeds_once(note_store, monkeypatch) -> None:
+    embeddings = CountingEmbedding(size=16, calls=[])
+    monkeypatch.setattr(note_store, "_embeddings_model", embeddings)
+
+    note_store.store_note_embeddings(
+        "erin",
+        "Note",
+        [{"content": "Likes tea"}, {"content": ""}, {"content": "Runs marathons", "context": "sports"}],
+    )
+
+    assert embeddings.calls == [["Likes tea", "Runs marathons"]]
+    assert note_store._log_states[note_store.get_faiss_path("erin", "Note")].records == 2
+
+
+def test_near_duplicates_match_existing_and_earlier_batch_vectors() -> None:
+    existing = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+    new = np.array([[2.0, 0.1], [1.0, 1.0], [1.1, 1.0], [-1.0, 0.0]], dtype=np.float32)
+
+    matches = faiss_store.find_near_duplicates(existing, new, threshold=0.95)
+
+    # Row 2 repeats row 1 of the batch, which sits after the two existing vectors
+    assert matches.tolist() == [0, -1, 3, -1]
+
+
+def test_duplicate_notes_are_skipped_at_insert(note_store, monkeypatch) -> None:
+    monkeypatch.setattr(note_store, "dedup_stats", note_store.DedupStats())
+    note_store.store_note_embedding("fay", "Note", {"content": "Has a cat named Lila"})
+    note_store.store_note_embeddings(
+        "fay", "Note", [{"content": "Has a cat named Lila"}, {"content": "Plays chess"}, {"content": "Plays chess"}]
+    )
+
+    assert note_store._load_faiss_store("fay", "Note").index.ntotal == 2
+    assert note_store.dedup_stats.stats() == {"checked": 4, "skipped": 2, "merged": 0, "dedup_rate": 0.5}
+
+
+def test_duplicate_notes_are_merged_and_survive_reload(note_store, monkeypatch) -> None:
+    monkeypatch.setattr(note_store, "FAISS_DEDUP_MODE", "merge")
+    monkeypatch.setattr(note_store, "dedup_stats", note_store.DedupStats())
+    for context in ["first chat", "second chat", "third chat"]:
+        note_store.store_note_embedding("gus", "Note", {"content": "Runs marathons", "context": context})
+    note_store.index_cache.clear()
+
+    store = note_store._load_faiss_store("gus", "Note")
+    assert store.index.ntotal == 1
+    [doc] = note_store.search_faiss("gus", "Note", "Runs marathons", k=5)
+    assert doc.metadata == {"context": "third chat", "mentions": 3}
+
+    monkeypatch.setattr(note_store, "FAISS_MMAP_SEARCH", True)
+    monkeypatch.setattr(note_store, "mmap_reader_cache", note_store.FAISSIndexCache())
+    assert [d.metadata for d in note_store.search_faiss("gus", "Note", "Runs marathons", k=5)] == [doc.metadata]
+
+
+def test_large_flat_index_is_promoted_in_the_background(note_store, monkeypatch) -> None:
+    import faiss
+
+    monkeypatch.setattr(note_store, "FAISS_PROMOTE_THRESHOLD", 40)
+    note_store.store_note_embeddings("hal", "Note", [{"content": f"fact {i}"} for i in range(30)])
+    note_store.store_note_embeddings("hal", "Note", [{"content": f"fact {i}"} for i in range(30, 50)])
+    for thread in threading.enumerate():
+        if thread.name.startswith("faiss-maintain-"):
+            thread.join()
+    note_store.index_cache.clear()
+
+    store = note_store._load_faiss_store("hal", "Note")
+    assert isinstance(store.index, faiss.IndexHNSWFlat)
+    assert store.index.ntotal == 50
+    assert note_store.search_faiss("hal", "Note", "fact 7", k=1)[0].page_content == "fact 7"
+    # Deduplication keeps working against the promoted index
+    note_store.store_note_embedding("hal", "Note", {"content": "fact 7"})
+    assert note_store._load_faiss_store("hal", "Note").index.ntotal == 50
+
+
+def test_ivfpq_index_finds_exact_neighbours() -> None:
+    vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype(np.float32)
+
+    index = faiss_store.build_index("ivfpq", vectors)
+    _, neighbours = index.search(vectors[:50], 10)
+
+    assert index.ntotal == 2000
+    assert np.mean(neighbours[:, 0] == np.arange(50)) >= 0.9
+
+
+def test_sharded_index_filters_notes_by_user(note_store, monkeypatch) -> None:
+    monkeypatch.setattr(note_store, "FAISS_SHARDS", 1)
+    note_store.store_note_embeddings("ivy", "Note", [{"content": "Has a cat named Lila"}, {"content": "Plays chess"}])
+    note_store.store_note_embedding("jon", "Note", {"content": "Has a cat named Lila"})
+    note_store.store_note_embedding("ivy", "Note", {"content": "Plays chess"})
+
+    assert os.listdir(note_store.FAISS_DIR) == [os.path.basename(note_store.get_faiss_path("ivy", "Note"))]
+    assert note_store._load_faiss_store("jon", "Note").index.ntotal == 3
+    for reload in (False, True):
+        if reload:
+            note_store.index_cache.clear()
+        assert [d.page_content for d in note_store.search_faiss("jon", "Note", "chess", k=5)] == ["Has a cat named Lila"]
+        assert sorted(d.page_content for d in note_store.search_faiss("ivy", "Note", "cat", k=5)) == [
+            "Has a cat named Lila", "Plays chess"
+        ]
+
+    monkeypatch.setattr(note_store, "FAISS_MMAP_SEARCH", True)
+    monkeypatch.setattr(note_store, "mmap_reader_cache", note_store.FAISSIndexCache())
+    assert [d.metadata["user_id"] for d in note_store.search_faiss("jon", "Note", "cat", k=5)] == ["jon"]
+
+
+def test_notes_live_in_sqlite_and_survive_interrupted_compaction(note_store) -> None:
+    note_store.store_note_embeddings("kim", "Note", [{"content": f"fact {i}"} for i in range(3)])
+    note_store.compact_faiss_index("kim", "Note")
+    path = note_store.get_faiss_path("kim", "Note")
+    assert not os.path.exists(os.path.join(path, "index.pkl"))
+
+    # A compaction that wrote the notes but died before replacing index.faiss
+    note_store.store_note_embeddings("kim", "Note", [{"content": "fact 3"}, {"content": "fact 4"}])
+    note_store._load_faiss_store("kim", "Note").docstore.table.flush()
+    note_store.index_cache.clear()
+
+    store = note_store._load_faiss_store("kim", "Note")
+    assert store.index.ntotal == len(store.index_to_docstore_id) == 5
+    assert store.docstore.table.documents_at([4])[0].page_content == "fact 4"
+    assert note_store.search_faiss("kim", "Note", "fact 3", k=1)[0].page_content == "fact 3"
+
+
+def test_compressed_layouts_shrink_vectors() -> None:
+    vectors = np.random.default_rng(0).standard_normal((300, 16)).astype(np.float32)
+
+    for compression, code_size in [("none", 64), ("fp16", 32), ("sq8", 16), ("pq", 2)]:
+        for kind in ("flat", "hnsw"):
+            index = faiss_store.build_index(kind, vectors, compression)
+            assert faiss_store.index_layout(index) == (kind, compression)
+        assert index.storage.sa_code_size() == code_size
+
+
+def test_compressed_index_reranks_with_exact_vectors(note_store, monkeypatch) -> None:
+    monkeypatch.setattr(note_store, "FAISS_COMPRESSION", "fp16")
+    note_store.store_note_embeddings("lee", "Note", [{"content": f"fact {i}"} for i in range(5)])
+    assert note_store.rebuild_faiss_index("lee", "Note")
+    note_store.store_note_embedding("lee", "Note", {"content": "fact 5"})
+    note_store.index_cache.clear()
+
+    store = note_store._load_faiss_store("lee", "Note")
+    assert note_store.index_layout(store.index) == ("flat", "fp16")
+    exact = note_store.get_embeddings_model().embed_query("fact 5")
+    np.testing.assert_array_equal(store.docstore.table.embeddings_at([5])[0], np.float32(exact))
+    # Re-ranked distances are exact, not fp16 approximations
+    [(doc, distance)] = note_store.search_faiss_with_scores("lee", "Note", "fact 2", k=1)
+    assert (doc.page_content, distance) == ("fact 2", 0.0)
+
+    monkeypatch.setattr(note_store, "FAISS_MMAP_SEARCH", True)
+    monkeypatch.setattr(note_store, "mmap_reader_cache", note_store.FAISSIndexCache())
+    note_store.compact_faiss_index("lee", "Note")
+    [(doc, distance)] = note_store.search_faiss_with_scores("lee", "Note", "fact 5", k=1)
+    assert (doc.page_content, distance) == ("fact 5", 0.0)
@@ -0,0 +1,23 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot.identity import UserIdResolver, extract_user_id
+
+
+def test_extract_user_id_prefers_explicit_ids_over_names() -> None:
+    assert extract_user_id("My name is Mona, user_id: M42") == "M42"
+    assert extract_user_id("Hi, my name is Mona") == "mona"
+    assert extract_user_id("What's the weather like?") is None
+
+
+def test_resolver_memoizes_per_thread_and_scans_only_new_messages() -> None:
+    resolver = UserIdResolver()
+    messages = [HumanMessage("hello there"), AIMessage("How can I help?")]
+
+    assert resolver.resolve("t1", messages) == "there"
+    assert resolver.resolve("t1", messages + [HumanMessage("call me Bob")]) == "there"
+    assert resolver.stats() == {"threads": 1, "hits": 1, "scanned_messages": 1}
+
+    anonymous = [AIMessage("How can I help?")]
+    assert resolver.resolve("t2", anonymous) is None
+    assert resolver.resolve("t2", anonymous + [HumanMessage("call me Bob")]) == "bob"
+    assert resolver.stats()["scanned_messages"] == 3
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot import graph as chatbot_graph
+from chatbot.scheduler import DebouncedScheduler, InMemorySchedulerBackend
+
+
+def test_extraction_windows_batch_new_messages_with_overlap() -> None:
+    messages = list(range(10))
+
+    assert chatbot_graph.extraction_windows(messages, 2, 3, 2) == [[0, 1, 2, 3, 4], [3, 4, 5, 6, 7], [6, 7, 8, 9]]
+    assert chatbot_graph.extraction_windows(messages, 2, 0, 2) == [messages]
+    assert chatbot_graph.extraction_windows(messages, 10, 3, 2) == []
+
+
+class RecordingRuns:
+    def __init__(self):
+        self.inputs = []
+
+    async def create(self, **kwargs):
+        self.inputs.append([m.content for m in kwargs["input"]["messages"]])
+
+
+class RecordingClient:
+    def __init__(self):
+        self.runs = RecordingRuns()
+
+
+@pytest.mark.asyncio
+async def test_each_run_only_sends_messages_after_the_watermark(monkeypatch) -> None:
+    client = RecordingClient()
+    monkeypatch.setattr(chatbot_graph, "get_client", lambda: client)
+    scheduler = DebouncedScheduler(
+        InMemorySchedulerBackend(), handler=chatbot_graph.run_memory_extraction, poll_seconds=0.01
+    )
+    monkeypatch.setattr(chatbot_graph, "memory_scheduler", scheduler)
+    config = {"configurable": {"thread_id": "t1", "enable_memory_debouncing": False}}
+    transcript = [HumanMessage(content=f"m{i}") if i % 2 == 0 else AIMessage(content=f"m{i}") for i in range(8)]
+
+    for turn_end in (4, 8):
+        state = chatbot_graph.ChatState(
+            messages=transcript[:turn_end], user_id="mona", pending_memory_extraction=True
+        )
+        await chatbot_graph.schedule_memories_with_debouncing(state, config)
+        await asyncio.sleep(0.1)
+    await scheduler.stop()
+
+    assert client.runs.inputs == [["m0", "m1", "m2", "m3"], ["m2", "m3", "m4", "m5", "m6", "m7"]]
+
+
+@pytest.mark.asyncio
+async def test_runs_without_a_thread_id_skip_scheduling(monkeypatch) -> None:
+    backend = InMemorySchedulerBackend()
+    monkeypatch.setattr(chatbot_graph, "memory_scheduler", DebouncedScheduler(backend))
+    state = chatbot_graph.ChatState(
+        messages=[HumanMessage(content="hi"), AIMessage(content="hello")], user_id="mona", pending_memory_extraction=True
+    )
+
+    assert await chatbot_graph.schedule_memories_with_debouncing(state, {"configurable": {"user_id": "mona"}}) == {}
+    assert backend.next_due() is None
+
+
+@pytest.mark.asyncio
+async def test_batches_of_a_new_thread_overlap_by_the_configured_count(monkeypatch) -> None:
+    client = RecordingClient()
+    monkeypatch.setattr(chatbot_graph, "get_client", lambda: client)
+    scheduler = DebouncedScheduler(
+        InMemorySchedulerBackend(), handler=chatbot_graph.run_memory_extraction, poll_seconds=0.01
+    )
+    monkeypatch.setattr(chatbot_graph, "memory_scheduler", scheduler)
+    config = {
+        "configurable": {
+            "thread_id": "t1",
+            "enable_memory_debouncing": False,
+            "memory_batch_size": 2,
+            "memory_overlap_messages": 1,
+        }
+    }
+    transcript = [HumanMessage(content=f"m{i}") if i % 2 == 0 else AIMessage(content=f"m{i}") for i in range(6)]
+    state = chatbot_graph.ChatState(messages=transcript, user_id="mona", pending_memory_extraction=True)
+
+    await chatbot_graph.schedule_memories_with_debouncing(state, config)
+    await asyncio.sleep(0.1)
+    await scheduler.stop()
+
+    assert client.runs.inputs == [["m0", "m1"], ["m1", "m2", "m3"], ["m3", "m4", "m5"]]
@@ -0,0 +1,71 @@
+import json
+import logging
+
+from memory_graph import instrumentation
+from memory_graph.instrumentation import Metrics
+
+
+def test_stages_cost_nothing_when_sampling_is_disabled(monkeypatch) -> None:
+    monkeypatch.setattr(instrumentation, "metrics", Metrics())
+    monkeypatch.setattr(instrumentation, "_sample_rate", 0)
+
+    with instrumentation.stage("retrieve"):
+        pass
+    instrumentation.increment("chatbot.turns")
+
+    assert instrumentation.stage("retrieve") is instrumentation._NOOP_STAGE
+    assert instrumentation.metrics.snapshot() == {"counters": {}, "stages": {}}
+
+
+def test_sampled_stages_are_aggregated_and_written_to_the_sink(monkeypatch, tmp_path) -> None:
+    sink = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(instrumentation, "metrics", Metrics(sink_path=str(sink)))
+    monkeypatch.setattr(instrumentation, "_sample_rate", 1)
+
+    for _ in range(3):
+        with instrumentation.stage("faiss_search"):
+            pass
+    instrumentation.increment("chatbot.turns")
+    instrumentation.metrics.flush()
+
+    snapshot = instrumentation.metrics.snapshot()
+    assert snapshot["counters"] == {"chatbot.turns": 1}
+    assert snapshot["stages"]["faiss_search"]["count"] == 3
+    events = [json.loads(line) for line in sink.read_text().splitlines()]
+    assert [event["name"] for event in events] == ["faiss_search"] * 3 + ["chatbot.turns"]
+
+
+def test_sampled_counters_estimate_the_true_total(monkeypatch) -> None:
+    monkeypatch.setattr(instrumentation, "metrics", Metrics())
+    monkeypatch.setattr(instrumentation, "_sample_rate", 0.25)
+    monkeypatch.setattr(instrumentation.random, "random", iter([0.1, 0.9, 0.9, 0.9] * 2).__next__)
+
+    for _ in range(8):
+        instrumentation.increment("memory.notes_saved", 2)
+
+    assert instrumentation.metrics.snapshot()["counters"] == {"memory.notes_saved": 16}
+
+
+def test_configure_logging_leaves_records_to_the_host_handlers(monkeypatch) -> None:
+    logger = logging.getLogger("memory")
+    monkeypatch.setattr(logging.getLogger(), "handlers", [logging.NullHandler()])
+    monkeypatch.setattr(logger, "handlers", [])
+    monkeypatch.setattr(logger, "level", logging.NOTSET)
+
+    instrumentation.configure_logging("WARNING")
+
+    assert logger.handlers == []
+    assert logger.propagate
+    assert logger.level == logging.WARNING
+
+
+def test_configure_logging_adds_a_stdout_handler_when_none_is_configured(monkeypatch) -> None:
+    logger = logging.getLogger("memory")
+    monkeypatch.setattr(logging.getLogger(), "handlers", [])
+    monkeypatch.setattr(logger, "handlers", [])
+
+    instrumentation.configure_logging()
+    instrumentation.configure_logging()
+
+    assert [type(handler) for handler in logger.handlers] == [logging.StreamHandler]
+    assert logger.propagate
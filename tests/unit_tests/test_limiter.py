@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from memory_graph.limiter import ExtractionLimiter
+
+
+@pytest.mark.asyncio
+async def test_slots_are_granted_round_robin_across_users() -> None:
+    limiter = ExtractionLimiter(max_concurrency=1)
+    order = []
+    release_first = asyncio.Event()
+
+    async def call(label):
+        order.append(label)
+        if label == "first":
+            await release_first.wait()
+
+    first = asyncio.create_task(limiter.run("busy", lambda: call("first")))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.create_task(limiter.run(user, lambda label=label: call(label)))
+        for user, label in [("mona", "mona-1"), ("mona", "mona-2"), ("mona", "mona-3"), ("lena", "lena-1")]
+    ]
+    await asyncio.sleep(0)
+    assert limiter.stats()["queue_depth"] == 4
+    assert limiter.stats()["queued_users"] == 2
+
+    release_first.set()
+    await asyncio.gather(first, *queued)
+
+    # Lena's single call is not stuck behind Mona's burst
+    assert order == ["first", "mona-1", "lena-1", "mona-2", "mona-3"]
+    assert limiter.stats()["in_flight"] == 0
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_calls_lower_the_limit_and_retry() -> None:
+    limiter = ExtractionLimiter(max_concurrency=4, retries=2, backoff_seconds=0)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("Too Many Requests")
+        return "ok"
+
+    assert await limiter.run("mona", flaky) == "ok"
+    assert limiter.stats()["rate_limited"] == 2
+    assert limiter.limit == 1
+
+    async def broken():
+        raise ValueError("bad schema")
+
+    # Other errors are not retried and leave the limit alone
+    with pytest.raises(ValueError):
+        await limiter.run("mona", broken)
+    assert limiter.stats()["rate_limited"] == 2
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,29 @@
+import copy
+import importlib
+
+from memory_graph.configuration import DEFAULT_MEMORY_CONFIGS
+from memory_graph.manager_cache import StoreManagerCache
+
+# The package re-exports the compiled `graph`, which shadows the module attribute
+memory_graph = importlib.import_module("memory_graph.graph")
+
+
+def test_store_managers_are_reused_for_equal_configs(monkeypatch) -> None:
+    builds = []
+    monkeypatch.setattr(memory_graph, "store_manager_cache", StoreManagerCache(max_entries=2))
+    monkeypatch.setattr(memory_graph, "_create_store_manager", lambda *args: builds.append(args) or object())
+
+    first = memory_graph.get_store_manager("Note", "model-a", DEFAULT_MEMORY_CONFIGS)
+    # An equal config built separately (e.g. parsed from another request) hits the cache
+    assert memory_graph.get_store_manager("Note", "model-a", copy.deepcopy(DEFAULT_MEMORY_CONFIGS)) is first
+    assert len(builds) == 1
+
+    changed = copy.deepcopy(DEFAULT_MEMORY_CONFIGS)
+    changed[1].system_prompt = "Only record facts about pets."
+    assert memory_graph.get_store_manager("Note", "model-a", changed) is not first
+    memory_graph.get_store_manager("Note", "model-b", DEFAULT_MEMORY_CONFIGS)
+
+    # Bounded: the least recently used manager was evicted
+    assert memory_graph.store_manager_cache.stats() == {"entries": 2, "hits": 1, "misses": 3}
+    memory_graph.get_store_manager("Note", "model-a", DEFAULT_MEMORY_CONFIGS)
+    assert len(builds) == 4
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from chatbot.scheduler import (
+    DebouncedScheduler,
+    InMemorySchedulerBackend,
+    SQLiteSchedulerBackend,
+)
+
+
+def test_sqlite_jobs_are_shared_and_claimed_once_across_workers(tmp_path) -> None:
+    path = str(tmp_path / "scheduler.sqlite")
+    worker_a, worker_b = SQLiteSchedulerBackend(path), SQLiteSchedulerBackend(path)
+
+    worker_a.schedule("mona", due_at=100.0, payload={"turn": 1}, now=90.0)
+    # Rescheduling from another worker debounces the same job
+    worker_b.schedule("mona", due_at=130.0, payload={"turn": 2}, now=120.0)
+    assert worker_a.claim_due(now=110.0, worker_id="a", lease_seconds=60) == []
+
+    claimed = worker_a.claim_due(now=135.0, worker_id="a", lease_seconds=60)
+    assert [(job.user_id, job.payload, job.created_at) for job in claimed] == [("mona", {"turn": 2}, 90.0)]
+    assert worker_b.claim_due(now=135.0, worker_id="b", lease_seconds=60) == []
+
+    worker_a.complete(claimed[0])
+    assert worker_b.next_due() is None
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_each_user_once_after_activity_stops() -> None:
+    runs = []
+
+    async def handler(job):
+        runs.append((job.user_id, job.payload["turn"]))
+
+    scheduler = DebouncedScheduler(InMemorySchedulerBackend(), handler=handler, poll_seconds=0.05)
+    for turn in range(3):
+        await scheduler.schedule("mona", 0.1, {"turn": turn})
+        await scheduler.schedule("lena", 0.1, {"turn": turn})
+        await asyncio.sleep(0.05)
+
+    await asyncio.sleep(0.3)
+    await scheduler.stop()
+
+    assert sorted(runs) == [("lena", 2), ("mona", 2)]
+
+
+@pytest.mark.parametrize("backend_name", ["memory", "sqlite"])
+def test_continuous_activity_cannot_push_a_job_past_max_delay(backend_name, tmp_path) -> None:
+    if backend_name == "sqlite":
+        backend = SQLiteSchedulerBackend(str(tmp_path / "scheduler.sqlite"))
+    else:
+        backend = InMemorySchedulerBackend()
+
+    for now in range(0, 100, 10):
+        job = backend.schedule("mona", due_at=now + 30.0, payload={}, now=float(now), max_delay=60)
+    assert job.due_at == 60.0
+
+    # Turns arriving while the job runs open a new window with a fresh deadline
+    [claimed] = backend.claim_due(now=60.0, worker_id="a", lease_seconds=30)
+    job = backend.schedule("mona", due_at=100.0, payload={}, now=70.0, max_delay=60)
+    assert (job.created_at, job.due_at) == (70.0, 100.0)
+    backend.complete(claimed)
+    assert backend.next_due() == 100.0
+
+
+@pytest.mark.asyncio
+async def test_started_dispatcher_runs_persisted_jobs_without_waiting_on_slow_ones() -> None:
+    backend = InMemorySchedulerBackend()
+    backend.schedule("mona", due_at=0.0, payload={}, now=0.0)
+    finished = []
+    release = asyncio.Event()
+
+    async def handler(job):
+        if job.user_id == "mona":
+            await release.wait()
+        finished.append(job.user_id)
+
+    # Jobs persisted before a restart run without any new schedule call
+    scheduler = DebouncedScheduler(backend, handler=handler, poll_seconds=0.05)
+    scheduler.start()
+    await asyncio.sleep(0.1)
+    await scheduler.schedule("lena", 0.0, {})
+    await asyncio.sleep(0.1)
+    assert finished == ["lena"]
+
+    release.set()
+    await asyncio.sleep(0.05)
+    await scheduler.stop()
+    assert finished == ["lena", "mona"]
+
+
+def test_dispatcher_started_outside_an_event_loop_runs_on_its_own_thread() -> None:
+    backend = InMemorySchedulerBackend()
+    backend.schedule("mona", due_at=0.0, payload={}, now=0.0)
+    ran = asyncio.run(_collect_runs(backend))
+    assert ran == ["mona"]
+
+
+async def _collect_runs(backend) -> list:
+    ran = []
+
+    async def handler(job):
+        ran.append(job.user_id)
+
+    scheduler = DebouncedScheduler(backend, handler=handler, poll_seconds=0.05)
+    await asyncio.to_thread(scheduler.start)
+    await asyncio.sleep(0.2)
+    await scheduler.stop()
+    return ran